@@ -0,0 +1,217 @@
+import json
+import shutil
+import time
+import uuid
+from pathlib import Path
+
+from django.conf import settings
+
+from .openai_utils import build_request_body, get_openai_client
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+
+# Statuses of the OpenAI Batch API, after which a batch does not change anymore
+FINAL_STATUSES = {'completed', 'failed', 'expired', 'cancelled'}
+
+# Error code of the requests of an expired batch that were not run within the completion window
+EXPIRED_ERROR_CODE = 'batch_expired'
+
+
+# A batch that did not finish, because it ended with a status other than completed or expired, or because it took
+# longer than the timeout, in which case it is cancelled. None of its requests have results.
+class BatchError(Exception):
+    def __init__(self, message, batch_id, request_count):
+        super().__init__(message)
+        self.batch_id = batch_id
+        self.request_count = request_count
+
+
+def build_batch_request(custom_id, setup_prompt, content, answer_format, schema):
+    return {
+        "custom_id": custom_id,
+        "method": "POST",
+        "url": BATCH_ENDPOINT,
+        "body": build_request_body(setup_prompt, content, answer_format, schema),
+    }
+
+
+def write_batch_requests(requests, path):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    count = 0
+    with path.open('w', encoding='utf-8') as file:
+        for request in requests:
+            file.write(json.dumps(request, ensure_ascii=False) + '\n')
+            count += 1
+    return count
+
+
+# Read the results of a batch one line at a time, as (custom_id, content, error) tuples, so large batches are never
+# loaded into memory at once
+def read_batch_results(path):
+    with Path(path).open(encoding='utf-8') as file:
+        for line in file:
+            if not line.strip():
+                continue
+            try:
+                result = json.loads(line)
+            except json.JSONDecodeError:
+                print(f"An error occurred while reading a batch result: {line[:100]}")
+                continue
+
+            response = result.get('response') or {}
+            if result.get('error') or response.get('status_code') != 200:
+                yield result.get('custom_id'), None, result.get('error') or response.get('body')
+                continue
+
+            try:
+                content = response['body']['choices'][0]['message']['content']
+            except (KeyError, IndexError, TypeError):
+                yield result.get('custom_id'), None, 'The response holds no message'
+                continue
+            yield result.get('custom_id'), content, None
+
+
+def is_expired_error(error):
+    return isinstance(error, dict) and error.get('code') == EXPIRED_ERROR_CODE
+
+
+# Submits batches to the OpenAI Batch API
+class OpenAIBatchBackend:
+    def __init__(self, client=None):
+        self.client = client
+
+    def get_client(self):
+        return self.client or get_openai_client()
+
+    def submit(self, requests_path):
+        client = self.get_client()
+        with Path(requests_path).open('rb') as file:
+            input_file = client.files.create(file=file, purpose='batch')
+        batch = client.batches.create(input_file_id=input_file.id, endpoint=BATCH_ENDPOINT, completion_window='24h')
+        return batch.id
+
+    def status(self, batch_id):
+        return self.get_client().batches.retrieve(batch_id).status
+
+    def cancel(self, batch_id):
+        self.get_client().batches.cancel(batch_id)
+
+    def download_results(self, batch_id, results_path):
+        client = self.get_client()
+        batch = client.batches.retrieve(batch_id)
+        Path(results_path).parent.mkdir(parents=True, exist_ok=True)
+        with Path(results_path).open('w', encoding='utf-8') as file:
+            # Failed requests are written to a separate error file, which is read the same way
+            for file_id in (batch.output_file_id, batch.error_file_id):
+                if file_id:
+                    file.write(client.files.content(file_id).text)
+
+
+# File-based stand-in for the Batch API. A batch is a directory holding the requests, which are answered when the
+# status is first polled, by sending each request to the shared OpenAI client (or a stub set in its place), or by
+# a responder computing the content of the response from the request body.
+class LocalBatchBackend:
+    def __init__(self, directory=None, responder=None):
+        self.directory = Path(directory or Path(settings.BATCH_WORK_DIR) / 'local')
+        self.responder = responder
+
+    def submit(self, requests_path):
+        batch_id = f'batch_local_{uuid.uuid4().hex}'
+        batch_directory = self.directory / batch_id
+        batch_directory.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(requests_path, batch_directory / 'input.jsonl')
+        return batch_id
+
+    def status(self, batch_id):
+        batch_directory = self.directory / batch_id
+        if not (batch_directory / 'input.jsonl').exists():
+            return 'failed'
+        if (batch_directory / 'cancelled').exists():
+            return 'cancelled'
+        if not (batch_directory / 'output.jsonl').exists():
+            self._process(batch_directory)
+        return 'completed'
+
+    def cancel(self, batch_id):
+        (self.directory / batch_id / 'cancelled').touch()
+
+    def download_results(self, batch_id, results_path):
+        Path(results_path).parent.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(self.directory / batch_id / 'output.jsonl', results_path)
+
+    def _process(self, batch_directory):
+        output_path = batch_directory / 'output.jsonl'
+        with (batch_directory / 'input.jsonl').open(encoding='utf-8') as input_file, \
+                output_path.with_suffix('.tmp').open('w', encoding='utf-8') as output_file:
+            for line in input_file:
+                if line.strip():
+                    output_file.write(json.dumps(self._answer(json.loads(line)), ensure_ascii=False) + '\n')
+        output_path.with_suffix('.tmp').replace(output_path)
+
+    def _answer(self, request):
+        result = {'id': f'batch_req_{uuid.uuid4().hex}', 'custom_id': request['custom_id'], 'error': None}
+        try:
+            if self.responder is not None:
+                content = self.responder(request['body'])
+            else:
+                response = get_openai_client().chat.completions.create(**request['body'])
+                content = response.choices[0].message.content
+        except Exception as e:
+            result['response'] = None
+            result['error'] = {'code': 'local_error', 'message': str(e)}
+            return result
+
+        result['response'] = {
+            'status_code': 200,
+            'body': {'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': content}}]},
+        }
+        return result
+
+
+BATCH_BACKENDS = {
+    'openai': OpenAIBatchBackend,
+    'local': LocalBatchBackend,
+}
+
+
+def get_batch_backend(name=None):
+    return BATCH_BACKENDS[name or settings.BATCH_BACKEND]()
+
+
+# Write the requests to a JSONL file, submit them to the backend, wait for the batch to finish, and stream the results.
+# Raises a BatchError when the batch fails, or when it does not finish within the timeout, so it is not left running.
+def run_batch(requests, backend=None, name='batch', poll_interval=None, timeout=None, sleep=time.sleep):
+    backend = backend or get_batch_backend()
+    poll_interval = poll_interval if poll_interval is not None else settings.BATCH_POLL_INTERVAL
+    timeout = timeout if timeout is not None else settings.BATCH_TIMEOUT
+    work_directory = Path(settings.BATCH_WORK_DIR) / f'{name}_{int(time.time())}'
+
+    requests_path = work_directory / 'requests.jsonl'
+    request_count = write_batch_requests(requests, requests_path)
+    if not request_count:
+        return
+
+    batch_id = backend.submit(requests_path)
+    print(f"Submitted batch {batch_id} with {request_count} requests")
+
+    waited = 0
+    status = backend.status(batch_id)
+    while status not in FINAL_STATUSES:
+        if waited >= timeout:
+            backend.cancel(batch_id)
+            raise BatchError(f"Batch {batch_id} did not finish within {timeout} seconds (status '{status}'), "
+                             f"it was cancelled", batch_id, request_count)
+        sleep(poll_interval)
+        waited += poll_interval
+        status = backend.status(batch_id)
+
+    if status not in ('completed', 'expired'):
+        raise BatchError(f"Batch {batch_id} ended with status '{status}'", batch_id, request_count)
+    if status == 'expired':
+        # The requests that finished in time have results, the others are reported with the batch_expired error
+        print(f"Batch {batch_id} expired before all its requests were run")
+
+    results_path = work_directory / 'results.jsonl'
+    backend.download_results(batch_id, results_path)
+    yield from read_batch_results(results_path)
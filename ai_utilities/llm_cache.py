@@ -0,0 +1,112 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+
+
+# Persistent cache of LLM responses, keyed by a hash of everything that determines the response.
+# Entries are stored in a SQLite database, expire after ttl seconds, and the least recently used entries are evicted
+# once the cache holds more than max_entries responses.
+class LLMResponseCache:
+    def __init__(self, path, max_entries=50000, ttl=None):
+        self.path = Path(path)
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._connection = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(model, messages, schema, temperature):
+        key_data = json.dumps({
+            'model': model,
+            'messages': messages,
+            'schema': schema,
+            'temperature': temperature,
+        }, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(key_data.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            connection = self._connect()
+            row = connection.execute('SELECT response, created FROM responses WHERE key = ?', (key,)).fetchone()
+
+            if row is not None and self.ttl is not None and now - row[1] > self.ttl:
+                connection.execute('DELETE FROM responses WHERE key = ?', (key,))
+                connection.commit()
+                row = None
+
+            if row is None:
+                self.misses += 1
+                return None
+
+            connection.execute('UPDATE responses SET accessed = ? WHERE key = ?', (now, key))
+            connection.commit()
+            self.hits += 1
+            return row[0]
+
+    def set(self, key, response):
+        now = time.time()
+        with self._lock:
+            connection = self._connect()
+            connection.execute(
+                'INSERT OR REPLACE INTO responses (key, response, created, accessed) VALUES (?, ?, ?, ?)',
+                (key, response, now, now)
+            )
+            self._evict(connection)
+            connection.commit()
+
+    def clear(self):
+        with self._lock:
+            connection = self._connect()
+            connection.execute('DELETE FROM responses')
+            connection.commit()
+
+    def stats(self):
+        with self._lock:
+            entries = self._connect().execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+        return {'hits': self.hits, 'misses': self.misses, 'entries': entries}
+
+    def _connect(self):
+        if self._connection is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            connection = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False)
+            connection.execute('CREATE TABLE IF NOT EXISTS responses ('
+                               'key TEXT PRIMARY KEY, response TEXT NOT NULL, created REAL NOT NULL, '
+                               'accessed REAL NOT NULL)')
+            connection.execute('CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)')
+            connection.commit()
+            self._connection = connection
+        return self._connection
+
+    def _evict(self, connection):
+        if self.max_entries is None:
+            return
+        entries = connection.execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+        if entries > self.max_entries:
+            connection.execute(
+                'DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY accessed LIMIT ?)',
+                (entries - self.max_entries,)
+            )
+
+
+_llm_cache = None
+_llm_cache_lock = threading.Lock()
+
+
+def get_llm_cache():
+    global _llm_cache
+    with _llm_cache_lock:
+        if _llm_cache is None:
+            _llm_cache = LLMResponseCache(
+                settings.LLM_CACHE_PATH,
+                max_entries=settings.LLM_CACHE_MAX_ENTRIES,
+                ttl=settings.LLM_CACHE_TTL,
+            )
+        return _llm_cache
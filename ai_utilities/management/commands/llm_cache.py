@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from ai_utilities.llm_cache import get_llm_cache
+
+
+class Command(BaseCommand):
+    help = "Show the size of the LLM response cache, or clear it"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clear', action='store_true', help="Remove all cached responses")
+
+    def handle(self, *args, **options):
+        cache = get_llm_cache()
+        if options['clear']:
+            cache.clear()
+            self.stdout.write("Cleared the LLM response cache")
+        self.stdout.write(f"The LLM response cache holds {cache.stats()['entries']} responses")
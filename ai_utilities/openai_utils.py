@@ -1,12 +1,55 @@
 from openai import OpenAI
 from dotenv import load_dotenv
+from django.conf import settings
 from requests.exceptions import HTTPError
+from .llm_cache import get_llm_cache
+import asyncio
+import httpx
 import os
 import json
+import threading
 
 # Load env variables
 load_dotenv()
 
+# The model (and its settings) used to process content
+OPENAI_MODEL = "gpt-3.5-turbo"
+OPENAI_TEMPERATURE = 0.2
+
+# Process-wide OpenAI client, so all calls share one pool of keep-alive connections
+_openai_client = None
+_openai_client_lock = threading.Lock()
+
+
+def get_openai_client():
+    global _openai_client
+    with _openai_client_lock:
+        if _openai_client is None:
+            http_client = httpx.Client(
+                timeout=settings.OPENAI_TIMEOUT,
+                limits=httpx.Limits(
+                    max_connections=settings.OPENAI_MAX_CONNECTIONS,
+                    max_keepalive_connections=settings.OPENAI_MAX_CONNECTIONS,
+                ),
+            )
+            _openai_client = OpenAI(
+                api_key=os.getenv('OPENAI_API_KEY'),
+                timeout=settings.OPENAI_TIMEOUT,
+                max_retries=settings.OPENAI_MAX_RETRIES,
+                http_client=http_client,
+            )
+        return _openai_client
+
+
+# Replace the shared client, e.g. with a stand-in from ai_utilities.stubs. Returns the previous client.
+def set_openai_client(client):
+    global _openai_client
+    with _openai_client_lock:
+        previous_client = _openai_client
+        _openai_client = client
+        return previous_client
+
+
 # Specify the JSON schema's the AI model should follow in its response
 JSON_SCHEMAS = {
     "url_collection": {
@@ -34,6 +77,28 @@ JSON_SCHEMAS = {
             "format": "uri"
         }
     },
+    "story_extraction": {
+        "title": "string",
+        "created": {
+            "type": "string",
+            "format": "date-time"
+        },
+        "updated": {
+            "type": "string",
+            "format": "date-time"
+        },
+        "author": "string",
+        "story": "string",
+        "summary": "string",
+        "summary_check": {
+            "type": "string",
+            "enum": ["yes", "no"]
+        },
+        "image_url": {
+            "type": "string",
+            "format": "uri"
+        }
+    },
     "story_summary": {
         "summary": "string"
     },
@@ -57,35 +122,105 @@ JSON_SCHEMAS = {
             "required": ["name", "type", "confidence"]
         }
     },
+    "story_labels_batch": {
+        "stories": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "id": {
+                        "type": "integer"
+                    },
+                    "topics": {
+                        "type": "array",
+                        "items": {
+                            "type": "object",
+                            "properties": {
+                                "name": {
+                                    "type": "string"
+                                },
+                                "confidence": {
+                                    "type": "number",
+                                    "minimum": 0,
+                                    "maximum": 1
+                                }
+                            },
+                            "required": ["name", "confidence"]
+                        }
+                    },
+                    "locations": {
+                        "type": "array",
+                        "items": {
+                            "type": "object",
+                            "properties": {
+                                "name": {
+                                    "type": "string"
+                                },
+                                "confidence": {
+                                    "type": "number",
+                                    "minimum": 0,
+                                    "maximum": 1
+                                }
+                            },
+                            "required": ["name", "confidence"]
+                        }
+                    }
+                },
+                "required": ["id", "topics", "locations"]
+            }
+        }
+    },
     # Add more JSON schemas for other analysis types
 }
 
 
-def process_content_with_openai(setup_prompt, content, answer_format, schema):
+def build_messages(setup_prompt, content, answer_format, schema):
+    if not setup_prompt:
+        setup_prompt = "You are a helpful assistant designed to output JSON. "
+
+    if not answer_format:
+        answer_format = "Please respond in the provided JSON schema."
+
+    return [
+        {"role": "system", "content": setup_prompt},
+        {"role": "system", "content": answer_format},
+        {"role": "system", "content": f"Please make sure to follow this JSON schema: {json.dumps(schema)}"},
+        {"role": "user", "content": content}
+    ]
+
+
+# The body of a chat completion request, as sent to the API directly or through the Batch API
+def build_request_body(setup_prompt, content, answer_format, schema):
+    return {
+        "model": OPENAI_MODEL,
+        "response_format": {"type": "json_object"},
+        "messages": build_messages(setup_prompt, content, answer_format, schema),
+        "temperature": OPENAI_TEMPERATURE,  # Lower temperature for more deterministic results
+    }
+
+
+def process_content_with_openai(setup_prompt, content, answer_format, schema, use_cache=True):
     try:
-        # Set up the OpenAI client
-        client = OpenAI(
-            api_key=os.getenv('OPENAI_API_KEY')
-        )
+        messages = build_messages(setup_prompt, content, answer_format, schema)
 
-        if not setup_prompt:
-            setup_prompt = "You are a helpful assistant designed to output JSON. "
+        # Return the cached response if the exact same request was answered before
+        cache = get_llm_cache() if use_cache and settings.LLM_CACHE_ENABLED else None
+        if cache is not None:
+            cache_key = cache.make_key(OPENAI_MODEL, messages, schema, OPENAI_TEMPERATURE)
+            cached_content = cache.get(cache_key)
+            if cached_content is not None:
+                return cached_content
 
-        if not answer_format:
-            answer_format = "Please respond in the provided JSON schema."
+        # Use the shared OpenAI client
+        client = get_openai_client()
 
         # Call the OpenAI API
         try:
             response = client.chat.completions.create(
-                model="gpt-3.5-turbo",
+                model=OPENAI_MODEL,
                 response_format={"type": "json_object"},
-                messages=[
-                    {"role": "system", "content": setup_prompt},
-                    {"role": "system", "content": answer_format},
-                    {"role": "system", "content": f"Please make sure to follow this JSON schema: {json.dumps(schema)}"},
-                    {"role": "user", "content": content}
-                ],
-                temperature=0.2  # Lower temperature for more deterministic results
+                messages=messages,
+                temperature=OPENAI_TEMPERATURE  # Lower temperature for more deterministic results
             )
             print("response", response)
             content = response.choices[0].message.content
@@ -93,6 +228,8 @@ def process_content_with_openai(setup_prompt, content, answer_format, schema):
                 print(f"An error occurred: {content}")
                 return None
             else:
+                if cache is not None:
+                    cache.set(cache_key, content)
                 return content
         except HTTPError as e:
             print(f"An error occurred: {e}")
@@ -100,3 +237,9 @@ def process_content_with_openai(setup_prompt, content, answer_format, schema):
     except Exception as e:
         print("An error occurred while processing content with OpenAI: ", e)
         return None
+
+
+# Asyncio pipelines use the same code path (and client), without blocking the event loop
+async def aprocess_content_with_openai(setup_prompt, content, answer_format, schema, use_cache=True):
+    return await asyncio.to_thread(process_content_with_openai, setup_prompt, content, answer_format, schema,
+                                   use_cache)
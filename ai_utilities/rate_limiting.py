@@ -0,0 +1,61 @@
+import threading
+import time
+
+from django.conf import settings
+
+
+# Token bucket rate limiter, shared by threads. The bucket refills at rate tokens per second up to capacity, and each
+# request takes one or more tokens, waiting until enough tokens are available.
+class TokenBucket:
+    def __init__(self, rate, capacity=None, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1)
+        self.tokens = self.capacity
+        self.clock = clock
+        self.sleep = sleep
+        self.updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self, tokens=1):
+        with self._lock:
+            self._refill()
+            if self.tokens >= tokens:
+                self.tokens -= tokens
+                return True
+            return False
+
+    def acquire(self, tokens=1, timeout=None):
+        tokens = min(tokens, self.capacity)
+        deadline = None if timeout is None else self.clock() + timeout
+        while True:
+            with self._lock:
+                self._refill()
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return True
+                wait_time = (tokens - self.tokens) / self.rate
+
+            if deadline is not None:
+                remaining = deadline - self.clock()
+                if remaining <= 0:
+                    return False
+                wait_time = min(wait_time, remaining)
+            self.sleep(wait_time)
+
+
+_openai_rate_limiter = None
+_openai_rate_limiter_lock = threading.Lock()
+
+
+def get_openai_rate_limiter():
+    global _openai_rate_limiter
+    with _openai_rate_limiter_lock:
+        if _openai_rate_limiter is None:
+            _openai_rate_limiter = TokenBucket(settings.OPENAI_REQUESTS_PER_MINUTE / 60,
+                                               capacity=settings.OPENAI_MAX_BURST)
+        return _openai_rate_limiter
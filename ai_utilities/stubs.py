@@ -0,0 +1,34 @@
+from types import SimpleNamespace
+import threading
+
+
+# Stand-in for client.chat.completions of the OpenAI client, so code calling OpenAI can be tested offline.
+# Responses are returned in order (repeating the last one), or computed by a responder from the request.
+class StubChatCompletions:
+    def __init__(self, responses=None, responder=None):
+        self.responses = list(responses or ['{}'])
+        self.responder = responder
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def create(self, **kwargs):
+        with self._lock:
+            self.calls.append(kwargs)
+            call_index = len(self.calls) - 1
+
+        if self.responder is not None:
+            content = self.responder(kwargs)
+        else:
+            content = self.responses[min(call_index, len(self.responses) - 1)]
+
+        message = SimpleNamespace(role='assistant', content=content)
+        return SimpleNamespace(choices=[SimpleNamespace(index=0, message=message, finish_reason='stop')])
+
+
+class StubOpenAIClient:
+    def __init__(self, responses=None, responder=None):
+        self.chat = SimpleNamespace(completions=StubChatCompletions(responses, responder))
+
+    @property
+    def calls(self):
+        return self.chat.completions.calls
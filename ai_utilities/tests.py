@@ -1,8 +1,20 @@
+import asyncio
 import unittest
 import json
+import tempfile
+import time
+from pathlib import Path
 from unittest.mock import patch, MagicMock
 
-from ai_utilities.openai_utils import process_content_with_openai
+from django.test import override_settings
+
+from ai_utilities.batch import BatchError, LocalBatchBackend, OpenAIBatchBackend, build_batch_request, \
+    read_batch_results, run_batch
+from ai_utilities.llm_cache import LLMResponseCache
+from ai_utilities.openai_utils import process_content_with_openai, aprocess_content_with_openai, \
+    get_openai_client, set_openai_client, OPENAI_MODEL
+from ai_utilities.rate_limiting import TokenBucket
+from ai_utilities.stubs import StubOpenAIClient
 
 
 # Tests for story_collection/openai_utils.py
@@ -48,6 +60,277 @@ class TestOpenAIUtils(unittest.TestCase):
             pass
 
 
+# Tests for ai_utilities/llm_cache.py
+class TestLLMResponseCache(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = Path(self.temp_dir.name) / 'llm_cache.sqlite3'
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_make_key_depends_on_all_inputs(self):
+        messages = [{"role": "user", "content": "content"}]
+        key = LLMResponseCache.make_key("model", messages, {"summary": "string"}, 0.2)
+        self.assertEqual(key, LLMResponseCache.make_key("model", messages, {"summary": "string"}, 0.2))
+        self.assertNotEqual(key, LLMResponseCache.make_key("other-model", messages, {"summary": "string"}, 0.2))
+        self.assertNotEqual(key, LLMResponseCache.make_key("model", messages, {"title": "string"}, 0.2))
+        self.assertNotEqual(key, LLMResponseCache.make_key("model", messages, {"summary": "string"}, 0.5))
+
+    def test_get_and_set(self):
+        cache = LLMResponseCache(self.path)
+        self.assertIsNone(cache.get("key"))
+        cache.set("key", '{"summary": "test"}')
+        self.assertEqual(cache.get("key"), '{"summary": "test"}')
+        self.assertEqual(cache.stats(), {'hits': 1, 'misses': 1, 'entries': 1})
+
+        # The cache is persisted on disk
+        self.assertEqual(LLMResponseCache(self.path).get("key"), '{"summary": "test"}')
+
+    def test_expired_entries_are_not_returned(self):
+        cache = LLMResponseCache(self.path, ttl=60)
+        cache.set("key", "response")
+        with patch('ai_utilities.llm_cache.time.time', return_value=time.time() + 120):
+            self.assertIsNone(cache.get("key"))
+        self.assertEqual(cache.stats()['entries'], 0)
+
+    def test_least_recently_used_entries_are_evicted(self):
+        cache = LLMResponseCache(self.path, max_entries=2)
+        with patch('ai_utilities.llm_cache.time.time', side_effect=[1, 2, 3, 4]):
+            cache.set("first", "1")
+            cache.set("second", "2")
+            cache.get("first")
+            cache.set("third", "3")
+        self.assertEqual(cache.get("first"), "1")
+        self.assertIsNone(cache.get("second"))
+        self.assertEqual(cache.get("third"), "3")
+
+    def test_process_content_with_openai_uses_cache(self):
+        # Arrange
+        cache = LLMResponseCache(self.path)
+        client = StubOpenAIClient(responses=['{"summary": "Test"}'])
+        previous_client = set_openai_client(client)
+
+        # Act
+        try:
+            with patch('ai_utilities.openai_utils.get_llm_cache', return_value=cache):
+                first_result = process_content_with_openai("setup", "content", "format", {})
+                second_result = process_content_with_openai("setup", "content", "format", {})
+                bypassed_result = process_content_with_openai("setup", "content", "format", {}, use_cache=False)
+        finally:
+            set_openai_client(previous_client)
+
+        # Assert
+        self.assertEqual(first_result, '{"summary": "Test"}')
+        self.assertEqual(second_result, first_result)
+        self.assertEqual(bypassed_result, first_result)
+        self.assertEqual(len(client.calls), 2)
+        self.assertEqual(cache.hits, 1)
+
+
+# Tests for the shared OpenAI client in ai_utilities/openai_utils.py
+class TestOpenAIClient(unittest.TestCase):
+    def setUp(self):
+        self.client = StubOpenAIClient(responses=['{"summary": "Test"}', '{"error": "Invalid request"}'])
+        self.previous_client = set_openai_client(self.client)
+
+    def tearDown(self):
+        set_openai_client(self.previous_client)
+
+    def test_get_openai_client_is_shared(self):
+        self.assertIs(get_openai_client(), self.client)
+        self.assertIs(get_openai_client(), get_openai_client())
+
+    def test_process_content_with_openai_uses_shared_client(self):
+        # Act
+        result = process_content_with_openai("setup", "content", "format", {"summary": "string"}, use_cache=False)
+        error_result = process_content_with_openai("setup", "content", "format", {"summary": "string"}, use_cache=False)
+
+        # Assert
+        self.assertEqual(result, '{"summary": "Test"}')
+        self.assertIsNone(error_result)
+        request = self.client.calls[0]
+        self.assertEqual(request['model'], OPENAI_MODEL)
+        self.assertEqual(request['messages'][-1], {"role": "user", "content": "content"})
+
+    def test_aprocess_content_with_openai(self):
+        # Act
+        result = asyncio.run(aprocess_content_with_openai("setup", "content", "format", {}, use_cache=False))
+
+        # Assert
+        self.assertEqual(result, '{"summary": "Test"}')
+        self.assertEqual(len(self.client.calls), 1)
+
+
+# Tests for ai_utilities/rate_limiting.py
+class TestTokenBucket(unittest.TestCase):
+    def setUp(self):
+        self.now = 0
+        self.sleeps = []
+
+    def clock(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+    def test_bucket_allows_burst_then_limits(self):
+        # Arrange
+        bucket = TokenBucket(rate=2, capacity=3, clock=self.clock, sleep=self.sleep)
+
+        # Act
+        results = [bucket.try_acquire() for _ in range(4)]
+
+        # Assert
+        self.assertEqual(results, [True, True, True, False])
+
+    def test_acquire_waits_for_refill(self):
+        # Arrange
+        bucket = TokenBucket(rate=2, capacity=1, clock=self.clock, sleep=self.sleep)
+        bucket.acquire()
+
+        # Act
+        acquired = bucket.acquire()
+
+        # Assert
+        self.assertTrue(acquired)
+        self.assertAlmostEqual(sum(self.sleeps), 0.5)
+
+    def test_acquire_gives_up_after_timeout(self):
+        # Arrange
+        bucket = TokenBucket(rate=0.1, capacity=1, clock=self.clock, sleep=self.sleep)
+        bucket.acquire()
+
+        # Act
+        acquired = bucket.acquire(timeout=1)
+
+        # Assert
+        self.assertFalse(acquired)
+
+
+# Tests for ai_utilities/batch.py
+class TestBatch(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        settings_override = override_settings(BATCH_WORK_DIR=Path(self.directory.name))
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_build_batch_request(self):
+        # Act
+        request = build_batch_request('story-1', 'setup_prompt', 'content', 'answer_format', {'summary': 'string'})
+
+        # Assert
+        self.assertEqual(request['custom_id'], 'story-1')
+        self.assertEqual(request['url'], '/v1/chat/completions')
+        self.assertEqual(request['body']['model'], OPENAI_MODEL)
+        self.assertEqual(request['body']['messages'][-1], {'role': 'user', 'content': 'content'})
+
+    def test_run_batch_with_local_backend(self):
+        # Arrange
+        backend = LocalBatchBackend(responder=lambda body: json.dumps({'echo': body['messages'][-1]['content']}))
+        requests = [build_batch_request(f'story-{i}', 'setup', f'content {i}', 'format', {}) for i in range(3)]
+
+        # Act
+        results = list(run_batch(requests, backend=backend, poll_interval=0))
+
+        # Assert
+        self.assertEqual([custom_id for custom_id, content, error in results], ['story-0', 'story-1', 'story-2'])
+        self.assertEqual(json.loads(results[1][1]), {'echo': 'content 1'})
+        self.assertIsNone(results[1][2])
+
+    def test_local_backend_uses_shared_client(self):
+        # Arrange
+        client = StubOpenAIClient(responses=['{"summary": "Samenvatting"}'])
+        previous_client = set_openai_client(client)
+        self.addCleanup(set_openai_client, previous_client)
+        requests = [build_batch_request('story-1', 'setup', 'content', 'format', {})]
+
+        # Act
+        results = list(run_batch(requests, backend=LocalBatchBackend(), poll_interval=0))
+
+        # Assert
+        self.assertEqual(results, [('story-1', '{"summary": "Samenvatting"}', None)])
+        self.assertEqual(len(client.calls), 1)
+
+    def test_run_batch_polls_until_completed(self):
+        # Arrange
+        backend = MagicMock()
+        backend.submit.return_value = 'batch_1'
+        backend.status.side_effect = ['validating', 'in_progress', 'completed']
+        backend.download_results.side_effect = lambda batch_id, path: Path(path).write_text(
+            json.dumps({'custom_id': 'story-1', 'response': {'status_code': 200, 'body': {
+                'choices': [{'message': {'content': '{}'}}]}}, 'error': None}) + '\n')
+        sleeps = []
+
+        # Act
+        results = list(run_batch([build_batch_request('story-1', 'setup', 'content', 'format', {})],
+                                 backend=backend, poll_interval=5, sleep=sleeps.append))
+
+        # Assert
+        self.assertEqual(results, [('story-1', '{}', None)])
+        self.assertEqual(sleeps, [5, 5])
+
+    def test_run_batch_cancels_batch_after_timeout(self):
+        # Arrange
+        backend = MagicMock()
+        backend.submit.return_value = 'batch_1'
+        backend.status.return_value = 'in_progress'
+        requests = [build_batch_request(f'story-{i}', 'setup', 'content', 'format', {}) for i in range(2)]
+
+        # Act
+        with self.assertRaises(BatchError) as context:
+            list(run_batch(requests, backend=backend, poll_interval=5, timeout=10, sleep=lambda seconds: None))
+
+        # Assert
+        self.assertEqual((context.exception.batch_id, context.exception.request_count), ('batch_1', 2))
+        backend.cancel.assert_called_once_with('batch_1')
+        backend.download_results.assert_not_called()
+
+    def test_run_batch_raises_for_failed_batch(self):
+        # Arrange
+        backend = MagicMock()
+        backend.submit.return_value = 'batch_1'
+        backend.status.return_value = 'failed'
+
+        # Act / Assert
+        with self.assertRaises(BatchError):
+            list(run_batch([build_batch_request('story-1', 'setup', 'content', 'format', {})], backend=backend,
+                           poll_interval=0))
+        backend.cancel.assert_not_called()
+
+    def test_read_batch_results_reports_errors(self):
+        # Arrange
+        path = Path(self.directory.name) / 'results.jsonl'
+        path.write_text('\n'.join([
+            json.dumps({'custom_id': 'story-1', 'response': None, 'error': {'message': 'failed'}}),
+            json.dumps({'custom_id': 'story-2', 'response': {'status_code': 429, 'body': {'error': 'rate limit'}}}),
+            'not json',
+        ]))
+
+        # Act
+        results = list(read_batch_results(path))
+
+        # Assert
+        self.assertEqual(results, [('story-1', None, {'message': 'failed'}), ('story-2', None, {'error': 'rate limit'})])
+
+    def test_openai_backend_submits_file(self):
+        # Arrange
+        client = MagicMock()
+        client.files.create.return_value.id = 'file_1'
+        client.batches.create.return_value.id = 'batch_1'
+        path = Path(self.directory.name) / 'requests.jsonl'
+        path.write_text('{}\n')
+
+        # Act
+        batch_id = OpenAIBatchBackend(client).submit(path)
+
+        # Assert
+        self.assertEqual(batch_id, 'batch_1')
+        self.assertEqual(client.batches.create.call_args.kwargs['input_file_id'], 'file_1')
+
+
 if __name__ == '__main__':
     unittest.main()
-
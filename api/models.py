@@ -1,2 +1,3 @@
 from sources.models import Source
-from stories.models import Story, Label
\ No newline at end of file
+from stories.models import Story, Label, normalize_label_name
+from jobs.models import Job, JobKind
@@ -0,0 +1,85 @@
+import base64
+import json
+
+from django.conf import settings
+from django.db.models import F, Q
+from django.utils.dateparse import parse_datetime
+from rest_framework import pagination
+from rest_framework.exceptions import NotFound
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param, remove_query_param
+
+
+# Keyset pagination over stories, newest first, continuing after the (created, id) of the last story of the previous
+# page. Unlike page numbers, it needs no COUNT(*) and no OFFSET, so a deep page costs the same as the first page.
+# Stories without a created date come last, ordered by id.
+class StoryCursorPagination(pagination.BasePagination):
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def __init__(self, page_size=None):
+        self.page_size = page_size or settings.REST_FRAMEWORK['PAGE_SIZE']
+        self.request = None
+        self.next_position = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        queryset = queryset.annotate(cursorCreated=F('created')) \
+            .order_by(F('created').desc(nulls_last=True), '-id')
+
+        position = self.decode_cursor(request)
+        if position is not None:
+            queryset = queryset.filter(self.after_position(*position))
+
+        # Read one story more than fits on the page, to know whether there is a next page
+        stories = list(queryset[:self.page_size + 1])
+        if len(stories) > self.page_size:
+            stories = stories[:self.page_size]
+            self.next_position = (stories[-1].cursorCreated, stories[-1].id)
+        else:
+            self.next_position = None
+        return stories
+
+    def after_position(self, created, story_id):
+        if created is None:
+            return Q(created__isnull=True, id__lt=story_id)
+        return Q(created__lt=created) | Q(created=created, id__lt=story_id) | Q(created__isnull=True)
+
+    def decode_cursor(self, request):
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None
+        try:
+            position = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+            created = parse_datetime(position['created']) if position['created'] is not None else None
+            if position['created'] is not None and created is None:
+                raise ValueError(position['created'])
+            return created, int(position['id'])
+        except (TypeError, ValueError, KeyError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, created, story_id):
+        position = {'created': created.isoformat() if created is not None else None, 'id': story_id}
+        return base64.urlsafe_b64encode(json.dumps(position).encode('utf-8')).decode('ascii')
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        url = remove_query_param(self.request.build_absolute_uri(), 'page')
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(*self.next_position))
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
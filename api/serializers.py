@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import Source, Story, Label
+from .models import Source, Story, Label, Job, normalize_label_name
 from django.contrib.auth import authenticate
 from rest_framework.authtoken.models import Token
 
@@ -26,38 +26,81 @@ class ObtainAuthTokenSerializer(serializers.Serializer):
             raise serializers.ValidationError("Must include 'username' and 'password'.")
 
 
-class SourceSerializer(serializers.ModelSerializer):
+# Leaves out the fields that are not selected with the 'fields' context, or that are left out with the 'omit' context
+class SparseFieldsMixin:
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        selected_fields = self.context.get('fields')
+        omitted_fields = self.context.get('omit')
+        for field_name in list(self.fields):
+            if selected_fields and field_name not in selected_fields or omitted_fields and field_name in omitted_fields:
+                self.fields.pop(field_name)
+
+
+class SourceSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Source
         fields = '__all__'
 
 
-class LabelSerializer(serializers.ModelSerializer):
+class LabelSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Label
         fields = '__all__'
 
+    def validate_name(self, value):
+        # Labels differing only in case or whitespace are the same label
+        labels = Label.objects.filter(normalizedName=normalize_label_name(value))
+        if self.instance is not None:
+            labels = labels.exclude(id=self.instance.id)
+        if labels.exists():
+            raise serializers.ValidationError("A label with this name already exists.")
+        return value
+
+
+# The name and type of a label, embedded in a story with ?expand=labels
+class StoryLabelSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Label
+        fields = ['id', 'name', 'type']
 
-class StorySerializer(serializers.ModelSerializer):
+
+class StorySerializer(SparseFieldsMixin, serializers.ModelSerializer):
     labels = serializers.PrimaryKeyRelatedField(many=True, queryset=Label.objects.all(), required=False)
 
+    # Related objects that are embedded instead of referenced by id when they are listed in the 'expand' context
+    EXPANDABLE_FIELDS = {
+        'source': lambda: SourceSerializer(read_only=True),
+        'labels': lambda: StoryLabelSerializer(many=True, read_only=True),
+    }
+
     class Meta:
         model = Story
         fields = '__all__'
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        for field_name in self.context.get('expand', ()):
+            if field_name in self.EXPANDABLE_FIELDS and field_name in self.fields:
+                self.fields[field_name] = self.EXPANDABLE_FIELDS[field_name]()
+
     def update(self, instance, validated_data):
-        labels_data = validated_data.pop('labels')
+        labels_data = validated_data.pop('labels', None)
         instance = super().update(instance, validated_data)
 
-        # Clear existing labels
-        instance.labels.clear()
-
-        # Add new labels
-        for label in labels_data:
-            instance.labels.add(label)
+        # Replace the existing labels
+        if labels_data is not None:
+            instance.labels.set(labels_data)
 
         return instance
 
+
+class JobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Job
+        fields = '__all__'
+
+
 class ObtainAuthTokenResponseSerializer(serializers.Serializer):
     username = serializers.CharField()
     password = serializers.CharField()
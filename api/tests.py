@@ -47,6 +47,16 @@ from rest_framework.test import APIClient
 from rest_framework import status
 from django.contrib.auth.models import User
 from django.urls import reverse
+from unittest.mock import patch
+from datetime import timedelta
+from django.core.cache import cache
+from django.db.models import F
+from django.utils import timezone
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from story_evaluation.evaluation import hash_stage_inputs
+from story_evaluation.models import EvaluationStage, EvaluationStageStatus, StoryEvaluationStage
+from story_evaluation.story_labels import save_labels
 
 
 class TestViews(TestCase):
@@ -117,6 +127,13 @@ class TestViews(TestCase):
             self.assertEqual(response.data['results'][0]['name'], 'Test Label')
 
 
+    def test_label_create_rejects_name_differing_in_case(self):
+        self.client.force_authenticate(user=self.user)
+        Label.objects.create(name='Test Label', type='LOCATION')
+        url = reverse('label-list-create')
+        response = self.client.post(url, {'name': 'test label', 'type': 'LOCATION'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
     def test_label_retrieve_update_destroy_view(self):
         self.client.force_authenticate(user=self.user)
         label = Label.objects.create(name='Test Label', type='LOCATION')
@@ -124,6 +141,245 @@ class TestViews(TestCase):
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
+    @patch('jobs.runner.submit_job')
+    def test_collect_stories_enqueues_job(self, mock_submit_job):
+        self.client.force_authenticate(user=self.user)
+        source = Source.objects.create(name='Test Source', website='https://example.com')
+        url = reverse('collect_stories')
+        response = self.client.post(url, {'sourceid': source.id}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        job_id = response.json()['job_id']
+
+        # Duplicate requests are coalesced into the same job
+        response = self.client.post(url, {'sourceid': source.id}, format='json')
+        self.assertEqual(response.json()['job_id'], job_id)
+
+        response = self.client.get(reverse('job-detail', kwargs={'pk': job_id}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['status'], 'QUEUED')
+        self.assertEqual(response.data['targetId'], source.id)
+
+    @patch('jobs.runner.submit_job')
+    def test_evaluate_stories_enqueues_jobs(self, mock_submit_job):
+        self.client.force_authenticate(user=self.user)
+        story = Story.objects.create(title='Test Story')
+        url = reverse('evaluate_stories')
+        response = self.client.post(url, {'story_ids': [story.id]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.json()['job_ids']), 1)
+
+        response = self.client.post(url, {'story_ids': [story.id, story.id + 1]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    @patch('jobs.runner.submit_job')
+    def test_evaluate_stories_accepts_string_ids(self, mock_submit_job):
+        self.client.force_authenticate(user=self.user)
+        story = Story.objects.create(title='Test Story')
+        url = reverse('evaluate_stories')
+        response = self.client.post(url, {'story_ids': [str(story.id)]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(Job.objects.get(id=response.json()['job_ids'][0]).targetId, story.id)
+
+        response = self.client.post(url, {'story_ids': ['story']}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_enrich_stories_is_not_implemented(self):
+        self.client.force_authenticate(user=self.user)
+        story = Story.objects.create(title='Test Story')
+        response = self.client.post(reverse('enrich_stories'), {'story_ids': [story.id]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_501_NOT_IMPLEMENTED)
+        self.assertFalse(Job.objects.exists())
+
+    def create_stories_with_labels(self, count, start=0):
+        source = Source.objects.create(name=f'Source {start}')
+        label = Label.objects.create(name=f'Label {start}', type='TOPIC')
+        for i in range(start, start + count):
+            story = Story.objects.create(title=f'Story {i}', url=f'https://example.com/{i}', source=source)
+            story.labels.add(label)
+
+    def test_story_list_query_count_is_constant(self):
+        self.client.force_authenticate(user=self.user)
+        url = reverse('story-list-create')
+
+        for index, expand in enumerate(['', 'source', 'labels', 'source,labels']):
+            # Cache generation, count, stories (with their sources when expanded) and labels
+            self.create_stories_with_labels(1, start=index * 100)
+            cache.clear()
+            with self.assertNumQueries(4):
+                response = self.client.get(url, {'expand': expand})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+            self.create_stories_with_labels(9, start=index * 100 + 1)
+            cache.clear()
+            with self.assertNumQueries(4):
+                response = self.client.get(url, {'expand': expand})
+            self.assertEqual(len(response.data['results']), 10)
+
+        story = response.data['results'][0]
+        self.assertEqual(set(story['labels'][0]), {'id', 'name', 'type'})
+        self.assertEqual(set(story['source']), {field.name for field in Source._meta.fields})
+
+    def test_story_list_sparse_fields(self):
+        self.client.force_authenticate(user=self.user)
+        self.create_stories_with_labels(2)
+        url = reverse('story-list-create')
+
+        # Cache generation, count and stories, without the labels
+        with CaptureQueriesContext(connection) as queries, self.assertNumQueries(3):
+            response = self.client.get(url, {'fields': 'id,title,needsSum'})
+        self.assertEqual(set(response.data['results'][0]), {'id', 'title', 'needsSum'})
+        story_query = queries.captured_queries[-1]['sql']
+        self.assertIn('"needsSum"', story_query)
+        self.assertNotIn('"story"', story_query.replace('"stories_story"', ''))
+
+        response = self.client.get(url, {'omit': 'story,summary', 'expand': 'labels'})
+        story = response.data['results'][0]
+        self.assertNotIn('story', story)
+        self.assertNotIn('summary', story)
+        self.assertEqual(story['labels'][0]['name'], 'Label 0')
+
+        # Only the ids of the stories are read for their labels
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, {'fields': 'labels'})
+        self.assertEqual(set(response.data['results'][0]), {'labels'})
+        story_query = queries.captured_queries[2]['sql']
+        self.assertNotIn('"title"', story_query)
+        self.assertNotIn('"story"', story_query.replace('"stories_story"', ''))
+
+        response = self.client.get(url, {'fields': 'id,titel'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data, {'fields': 'Unknown fields: titel'})
+        response = self.client.get(url, {'omit': 'body'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_source_and_label_list_sparse_fields(self):
+        self.client.force_authenticate(user=self.user)
+        self.create_stories_with_labels(1)
+
+        response = self.client.get(reverse('source-list-create'), {'fields': 'name'})
+        self.assertEqual(response.data['results'], [{'name': 'Source 0'}])
+
+        response = self.client.get(reverse('label-list-create'), {'omit': 'id,normalizedName'})
+        self.assertEqual(response.data['results'], [{'name': 'Label 0', 'type': 'TOPIC'}])
+
+    def test_story_list_cursor_pagination(self):
+        self.client.force_authenticate(user=self.user)
+        created = timezone.now()
+        for i in range(25):
+            # Stories sharing a created date, and stories without a created date
+            Story.objects.create(title=f'Story {i}', url=f'https://example.com/{i}',
+                                 created=None if i % 5 == 0 else created - timedelta(hours=i // 3))
+        expected_ids = list(Story.objects.order_by(F('created').desc(nulls_last=True), '-id').values_list('id', flat=True))
+
+        story_ids = []
+        url = reverse('story-list-create') + '?pagination=cursor&fields=id'
+        while url:
+            # Cache generation and stories, without a count
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(len(queries), 2)
+            self.assertNotIn('COUNT', queries.captured_queries[1]['sql'])
+            self.assertNotIn('count', response.data)
+            story_ids.extend(story['id'] for story in response.data['results'])
+            url = response.data['next']
+
+        self.assertEqual(story_ids, expected_ids)
+
+        response = self.client.get(reverse('story-list-create'), {'cursor': 'invalid'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_story_list_search(self):
+        self.client.force_authenticate(user=self.user)
+        story = Story.objects.create(title='Nieuwe scholen in Tilburg', url='https://example.com/scholen')
+        Story.objects.create(title='Wegwerkzaamheden', url='https://example.com/weg')
+
+        response = self.client.get(reverse('story-list-create'), {'q': 'school', 'fields': 'id'})
+        self.assertEqual(response.data['results'], [{'id': story.id}])
+
+    def test_story_detail_expands_labels(self):
+        self.client.force_authenticate(user=self.user)
+        self.create_stories_with_labels(1)
+        story = Story.objects.get()
+        url = reverse('story-detail', kwargs={'pk': story.pk})
+
+        with self.assertNumQueries(2):
+            response = self.client.get(url, {'expand': 'labels'})
+        self.assertEqual(response.data['labels'], [{'id': story.labels.get().id, 'name': 'Label 0', 'type': 'TOPIC'}])
+        self.assertEqual(response.data['source'], story.source_id)
+
+    @patch('jobs.runner.submit_job')
+    def test_evaluate_stories_skips_finished_stages(self, mock_submit_job):
+        self.client.force_authenticate(user=self.user)
+        story = Story.objects.create(title='Test Story', url='https://example.com/test-story')
+        evaluated_story = Story.objects.create(title='Evaluated Story', url='https://example.com/evaluated-story')
+        for stage in EvaluationStage.values:
+            StoryEvaluationStage.objects.create(story=evaluated_story, stage=stage, status=EvaluationStageStatus.DONE,
+                                                inputHash=hash_stage_inputs(evaluated_story, stage))
+        StoryEvaluationStage.objects.filter(story=evaluated_story, stage=EvaluationStage.TOPICS).update(inputHash='outdated')
+
+        response = self.client.post(reverse('evaluate_stories'), {'story_ids': [story.id, evaluated_story.id]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.json()['job_ids']), 2)
+        self.assertEqual(Job.objects.get(targetId=evaluated_story.id).payload, {'stages': [EvaluationStage.TOPICS]})
+
+        StoryEvaluationStage.objects.filter(story=evaluated_story, stage=EvaluationStage.TOPICS) \
+            .update(inputHash=hash_stage_inputs(evaluated_story, EvaluationStage.TOPICS))
+        response = self.client.post(reverse('evaluate_stories'), {'story_ids': [evaluated_story.id]}, format='json')
+        self.assertEqual(response.json()['job_ids'], [])
+        self.assertEqual(response.json()['skipped_story_ids'], [evaluated_story.id])
+
+    def test_story_list_is_cached_until_the_data_changes(self):
+        self.client.force_authenticate(user=self.user)
+        url = reverse('story-list-create')
+        cache.clear()
+        Story.objects.create(title='First Story', url='https://example.com/first-story')
+        self.client.get(url)
+
+        # Act: only the cache generation is read
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        self.assertEqual(response.data['count'], 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Story.objects.create(title='Second Story', url='https://example.com/second-story')
+        response = self.client.get(url)
+
+        # Assert
+        self.assertEqual(response.data['count'], 2)
+
+    def test_story_list_is_refreshed_after_bulk_writes(self):
+        self.client.force_authenticate(user=self.user)
+        url = reverse('story-list-create')
+        story = Story.objects.create(title='Test Story', url='https://example.com/test-story')
+        self.client.get(url)
+
+        # Act
+        with self.captureOnCommitCallbacks(execute=True):
+            save_labels(story, [{'name': 'Verkeer', 'confidence': 0.9}], 'TOPIC')
+        response = self.client.get(url, {'expand': 'labels'})
+
+        # Assert
+        self.assertEqual([label['name'] for label in response.data['results'][0]['labels']], ['Verkeer'])
+        response = self.client.get(url)
+        self.assertEqual(len(response.data['results'][0]['labels']), 1)
+
+    def test_cached_responses_are_not_shared_between_users(self):
+        other_user = User.objects.create_user(username='otheruser', password='otherpassword')
+        url = reverse('source-list-create')
+        Source.objects.create(name='Test Source')
+        self.client.force_authenticate(user=self.user)
+        self.client.get(url)
+
+        # Act
+        self.client.force_authenticate(user=other_user)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+
+        # Assert
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertGreater(len(queries), 0)
+
 
 # Serializers tests
 from django.test import TestCase
@@ -29,6 +29,7 @@ urlpatterns = [
     path('collect_stories/', collect_stories, name='collect_stories'),
     path('evaluate_stories/', evaluate_stories, name='evaluate_stories'),
     path('enrich_stories/', enrich_stories, name='enrich_stories'),
+    path('jobs/<int:pk>/', JobRetrieve.as_view(), name='job-detail'),
     path('swagger/', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
     path('redoc/', schema_view.with_ui('redoc', cache_timeout=0), name='schema-redoc'),
 ]
@@ -1,19 +1,78 @@
 import json
+from functools import lru_cache
 
-from django.core.exceptions import ObjectDoesNotExist
+from django.conf import settings
+from django.db.models import Prefetch
 from rest_framework import generics, pagination
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import IsAuthenticated
 from rest_framework_simplejwt.views import TokenObtainPairView
-from django.utils.decorators import method_decorator
-from django.views.decorators.cache import cache_page
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
 from django.http import JsonResponse, HttpResponseBadRequest
 from django.views.decorators.csrf import csrf_exempt
 
-from story_collection.collection import collect_stories_from_source
-from story_evaluation.evaluation import evaluate_story
+from jobs.models import JobKind
+from jobs.runner import enqueue_job
+from story_evaluation.evaluation import find_pending_stages
+from stories.caching import cache_versioned
+from stories.search import search_stories
 from .serializers import *
+from .pagination import StoryCursorPagination
+
+EXPAND_PARAMETER = openapi.Parameter('expand', openapi.IN_QUERY, description="Comma separated related objects to embed in the stories: 'source', 'labels'", type=openapi.TYPE_STRING, required=False)
+
+
+FIELDS_PARAMETER = openapi.Parameter('fields', openapi.IN_QUERY, description="Comma separated fields to return, all fields when empty", type=openapi.TYPE_STRING, required=False)
+OMIT_PARAMETER = openapi.Parameter('omit', openapi.IN_QUERY, description="Comma separated fields to leave out", type=openapi.TYPE_STRING, required=False)
+
+
+# Helper function to read a comma separated list from the query parameters
+def get_list_parameter(request, name):
+    value = request.query_params.get(name, '')
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+
+# The names of the fields of a serializer class, which are only built once
+@lru_cache(maxsize=None)
+def get_serializer_field_names(serializer_class):
+    return tuple(serializer_class().fields)
+
+
+# Returns only the fields selected with the 'fields' and 'omit' query parameters of list views, reading only their
+# columns from the database
+class SparseFieldsViewMixin:
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        if self.request.method == 'GET':
+            context['fields'] = get_list_parameter(self.request, 'fields')
+            context['omit'] = get_list_parameter(self.request, 'omit')
+        return context
+
+    def get_selected_fields(self):
+        # The names of the serializer fields that are returned, or None when all fields are returned
+        if self.request.method != 'GET':
+            return None
+        selected_fields = get_list_parameter(self.request, 'fields')
+        omitted_fields = get_list_parameter(self.request, 'omit')
+        if not selected_fields and not omitted_fields:
+            return None
+        field_names = get_serializer_field_names(self.get_serializer_class())
+        for parameter, names in (('fields', selected_fields), ('omit', omitted_fields)):
+            unknown_fields = [name for name in names if name not in field_names]
+            if unknown_fields:
+                raise ValidationError({parameter: f"Unknown fields: {', '.join(unknown_fields)}"})
+        return [name for name in field_names
+                if (not selected_fields or name in selected_fields) and name not in omitted_fields]
+
+    def apply_sparse_fields(self, queryset):
+        selected_fields = self.get_selected_fields()
+        if selected_fields is None:
+            return queryset
+        # Always read the primary key, so a selection without any column, such as only the labels, does not read all
+        concrete_fields = {field.name for field in queryset.model._meta.concrete_fields}
+        return queryset.only('id', *[name for name in selected_fields if name in concrete_fields])
+
 
 # Helper function to filter queryset based on query parameters
 def filter_queryset(queryset, query_params, fields, min_value_fields):
@@ -34,6 +93,15 @@ def filter_queryset(queryset, query_params, fields, min_value_fields):
     return queryset
 
 
+# Helper function to find the first of the given story IDs that does not exist
+def find_missing_story_id(story_ids):
+    existing_story_ids = set(Story.objects.filter(id__in=story_ids).values_list('id', flat=True))
+    for story_id in story_ids:
+        if story_id not in existing_story_ids:
+            return story_id
+    return None
+
+
 class ObtainTokenPairView(TokenObtainPairView):
     serializer_class = ObtainAuthTokenSerializer
     @swagger_auto_schema(responses={200: ObtainAuthTokenResponseSerializer})
@@ -41,7 +109,7 @@ class ObtainTokenPairView(TokenObtainPairView):
         return super().post(request, *args, **kwargs)
 
 
-class SourceListCreate(generics.ListCreateAPIView):
+class SourceListCreate(SparseFieldsViewMixin, generics.ListCreateAPIView):
     serializer_class = SourceSerializer
     permission_classes = [IsAuthenticated]
 
@@ -51,9 +119,11 @@ class SourceListCreate(generics.ListCreateAPIView):
         openapi.Parameter('country', openapi.IN_QUERY, description="Country of the source", type=openapi.TYPE_STRING, required=False),
         openapi.Parameter('province', openapi.IN_QUERY, description="Province of the source", type=openapi.TYPE_STRING, required=False),
         openapi.Parameter('region', openapi.IN_QUERY, description="Region of the source", type=openapi.TYPE_STRING, required=False),
-        openapi.Parameter('municipality', openapi.IN_QUERY, description="Municipality of the source", type=openapi.TYPE_STRING, required=False)
+        openapi.Parameter('municipality', openapi.IN_QUERY, description="Municipality of the source", type=openapi.TYPE_STRING, required=False),
+        FIELDS_PARAMETER,
+        OMIT_PARAMETER,
     ])
-    @method_decorator(cache_page(60*15))  # Cache this view for 15 minutes
+    @cache_versioned()  # Cache this view per user until the data changes
     def get(self, request, *args, **kwargs):
         return super().get(request, *args, **kwargs)
 
@@ -67,7 +137,8 @@ class SourceListCreate(generics.ListCreateAPIView):
             'region': 'string',
             'municipality': 'string'
         }
-        return filter_queryset(queryset, self.request.query_params, fields, [])
+        queryset = filter_queryset(queryset, self.request.query_params, fields, [])
+        return self.apply_sparse_fields(queryset)
 
 
 class SourceRetrieveUpdateDestroy(generics.RetrieveUpdateDestroyAPIView):
@@ -76,11 +147,49 @@ class SourceRetrieveUpdateDestroy(generics.RetrieveUpdateDestroyAPIView):
     permission_classes = [IsAuthenticated]
 
 
-class StoryListCreate(generics.ListCreateAPIView):
+# Helper function to read the related objects to embed from the comma separated 'expand' query parameter
+def get_expand(request):
+    return [field for field in get_list_parameter(request, 'expand') if field in StorySerializer.EXPANDABLE_FIELDS]
+
+
+# Plans the queries of the story views, so a page of stories takes the same number of queries whatever its size
+class StoryQueryMixin:
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['expand'] = get_expand(self.request)
+        return context
+
+    def get_selected_fields(self):
+        return None
+
+    def plan_queryset(self, queryset):
+        expand = get_expand(self.request)
+        selected_fields = self.get_selected_fields()
+        if 'source' in expand and (selected_fields is None or 'source' in selected_fields):
+            queryset = queryset.select_related('source')
+        if selected_fields is not None and 'labels' not in selected_fields:
+            return queryset
+        if 'labels' in expand:
+            return queryset.prefetch_related(Prefetch('labels', queryset=Label.objects.only('id', 'name', 'type')))
+        return queryset.prefetch_related(Prefetch('labels', queryset=Label.objects.only('id')))
+
+
+class StoryListCreate(SparseFieldsViewMixin, StoryQueryMixin, generics.ListCreateAPIView):
     serializer_class = StorySerializer
     permission_classes = [IsAuthenticated]
     pagination_class = pagination.PageNumberPagination
 
+    @property
+    def paginator(self):
+        # Clients choose cursor pagination with ?pagination=cursor, which the next links keep through the cursor
+        if not hasattr(self, '_paginator'):
+            query_params = self.request.query_params
+            if query_params.get('pagination') == 'cursor' or 'cursor' in query_params:
+                self._paginator = StoryCursorPagination()
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
+
     @swagger_auto_schema(manual_parameters=[
         openapi.Parameter('title', openapi.IN_QUERY, description="Title of the story", type=openapi.TYPE_STRING, required=False),
         openapi.Parameter('author', openapi.IN_QUERY, description="Author of the story", type=openapi.TYPE_STRING, required=False),
@@ -94,13 +203,19 @@ class StoryListCreate(generics.ListCreateAPIView):
         openapi.Parameter('needsDo', openapi.IN_QUERY, description="Minimum 'Do' userneed of the story", type=openapi.TYPE_INTEGER, required=False),
         openapi.Parameter('needsSum', openapi.IN_QUERY, description="Minimum Sum of userneeds of the story", type=openapi.TYPE_INTEGER, required=False),
         openapi.Parameter('label', openapi.IN_QUERY, description="Label of the story", type=openapi.TYPE_STRING, required=False),
+        EXPAND_PARAMETER,
+        FIELDS_PARAMETER,
+        OMIT_PARAMETER,
+        openapi.Parameter('q', openapi.IN_QUERY, description="Search query, the stories matching it are ordered by relevance", type=openapi.TYPE_STRING, required=False),
+        openapi.Parameter('pagination', openapi.IN_QUERY, description="'cursor' to page through the stories with a cursor instead of page numbers, without counting them", type=openapi.TYPE_STRING, required=False),
+        openapi.Parameter('cursor', openapi.IN_QUERY, description="Cursor of the page, from the 'next' link of the previous page", type=openapi.TYPE_STRING, required=False),
     ])
-    @method_decorator(cache_page(60*15))  # Cache this view for 15 minutes
+    @cache_versioned()  # Cache this view per user until the data changes
     def get(self, request, *args, **kwargs):
         return super().get(request, *args, **kwargs)
 
     def get_queryset(self):
-        queryset = Story.objects.all().order_by('-created')
+        queryset = Story.objects.all().order_by('-created', '-id')
         fields = {
             'title': 'string',
             'author': 'string',
@@ -116,22 +231,36 @@ class StoryListCreate(generics.ListCreateAPIView):
             'label': 'string',
         }
         min_value_fields = ['needsKnow', 'needsUnderstand', 'needsFeel', 'needsDo', 'needsSum']
-        return filter_queryset(queryset, self.request.query_params, fields, min_value_fields)
+        queryset = filter_queryset(queryset, self.request.query_params, fields, min_value_fields)
+
+        # Order the stories by relevance when searching, cursor pagination keeps its own order
+        query = self.request.query_params.get('q', '')
+        if query:
+            queryset = search_stories(queryset, query).order_by('searchRank', '-created', '-id')
+        return self.plan_queryset(self.apply_sparse_fields(queryset))
 
-class StoryRetrieveUpdateDestroy(generics.RetrieveUpdateDestroyAPIView):
-    queryset = Story.objects.all()
+class StoryRetrieveUpdateDestroy(StoryQueryMixin, generics.RetrieveUpdateDestroyAPIView):
     serializer_class = StorySerializer
     permission_classes = [IsAuthenticated]
 
+    @swagger_auto_schema(manual_parameters=[EXPAND_PARAMETER])
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+
+    def get_queryset(self):
+        return self.plan_queryset(Story.objects.all())
+
 
-class LabelListCreate(generics.ListCreateAPIView):
+class LabelListCreate(SparseFieldsViewMixin, generics.ListCreateAPIView):
     serializer_class = LabelSerializer
     permission_classes = [IsAuthenticated]
 
     @swagger_auto_schema(manual_parameters=[
         openapi.Parameter('name', openapi.IN_QUERY, description="Name of the label", type=openapi.TYPE_STRING, required=False),
+        FIELDS_PARAMETER,
+        OMIT_PARAMETER,
     ])
-    @method_decorator(cache_page(60*15))  # Cache this view for 15 minutes
+    @cache_versioned()  # Cache this view per user until the data changes
     def get(self, request, *args, **kwargs):
         return super().get(request, *args, **kwargs)
 
@@ -140,7 +269,8 @@ class LabelListCreate(generics.ListCreateAPIView):
         fields = {
             'name': 'string',
         }
-        return filter_queryset(queryset, self.request.query_params, fields, [])
+        queryset = filter_queryset(queryset, self.request.query_params, fields, [])
+        return self.apply_sparse_fields(queryset)
 
 
 class LabelRetrieveUpdateDestroy(generics.RetrieveUpdateDestroyAPIView):
@@ -149,6 +279,12 @@ class LabelRetrieveUpdateDestroy(generics.RetrieveUpdateDestroyAPIView):
     permission_classes = [IsAuthenticated]
 
 
+class JobRetrieve(generics.RetrieveAPIView):
+    queryset = Job.objects.all()
+    serializer_class = JobSerializer
+    permission_classes = [IsAuthenticated]
+
+
 from rest_framework.decorators import api_view
 
 @csrf_exempt
@@ -159,10 +295,11 @@ from rest_framework.decorators import api_view
         type=openapi.TYPE_OBJECT,
         properties={
             'sourceid': openapi.Schema(type=openapi.TYPE_INTEGER, description='ID of the source'),
+            'max_stories': openapi.Schema(type=openapi.TYPE_INTEGER, description='Maximum amount of stories to collect'),
         },
         required=['sourceid'],
     ),
-    responses={200: openapi.Response(description="Stories collection initiated successfully")}
+    responses={200: openapi.Response(description="Stories collection initiated successfully, returns the job_id")}
 )
 @api_view(['POST'])
 def collect_stories(request):
@@ -174,8 +311,13 @@ def collect_stories(request):
             source = Source.objects.get(id=source_id)
         except Source.DoesNotExist:
             return HttpResponseBadRequest("No Source object found with ID {}".format(source_id))
-        collect_stories_from_source(source)
-        return JsonResponse({"message": "Stories collection initiated successfully"})
+        max_stories = request.data.get('max_stories', settings.COLLECTION_STORY_BUDGET)
+        try:
+            max_stories = int(max_stories) if max_stories is not None else None
+        except (TypeError, ValueError):
+            return HttpResponseBadRequest("max_stories must be an integer")
+        job, created = enqueue_job(JobKind.COLLECT_STORIES, source.id, {'max_stories': max_stories})
+        return JsonResponse({"message": "Stories collection initiated successfully", "job_id": job.id})
     else:
         return HttpResponseBadRequest("Invalid HTTP method")
 
@@ -191,25 +333,29 @@ def collect_stories(request):
         },
         required=['story_ids'],
     ),
-    responses={200: openapi.Response(description="Stories evaluation initiated successfully")}
+    responses={200: openapi.Response(description="Stories evaluation initiated successfully for the stories with pending evaluation stages, returns the job_ids and the ids of the skipped stories")}
 )
 @api_view(['POST'])
 def evaluate_stories(request):
     if request.method == 'POST':
         try:
             data = json.loads(request.body)
-            story_ids = data['story_ids']
-        except (KeyError, json.JSONDecodeError):
+            story_ids = [int(story_id) for story_id in data['story_ids']]
+        except (KeyError, TypeError, ValueError):
             return JsonResponse({'error': 'Invalid JSON body'}, status=400)
 
-        for story_id in story_ids:
-            try:
-                story = Story.objects.get(id=story_id)
-                evaluate_story(story)
-            except ObjectDoesNotExist:
-                return JsonResponse({'error': f'Story with id {story_id} does not exist'}, status=404)
-
-        return JsonResponse({'message': 'Stories evaluation initiated successfully'})
+        missing_story_id = find_missing_story_id(story_ids)
+        if missing_story_id is not None:
+            return JsonResponse({'error': f'Story with id {missing_story_id} does not exist'}, status=404)
+
+        # Only run the stages that have not run yet on the current content of each story
+        pending_stages = find_pending_stages(Story.objects.filter(id__in=story_ids))
+        story_ids = list(dict.fromkeys(story_ids))
+        job_ids = [enqueue_job(JobKind.EVALUATE_STORY, story_id, {'stages': pending_stages[story_id]})[0].id
+                   for story_id in story_ids if pending_stages[story_id]]
+        skipped_story_ids = [story_id for story_id in story_ids if not pending_stages[story_id]]
+        return JsonResponse({'message': 'Stories evaluation initiated successfully', 'job_ids': job_ids,
+                             'skipped_story_ids': skipped_story_ids})
     else:
         return JsonResponse({'error': 'Invalid HTTP method'}, status=405)
 
@@ -225,24 +371,22 @@ def evaluate_stories(request):
         },
         required=['story_ids'],
     ),
-    responses={200: openapi.Response(description="Stories enrichment initiated successfully")}
+    responses={501: openapi.Response(description="Story enrichment is not implemented")}
 )
 @api_view(['POST'])
 def enrich_stories(request):
     if request.method == 'POST':
         try:
             data = json.loads(request.body)
-            story_ids = data['story_ids']
-        except (KeyError, json.JSONDecodeError):
+            story_ids = [int(story_id) for story_id in data['story_ids']]
+        except (KeyError, TypeError, ValueError):
             return JsonResponse({'error': 'Invalid JSON body'}, status=400)
 
-        for story_id in story_ids:
-            try:
-                story = Story.objects.get(id=story_id)
-                # TODO: This is a place holder! Add your enrichment function calls here
-            except ObjectDoesNotExist:
-                return JsonResponse({'error': f'Story with id {story_id} does not exist'}, status=404)
+        missing_story_id = find_missing_story_id(story_ids)
+        if missing_story_id is not None:
+            return JsonResponse({'error': f'Story with id {missing_story_id} does not exist'}, status=404)
 
-        return JsonResponse({'message': 'Stories enrichment initiated successfully'})
+        # There is no enrichment to run yet, so the request is not accepted as if it were started
+        return JsonResponse({'error': 'Story enrichment is not implemented'}, status=501)
     else:
         return JsonResponse({'error': 'Invalid HTTP method'}, status=405)
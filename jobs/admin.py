@@ -0,0 +1,10 @@
+from django.contrib import admin
+from jobs.models import Job
+
+
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'kind', 'targetId', 'status', 'progress', 'created', 'finished')
+    list_filter = ('kind', 'status')
+
+
+admin.site.register(Job, JobAdmin)
@@ -0,0 +1,29 @@
+from jobs.models import JobKind
+from sources.models import Source
+from stories.models import Story
+from story_collection.collection import collect_stories_from_source
+from story_collection.concurrency import StoryBudget
+from story_evaluation.evaluation import evaluate_story
+
+
+def collect_stories_handler(job):
+    source = Source.objects.get(id=job.targetId)
+    job.report_progress(0, f"Collecting stories from source '{source.name}'")
+
+    budget = StoryBudget(job.payload.get('max_stories'))
+    stories_collected = collect_stories_from_source(source, budget=budget)
+    return {'stories_collected': stories_collected}
+
+
+def evaluate_story_handler(job):
+    story = Story.objects.get(id=job.targetId)
+    job.report_progress(0, f"Evaluating story '{story.title}'")
+
+    stage_results = evaluate_story(story, stages=job.payload.get('stages'))
+    return {'story_id': story.id, 'stages': stage_results}
+
+
+JOB_HANDLERS = {
+    JobKind.COLLECT_STORIES: collect_stories_handler,
+    JobKind.EVALUATE_STORY: evaluate_story_handler,
+}
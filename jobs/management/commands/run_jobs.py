@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from jobs.runner import requeue_interrupted_jobs, run_queued_jobs
+
+
+class Command(BaseCommand):
+    help = "Run all queued jobs, e.g. the ones left behind when the server stopped"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requeue-interrupted', action='store_true',
+                            help="Queue the jobs that were still running when the server stopped again first")
+
+    def handle(self, *args, **options):
+        if options['requeue_interrupted']:
+            requeued = requeue_interrupted_jobs()
+            self.stdout.write(f"Queued {requeued} interrupted jobs again")
+
+        jobs_run = run_queued_jobs()
+        self.stdout.write(f"Ran {jobs_run} jobs")
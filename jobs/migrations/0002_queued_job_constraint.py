@@ -0,0 +1,34 @@
+# Generated by Django 5.0.4 on 2026-10-18 07:12
+
+from django.db import migrations, models
+
+
+def fail_enrich_jobs(apps, schema_editor):
+    # Enriching stories is no longer a job, so enrichment jobs that did not finish never will
+    Job = apps.get_model('jobs', 'Job')
+    Job.objects.filter(kind='ENRICH_STORY', status__in=['QUEUED', 'RUNNING']).update(
+        status='FAILED', error='Enriching stories is not a job')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('jobs', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(fail_enrich_jobs, migrations.RunPython.noop),
+        migrations.RemoveConstraint(
+            model_name='job',
+            name='unique_active_job',
+        ),
+        migrations.AlterField(
+            model_name='job',
+            name='kind',
+            field=models.CharField(choices=[('COLLECT_STORIES', 'Collect stories'), ('EVALUATE_STORY', 'Evaluate story')], max_length=20),
+        ),
+        migrations.AddConstraint(
+            model_name='job',
+            constraint=models.UniqueConstraint(condition=models.Q(('status', 'QUEUED')), fields=('kind', 'targetId'), name='unique_queued_job'),
+        ),
+    ]
@@ -0,0 +1,47 @@
+from django.db import models
+from django.db.models import Q
+
+
+class JobKind(models.TextChoices):
+    COLLECT_STORIES = 'COLLECT_STORIES', 'Collect stories'
+    EVALUATE_STORY = 'EVALUATE_STORY', 'Evaluate story'
+
+
+class JobStatus(models.TextChoices):
+    QUEUED = 'QUEUED', 'Queued'
+    RUNNING = 'RUNNING', 'Running'
+    DONE = 'DONE', 'Done'
+    FAILED = 'FAILED', 'Failed'
+
+
+class Job(models.Model):
+    kind = models.CharField(max_length=20, choices=JobKind.choices)
+    targetId = models.IntegerField()
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=20, choices=JobStatus.choices, default=JobStatus.QUEUED)
+    progress = models.IntegerField(default=0)
+    message = models.CharField(max_length=200, blank=True)
+    result = models.JSONField(blank=True, null=True)
+    error = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    started = models.DateTimeField(blank=True, null=True)
+    finished = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        constraints = [
+            # Only one job may be queued for the same target, so duplicate jobs are coalesced. A job may be queued
+            # while another one runs for the same target, it runs once the other one has finished.
+            models.UniqueConstraint(fields=['kind', 'targetId'], condition=Q(status=JobStatus.QUEUED),
+                                    name='unique_queued_job'),
+        ]
+        indexes = [
+            models.Index(fields=['status', 'created']),
+        ]
+
+    def report_progress(self, progress, message=''):
+        self.progress = progress
+        self.message = message[:200]
+        Job.objects.filter(id=self.id).update(progress=self.progress, message=self.message)
+
+    def __str__(self):
+        return f'{self.kind} {self.targetId}: {self.status}'
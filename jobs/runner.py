@@ -0,0 +1,139 @@
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from jobs.models import Job, JobStatus
+from news_hyperlocalizer.threads import closes_db_connection
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def merge_payloads(payload, other):
+    # A missing or None value means no restriction, such as all stages or no story limit, so it wins. Lists are
+    # combined, and of two numbers the largest wins.
+    merged = {}
+    for key in list(payload) + [key for key in other if key not in payload]:
+        value, other_value = payload.get(key), other.get(key)
+        if value is None or other_value is None:
+            merged[key] = None
+        elif isinstance(value, list) and isinstance(other_value, list):
+            merged[key] = value + [item for item in other_value if item not in value]
+        elif isinstance(value, (int, float)) and isinstance(other_value, (int, float)):
+            merged[key] = max(value, other_value)
+        else:
+            merged[key] = other_value
+    return merged
+
+
+def enqueue_job(kind, target_id, payload=None):
+    payload = payload or {}
+    while True:
+        # Return the job that is running for the same target when it already does what is asked
+        running_job = Job.objects.filter(kind=kind, targetId=target_id, status=JobStatus.RUNNING).first()
+        if running_job is not None and merge_payloads(running_job.payload, payload) == running_job.payload:
+            return running_job, False
+
+        # Merge the request into the job that is already queued for the same target, so duplicate jobs are coalesced
+        queued_job = Job.objects.filter(kind=kind, targetId=target_id, status=JobStatus.QUEUED).first()
+        if queued_job is not None:
+            merged = merge_payloads(queued_job.payload, payload)
+            if merged == queued_job.payload \
+                    or Job.objects.filter(id=queued_job.id, status=JobStatus.QUEUED).update(payload=merged):
+                queued_job.payload = merged
+                return queued_job, False
+            # The job started running before the request was merged into it
+            continue
+
+        try:
+            with transaction.atomic():
+                job = Job.objects.create(kind=kind, targetId=target_id, payload=payload)
+        except IntegrityError:
+            # Another request enqueued the same job in the meantime
+            continue
+
+        # Only hand the job to a worker once it is visible to other database connections
+        transaction.on_commit(lambda: submit_job(job.id))
+        return job, True
+
+
+def submit_job(job_id):
+    get_executor().submit(run_job_in_thread, job_id)
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=settings.JOBS_MAX_WORKERS, thread_name_prefix='jobs')
+        return _executor
+
+
+@closes_db_connection
+def run_job_in_thread(job_id):
+    job = run_job(job_id)
+    if job is not None:
+        submit_next_job(job)
+
+
+def run_job(job_id):
+    from jobs.handlers import JOB_HANDLERS
+
+    # Claim the job, so it is never run twice, and never while another job runs for the same target. Such a job stays
+    # queued until the other job has finished.
+    running_jobs = Job.objects.filter(kind=OuterRef('kind'), targetId=OuterRef('targetId'), status=JobStatus.RUNNING)
+    claimed = Job.objects.filter(id=job_id, status=JobStatus.QUEUED).exclude(Exists(running_jobs)) \
+        .update(status=JobStatus.RUNNING, started=timezone.now())
+    if not claimed:
+        return None
+
+    job = Job.objects.get(id=job_id)
+    try:
+        handler = JOB_HANDLERS[job.kind]
+        job.result = handler(job)
+        job.status = JobStatus.DONE
+        job.progress = 100
+    except Exception as e:
+        print(f"An error occurred while running job {job.id} ({job.kind}): {e}")
+        job.status = JobStatus.FAILED
+        job.error = traceback.format_exc()
+    job.finished = timezone.now()
+    job.save(update_fields=['result', 'status', 'progress', 'error', 'finished'])
+    return job
+
+
+def submit_next_job(job):
+    # Run the job that was queued for the same target while the job was running
+    next_job_id = Job.objects.filter(kind=job.kind, targetId=job.targetId, status=JobStatus.QUEUED) \
+        .values_list('id', flat=True).first()
+    if next_job_id is not None:
+        submit_job(next_job_id)
+
+
+def run_queued_jobs():
+    jobs_run = 0
+    for job_id in Job.objects.filter(status=JobStatus.QUEUED).order_by('created').values_list('id', flat=True):
+        if run_job(job_id) is not None:
+            jobs_run += 1
+    return jobs_run
+
+
+def requeue_interrupted_jobs():
+    # Jobs that were running when the process stopped would otherwise block new jobs for their target forever. When
+    # a job was queued for the same target in the meantime, the interrupted job is merged into it.
+    requeued = 0
+    for job in Job.objects.filter(status=JobStatus.RUNNING):
+        queued_job = Job.objects.filter(kind=job.kind, targetId=job.targetId, status=JobStatus.QUEUED).first()
+        if queued_job is None:
+            Job.objects.filter(id=job.id).update(status=JobStatus.QUEUED, started=None)
+        else:
+            Job.objects.filter(id=queued_job.id).update(payload=merge_payloads(queued_job.payload, job.payload))
+            Job.objects.filter(id=job.id).update(status=JobStatus.FAILED, finished=timezone.now(),
+                                                 error=f"Interrupted, continued in job {queued_job.id}")
+        requeued += 1
+    return requeued
@@ -0,0 +1,160 @@
+from unittest.mock import patch
+
+from django.test import TestCase
+
+from jobs.models import Job, JobKind, JobStatus
+from jobs.runner import enqueue_job, run_job, run_queued_jobs, requeue_interrupted_jobs, merge_payloads, \
+    submit_next_job
+from sources.models import Source
+
+
+# Tests for jobs/runner.py
+class JobRunnerTestCase(TestCase):
+    def setUp(self):
+        self.source = Source.objects.create(name='Test Source', website='https://example.com')
+
+    @patch('jobs.runner.submit_job')
+    def test_enqueue_job_submits_after_commit(self, mock_submit_job):
+        # Act
+        with self.captureOnCommitCallbacks(execute=True):
+            job, created = enqueue_job(JobKind.COLLECT_STORIES, self.source.id, {'max_stories': 3})
+
+        # Assert
+        self.assertTrue(created)
+        self.assertEqual(job.status, JobStatus.QUEUED)
+        self.assertEqual(job.payload, {'max_stories': 3})
+        mock_submit_job.assert_called_once_with(job.id)
+
+    @patch('jobs.runner.submit_job')
+    def test_enqueue_job_coalesces_duplicates(self, mock_submit_job):
+        # Act
+        with self.captureOnCommitCallbacks(execute=True):
+            job, created = enqueue_job(JobKind.COLLECT_STORIES, self.source.id)
+            duplicate_job, duplicate_created = enqueue_job(JobKind.COLLECT_STORIES, self.source.id)
+
+        # Assert
+        self.assertFalse(duplicate_created)
+        self.assertEqual(job.id, duplicate_job.id)
+        self.assertEqual(Job.objects.count(), 1)
+        mock_submit_job.assert_called_once_with(job.id)
+
+    @patch('jobs.runner.submit_job')
+    def test_enqueue_job_merges_payloads(self, mock_submit_job):
+        # Act
+        job, created = enqueue_job(JobKind.EVALUATE_STORY, 1, {'stages': ['TOPICS']})
+        merged_job, merged_created = enqueue_job(JobKind.EVALUATE_STORY, 1, {'stages': ['USERNEEDS', 'TOPICS']})
+
+        # Assert
+        self.assertFalse(merged_created)
+        self.assertEqual(merged_job.id, job.id)
+        job.refresh_from_db()
+        self.assertEqual(job.payload, {'stages': ['TOPICS', 'USERNEEDS']})
+
+    def test_merge_payloads(self):
+        self.assertEqual(merge_payloads({'max_stories': 3}, {'max_stories': 5}), {'max_stories': 5})
+        self.assertEqual(merge_payloads({'max_stories': 3}, {'max_stories': None}), {'max_stories': None})
+        self.assertEqual(merge_payloads({}, {'stages': ['TOPICS']}), {'stages': None})
+
+    @patch('jobs.runner.submit_job')
+    @patch('jobs.handlers.collect_stories_from_source')
+    def test_enqueue_job_while_running_queues_next_job(self, mock_collect_stories_from_source, mock_submit_job):
+        # Arrange
+        mock_collect_stories_from_source.return_value = 0
+        running_job = Job.objects.create(kind=JobKind.COLLECT_STORIES, targetId=self.source.id,
+                                         status=JobStatus.RUNNING, payload={'max_stories': 3})
+
+        # Act
+        covered_job, covered_created = enqueue_job(JobKind.COLLECT_STORIES, self.source.id, {'max_stories': 2})
+        next_job, next_created = enqueue_job(JobKind.COLLECT_STORIES, self.source.id, {'max_stories': 10})
+        blocked = run_job(next_job.id)
+        Job.objects.filter(id=running_job.id).update(status=JobStatus.DONE)
+        submit_next_job(running_job)
+
+        # Assert
+        self.assertEqual(covered_job.id, running_job.id)
+        self.assertFalse(covered_created)
+        self.assertTrue(next_created)
+        self.assertIsNone(blocked)
+        mock_submit_job.assert_called_with(next_job.id)
+        self.assertEqual(run_job(next_job.id).status, JobStatus.DONE)
+        self.assertEqual(mock_collect_stories_from_source.call_args.kwargs['budget'].limit, 10)
+
+    @patch('jobs.runner.submit_job')
+    def test_enqueue_job_after_finished_job(self, mock_submit_job):
+        # Arrange
+        job, created = enqueue_job(JobKind.COLLECT_STORIES, self.source.id)
+        Job.objects.filter(id=job.id).update(status=JobStatus.DONE)
+
+        # Act
+        new_job, new_created = enqueue_job(JobKind.COLLECT_STORIES, self.source.id)
+
+        # Assert
+        self.assertTrue(new_created)
+        self.assertNotEqual(job.id, new_job.id)
+
+    @patch('jobs.handlers.collect_stories_from_source')
+    def test_run_job(self, mock_collect_stories_from_source):
+        # Arrange
+        mock_collect_stories_from_source.return_value = 4
+        job, created = enqueue_job(JobKind.COLLECT_STORIES, self.source.id, {'max_stories': 4})
+
+        # Act
+        run_job(job.id)
+
+        # Assert
+        job.refresh_from_db()
+        self.assertEqual(job.status, JobStatus.DONE)
+        self.assertEqual(job.progress, 100)
+        self.assertEqual(job.result, {'stories_collected': 4})
+        self.assertIsNotNone(job.finished)
+        self.assertEqual(mock_collect_stories_from_source.call_args.kwargs['budget'].limit, 4)
+
+        # A finished job is never run twice
+        self.assertIsNone(run_job(job.id))
+        mock_collect_stories_from_source.assert_called_once()
+
+    @patch('jobs.handlers.collect_stories_from_source')
+    def test_run_job_records_failures(self, mock_collect_stories_from_source):
+        # Arrange
+        mock_collect_stories_from_source.side_effect = RuntimeError("Scraping failed")
+        job, created = enqueue_job(JobKind.COLLECT_STORIES, self.source.id)
+
+        # Act
+        run_job(job.id)
+
+        # Assert
+        job.refresh_from_db()
+        self.assertEqual(job.status, JobStatus.FAILED)
+        self.assertIn("Scraping failed", job.error)
+
+    @patch('jobs.handlers.collect_stories_from_source')
+    def test_requeue_and_run_queued_jobs(self, mock_collect_stories_from_source):
+        # Arrange
+        mock_collect_stories_from_source.return_value = 0
+        job = Job.objects.create(kind=JobKind.COLLECT_STORIES, targetId=self.source.id, status=JobStatus.RUNNING)
+
+        # Act
+        requeued = requeue_interrupted_jobs()
+        jobs_run = run_queued_jobs()
+
+        # Assert
+        self.assertEqual(requeued, 1)
+        self.assertEqual(jobs_run, 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, JobStatus.DONE)
+
+    def test_requeue_merges_interrupted_job_into_queued_job(self):
+        # Arrange
+        interrupted_job = Job.objects.create(kind=JobKind.EVALUATE_STORY, targetId=1, status=JobStatus.RUNNING,
+                                             payload={'stages': ['USERNEEDS']})
+        queued_job = Job.objects.create(kind=JobKind.EVALUATE_STORY, targetId=1, payload={'stages': ['TOPICS']})
+
+        # Act
+        requeued = requeue_interrupted_jobs()
+
+        # Assert
+        self.assertEqual(requeued, 1)
+        interrupted_job.refresh_from_db()
+        queued_job.refresh_from_db()
+        self.assertEqual(interrupted_job.status, JobStatus.FAILED)
+        self.assertEqual(queued_job.payload, {'stages': ['TOPICS', 'USERNEEDS']})
@@ -1,6 +1,8 @@
 from faker import Faker
 from django.utils import timezone
-from stories.models import Story, Label, LabelType
+from stories.models import Story, Label, LabelType, StoryLabel
+from stories.caching import invalidate_cache
+from stories.search import index_stories
 from sources.models import *
 import os
 import random
@@ -10,6 +12,7 @@ import csv
 def import_sources_from_csv(csv_file_path):
     with open(csv_file_path, 'r', encoding='utf-8') as file:
         reader = csv.DictReader(file)
+        sources = []
         for row in reader:
 
             original_content = getattr(OriginalContent, row['originalContent'], OriginalContent.MIX)
@@ -37,7 +40,10 @@ def import_sources_from_csv(csv_file_path):
                 'contentQuality': content_quality
             }
 
-            Source.objects.create(**source_data)
+            sources.append(Source(**source_data))
+
+    Source.objects.bulk_create(sources, batch_size=500)
+    invalidate_cache()
 
 def clear_data():
     # Clear existing data
@@ -63,6 +69,7 @@ def populate_stories():
 
     sources = Source.objects.all()
 
+    stories = []
     for source in sources:
 
         # Create 10 stories for each source
@@ -72,7 +79,7 @@ def populate_stories():
             updated = fake.date_time_between(start_date=created, end_date='now', tzinfo=timezone.get_current_timezone())
             summary = fake.paragraph()
             story = ' '.join(fake.texts(nb_texts=20))
-            url = fake.url()
+            url = fake.unique.uri()
             if image_files:
                 random_image = random.choice(image_files)
                 image = f'story_images/{random_image}'
@@ -80,7 +87,7 @@ def populate_stories():
                 image = None
             author = fake.name()
 
-            Story.objects.create(
+            stories.append(Story(
                 title=title,
                 created=created,
                 updated=updated,
@@ -90,7 +97,14 @@ def populate_stories():
                 image=image,
                 author=author,
                 source=source
-            )
+            ))
+
+    # bulk_create skips Story.save and its signals, so derive the user need columns, index the stories and invalidate
+    # the cached API responses afterwards
+    Story.objects.bulk_create(stories, batch_size=500)
+    Story.objects.recompute_needs()
+    index_stories(stories)
+    invalidate_cache()
 
 
 def assign_random_labels():
@@ -102,7 +116,9 @@ def assign_random_labels():
     # Get all labels
     all_labels = list(Label.objects.all())
 
-    for story in stories_without_labels:
+    story_labels = []
+    story_ids = list(stories_without_labels.values_list('id', flat=True))
+    for story_id in story_ids:
         # Generate a random number of labels
         num_labels = random.randint(1, 6)
 
@@ -110,9 +126,12 @@ def assign_random_labels():
         labels = random.sample(all_labels, num_labels)
 
         # Assign the labels to the story
-        story.labels.set(labels)
+        story_labels.extend(StoryLabel(story_id=story_id, label=label) for label in labels)
+
+    StoryLabel.objects.bulk_create(story_labels, batch_size=500)
+    invalidate_cache()
 
-    print(f"Assigned random labels to {stories_without_labels.count()} stories.")
+    print(f"Assigned random labels to {len(story_ids)} stories.")
 
 def create_labels():
 
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.0/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -37,6 +38,7 @@ INSTALLED_APPS = [
     'story_evaluation.apps.StoryEvaluationConfig',
     'story_enrichment.apps.StoryEnrichmentConfig',
     'ai_utilities.apps.AiUtilitiesConfig',
+    'jobs.apps.JobsConfig',
     'corsheaders',
     'django.contrib.admin',
     'django.contrib.auth',
@@ -91,6 +93,10 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            # Seconds a connection waits for the write lock, which the concurrent collection workers take in turns
+            'timeout': 30,
+        },
     }
 }
 
@@ -161,11 +167,26 @@ SIMPLE_JWT = {
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
 }
 
-CACHES = {
-    'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+# Each server process has its own memory cache by default. Set DJANGO_CACHE_DIR to share the cache between processes
+# through files. The cache generation is kept in the database, so writes in any process make every cache stale.
+if os.getenv('DJANGO_CACHE_DIR'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.getenv('DJANGO_CACHE_DIR'),
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'OPTIONS': {'MAX_ENTRIES': 1000},
+        }
     }
-}
+
+# API cache settings
+API_CACHE_TIMEOUT = 60 * 60 * 24  # Seconds a cached list response is kept, writes to the data make it stale earlier
 
 SWAGGER_SETTINGS = {
     'USE_SESSION_AUTH': False,
@@ -187,6 +208,60 @@ SWAGGER_SETTINGS = {
     ]
 }
 
+# Story collection settings
+BROWSER_POOL_SIZE = 2  # Number of warm headless browsers shared by the dynamic scrapers
+BROWSER_POOL_MAX_PAGES = 50  # Pages a browser may render before it is recycled
+BROWSER_POOL_CHECKOUT_TIMEOUT = 120  # Seconds to wait for a free browser
+COLLECTION_MAX_CONCURRENCY = 8  # Stories collected at the same time
+COLLECTION_MAX_CONCURRENCY_PER_HOST = 2  # Stories fetched from the same website at the same time
+STORY_CONTENT_MAX_TOKENS = 3000  # Maximum (estimated) tokens of page content sent to the LLM per story
+SUMMARY_SINGLE_PASS = True  # Extract the story and its summary in one call, instead of generating and validating it separately
+COLLECTION_STORY_BUDGET = 5  # Maximum stories collected per source per run, None for no limit
+COLLECTION_REFRESH_INTERVAL = 60 * 60 * 6  # Seconds before a crawled URL is checked for changes again, None to always check
+CRAWL_MAX_CONCURRENT_SOURCES = 4  # Sources crawled at the same time by the crawl scheduler
+CRAWL_HIGH_YIELD = 5  # Stories per crawl at which the scheduler starts crawling a source more often
+
+# OpenAI client settings
+OPENAI_TIMEOUT = 60  # Seconds before a request to OpenAI times out
+OPENAI_MAX_RETRIES = 2
+OPENAI_MAX_CONNECTIONS = 20  # Keep-alive connections shared by all threads
+OPENAI_REQUESTS_PER_MINUTE = 60  # Rate limit for batched requests to OpenAI
+OPENAI_MAX_BURST = 10  # Requests that may be sent at once, before the rate limit applies
+
+# Story evaluation settings
+LABEL_BATCH_SIZE = 8  # Stories classified in a single call
+LABEL_BATCH_MAX_CONCURRENCY = 4  # Batches classified at the same time
+LABEL_BATCH_STORY_MAX_TOKENS = 750  # Maximum (estimated) tokens of the text of each story in a batch
+LABEL_SIMILARITY_THRESHOLD = 0.85  # Cosine similarity above which a new label name is mapped onto an existing label
+LOCATION_TAGGER_ENABLED = True  # Find locations with the local gazetteer, using OpenAI when it is unsure or finds no town
+GAZETTEER_MAX_AGE = 60 * 60  # Seconds before the gazetteer is rebuilt with new sources and location labels
+
+# SmartOcto user needs settings
+SMARTOCTO_API_URL = 'https://api.contentinsights.com/api/v2/analyze'
+SMARTOCTO_TIMEOUT = 30  # Seconds before a request to SmartOcto times out
+SMARTOCTO_MAX_CONCURRENCY = 4  # Stories evaluated at the same time, and keep-alive connections to SmartOcto
+SMARTOCTO_CHUNK_SIZE = 200  # Stories loaded from the database at a time
+SMARTOCTO_REQUESTS_PER_MINUTE = 120  # Rate limit for requests to SmartOcto
+SMARTOCTO_MAX_BURST = 4  # Requests that may be sent at once, before the rate limit applies
+SMARTOCTO_MAX_RETRIES = 4  # Retries of a request after rate limiting, server or network errors
+SMARTOCTO_BACKOFF = 1  # Seconds before the first retry, doubling with each retry unless the server sends Retry-After
+SMARTOCTO_MAX_BACKOFF = 60  # Maximum seconds between two attempts
+
+# LLM response cache settings
+LLM_CACHE_ENABLED = True
+LLM_CACHE_PATH = BASE_DIR / 'cache' / 'llm_responses.sqlite3'
+LLM_CACHE_MAX_ENTRIES = 50000
+LLM_CACHE_TTL = 60 * 60 * 24 * 30  # Seconds before a cached response expires, None to never expire
+
+# OpenAI Batch API settings
+BATCH_BACKEND = 'openai'  # 'openai' for the OpenAI Batch API, 'local' to answer the requests locally
+BATCH_WORK_DIR = BASE_DIR / 'cache' / 'batches'  # Request and result files of batches
+BATCH_POLL_INTERVAL = 60  # Seconds between two status checks of a batch
+BATCH_TIMEOUT = 60 * 60 * 25  # Seconds to wait for a batch before it is cancelled, OpenAI completes batches within 24 hours
+
+# Job settings
+JOBS_MAX_WORKERS = 2  # Jobs (collection, evaluation) run at the same time in each server process
+
 # CORS settings
 CORS_ALLOW_ALL_ORIGINS = True
 
@@ -0,0 +1,15 @@
+from functools import wraps
+
+from django.db import connection
+
+
+# Decorator for the functions that run in worker threads. Each worker thread uses its own database connection, which
+# has to be closed when the function is done, so connections of finished threads are not left open.
+def closes_db_connection(function):
+    @wraps(function)
+    def wrapped(*args, **kwargs):
+        try:
+            return function(*args, **kwargs)
+        finally:
+            connection.close()
+    return wrapped
@@ -0,0 +1,65 @@
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F
+
+from .models import CacheGeneration
+
+GENERATION_NAME = 'api'
+
+
+# The generation is kept in the database rather than the cache, so writes in other processes, such as the management
+# commands and the job workers, make the responses cached by every process stale
+def get_generation():
+    generation = CacheGeneration.objects.filter(name=GENERATION_NAME).values_list('value', flat=True).first()
+    if generation is None:
+        # Start from the current time, so a generation that was removed never restarts at a number that was used before
+        generation = CacheGeneration.objects.get_or_create(name=GENERATION_NAME,
+                                                           defaults={'value': time.time_ns()})[0].value
+    return generation
+
+
+def bump_generation():
+    if not CacheGeneration.objects.filter(name=GENERATION_NAME).update(value=F('value') + 1):
+        CacheGeneration.objects.get_or_create(name=GENERATION_NAME, defaults={'value': time.time_ns()})
+
+
+# Make every cached response stale. Inside a transaction the new generation is committed together with the data, so
+# it is never visible before the data it belongs to.
+def invalidate_cache():
+    bump_generation()
+
+
+def get_cache_key(request, generation):
+    user_id = request.user.pk if request.user.is_authenticated else 'anonymous'
+    request_hash = hashlib.md5(f"{request.get_full_path()}\n{request.META.get('HTTP_ACCEPT', '')}".encode('utf-8'))
+    return f'api:{generation}:{user_id}:{request_hash.hexdigest()}'
+
+
+# Cache the successful GET responses of a view method per user, under the current generation, so they are served
+# until the stories, sources or labels change, or the timeout passes
+def cache_versioned(timeout=None):
+    def decorator(view_method):
+        @wraps(view_method)
+        def wrapped(view, request, *args, **kwargs):
+            if request.method != 'GET':
+                return view_method(view, request, *args, **kwargs)
+
+            cache_key = get_cache_key(request, get_generation())
+            response = cache.get(cache_key)
+            if response is not None:
+                return response
+
+            response = view_method(view, request, *args, **kwargs)
+            if response.status_code == 200:
+                cache_timeout = timeout if timeout is not None else settings.API_CACHE_TIMEOUT
+                if hasattr(response, 'render') and callable(response.render):
+                    response.add_post_render_callback(lambda rendered: cache.set(cache_key, rendered, cache_timeout))
+                else:
+                    cache.set(cache_key, response, cache_timeout)
+            return response
+        return wrapped
+    return decorator
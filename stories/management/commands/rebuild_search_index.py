@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from stories.search import rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full text search index of the stories"
+
+    def handle(self, *args, **options):
+        indexed = rebuild_search_index()
+        self.stdout.write(f"Indexed {indexed} stories")
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from stories.caching import invalidate_cache
+from stories.models import Story
+
+
+class Command(BaseCommand):
+    help = "Find stories whose primary user need or user needs sum does not match their user needs, and repair them"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Only report the stories, without repairing them")
+
+    def handle(self, *args, **options):
+        drifted = Story.objects.needs_drift()
+        story_ids = list(drifted.values_list('id', flat=True))
+        self.stdout.write(f"Found {len(story_ids)} stories with outdated user need columns")
+        if options['dry_run'] or not story_ids:
+            return
+
+        repaired = Story.objects.needs_drift().recompute_needs()
+        invalidate_cache()
+        self.stdout.write(f"Repaired {repaired} stories")
@@ -0,0 +1,46 @@
+# Generated by Django 5.0.4 on 2026-10-18 06:36
+
+from django.db import migrations, models
+
+
+def remove_duplicate_story_urls(apps, schema_editor):
+    # Keep the most recently added story of each URL, so the URL can be made unique. The labels of the duplicates are
+    # moved to the kept story first, unless it already has them. The removed stories can not be restored when the
+    # migration is reversed.
+    Story = apps.get_model('stories', 'Story')
+    StoryLabel = apps.get_model('stories', 'StoryLabel')
+    duplicate_urls = (Story.objects.values('url').annotate(count=models.Count('id'))
+                      .filter(count__gt=1).values_list('url', flat=True))
+
+    removed_rows = {}
+    for url in list(duplicate_urls):
+        latest_id = Story.objects.filter(url=url).order_by('-id').values_list('id', flat=True).first()
+        duplicates = Story.objects.filter(url=url).exclude(id=latest_id)
+
+        for story_label in StoryLabel.objects.filter(story__in=duplicates).order_by('-story_id'):
+            if not StoryLabel.objects.filter(story_id=latest_id, label_id=story_label.label_id).exists():
+                StoryLabel.objects.filter(id=story_label.id).update(story_id=latest_id)
+
+        deleted, deleted_per_model = duplicates.delete()
+        for model, count in deleted_per_model.items():
+            removed_rows[model] = removed_rows.get(model, 0) + count
+
+    if removed_rows:
+        print(f"\n  Removed stories with duplicate URLs: "
+              f"{', '.join(f'{count} {model}' for model, count in removed_rows.items())}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stories', '0009_alter_label_type'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_story_urls, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='story',
+            name='url',
+            field=models.URLField(max_length=500, unique=True),
+        ),
+    ]
@@ -0,0 +1,43 @@
+from django.db import migrations, models
+
+
+def merge_duplicate_labels(apps, schema_editor):
+    # Fill the normalised names, merging labels that only differ in case or whitespace into the oldest one
+    Label = apps.get_model('stories', 'Label')
+    StoryLabel = apps.get_model('stories', 'StoryLabel')
+
+    labels_by_name = {}
+    for label in Label.objects.order_by('id'):
+        normalized_name = ' '.join(label.name.split()).casefold()
+        kept_label = labels_by_name.get(normalized_name)
+        if kept_label is None:
+            label.normalizedName = normalized_name
+            label.save(update_fields=['normalizedName'])
+            labels_by_name[normalized_name] = label
+            continue
+
+        # Move the stories of the duplicate to the kept label, unless the story already has the kept label
+        tagged_story_ids = set(StoryLabel.objects.filter(label=kept_label).values_list('story_id', flat=True))
+        StoryLabel.objects.filter(label=label).exclude(story_id__in=tagged_story_ids).update(label=kept_label)
+        label.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stories', '0010_alter_story_url'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='label',
+            name='normalizedName',
+            field=models.CharField(editable=False, max_length=200, null=True),
+        ),
+        migrations.RunPython(merge_duplicate_labels, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='label',
+            name='normalizedName',
+            field=models.CharField(editable=False, max_length=200, unique=True),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.0.4 on 2026-10-18 06:53
+
+from django.db import migrations, models
+from django.db.models import Q
+
+
+def set_needs_status(apps, schema_editor):
+    # Stories with any user need score were evaluated before, stories recorded as failed are failed
+    Story = apps.get_model('stories', 'Story')
+    UserNeedsFailure = apps.get_model('story_evaluation', 'UserNeedsFailure')
+
+    Story.objects.filter(~Q(needsKnow=0) | ~Q(needsUnderstand=0) | ~Q(needsFeel=0) | ~Q(needsDo=0)) \
+        .update(needsStatus='EVALUATED')
+    Story.objects.filter(id__in=UserNeedsFailure.objects.values('story_id')).update(needsStatus='FAILED')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sources', '0001_squashed_0002_alter_source_commercialpublisher_and_more'),
+        ('stories', '0011_label_normalizedname'),
+        ('story_evaluation', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='story',
+            name='needsStatus',
+            field=models.CharField(choices=[('PENDING', 'Niet beoordeeld'), ('EVALUATED', 'Beoordeeld'), ('FAILED', 'Mislukt')], default='PENDING', max_length=20),
+        ),
+        migrations.RunPython(set_needs_status, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='story',
+            name='created',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='story',
+            name='updated',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='story',
+            index=models.Index(fields=['needsStatus', 'id'], name='story_needs_status_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.0.4 on 2026-10-18 06:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sources', '0001_squashed_0002_alter_source_commercialpublisher_and_more'),
+        ('stories', '0012_story_needsstatus'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='story',
+            name='created',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='story',
+            index=models.Index(fields=['created', 'id'], name='story_created_id_idx'),
+        ),
+    ]
@@ -12,10 +12,20 @@ COLORS = ['#007bff', '#28a745', '#17a2b8', '#ffc107']  # Blue, Green, Cyan, Yell
 LABEL_COLORS = {label_type: color for label_type, color in zip(LabelType, COLORS)}
 
 
+def normalize_label_name(name):
+    # Labels differing only in case or whitespace are the same label
+    return ' '.join(name.split()).casefold()
+
+
 class Label(models.Model):
     name = models.CharField(max_length=200, unique=True)
+    normalizedName = models.CharField(max_length=200, unique=True, editable=False)
     type = models.CharField(max_length=20, choices=LabelType.choices)
 
+    def save(self, *args, **kwargs):
+        self.normalizedName = normalize_label_name(self.name)
+        super().save(*args, **kwargs)
+
     def label_color(self):
         return LABEL_COLORS[self.type]
 
@@ -23,14 +33,63 @@ class Label(models.Model):
         return f'{self.name}: {self.type}'
 
 
+class NeedsStatus(models.TextChoices):
+    PENDING = 'PENDING', 'Niet beoordeeld'
+    EVALUATED = 'EVALUATED', 'Beoordeeld'
+    FAILED = 'FAILED', 'Mislukt'
+
+
+# The user needs in the order in which they win a tie for the primary user need
+USER_NEEDS = [('needsKnow', 'Know'), ('needsUnderstand', 'Understand'), ('needsFeel', 'Feel'), ('needsDo', 'Do')]
+
+
+def needs_sum_expression():
+    return models.F('needsKnow') + models.F('needsUnderstand') + models.F('needsFeel') + models.F('needsDo')
+
+
+def needs_primary_expression():
+    # The first user need that is at least as high as all user needs after it, and higher than all user needs before
+    # it, which is the user need max() picks in Story.set_needs_totals
+    whens = []
+    for index, (field, name) in enumerate(USER_NEEDS[:-1]):
+        condition = models.Q()
+        for other_field, other_name in USER_NEEDS[index + 1:]:
+            condition &= models.Q(**{f'{field}__gte': models.F(other_field)})
+        whens.append(models.When(condition, then=models.Value(name)))
+    return models.Case(*whens, default=models.Value(USER_NEEDS[-1][1]), output_field=models.CharField())
+
+
+class StoryQuerySet(models.QuerySet):
+    def recompute_needs(self):
+        # Derive the primary user need and the sum of the user needs of all stories in a single statement, for
+        # stories whose user needs were written with bulk_update or update
+        return self.update(needsSum=needs_sum_expression(), needsPrimary=needs_primary_expression())
+
+    def needs_drift(self):
+        # Stories whose derived user need columns do not match their user needs
+        return self.alias(expectedNeedsSum=needs_sum_expression(), expectedNeedsPrimary=needs_primary_expression()) \
+            .exclude(needsSum=models.F('expectedNeedsSum'), needsPrimary=models.F('expectedNeedsPrimary'))
+
+    def iter_chunks(self, chunk_size, fields=('id', 'story')):
+        # Yield the stories in lists of at most chunk_size, paginating on the id instead of an offset, and loading only
+        # the given fields, so memory use stays flat however many stories there are
+        last_id = 0
+        while True:
+            chunk = list(self.filter(id__gt=last_id).order_by('id').only(*fields)[:chunk_size])
+            if not chunk:
+                return
+            yield chunk
+            last_id = chunk[-1].id
+
+
 class Story(models.Model):
     title = models.CharField(max_length=200)
     created = models.DateTimeField(blank=True, null=True)
-    updated = models.DateTimeField(blank=True, null=True)
+    updated = models.DateTimeField(blank=True, null=True, db_index=True)
     author = models.CharField(max_length=200, blank=True)
     story = models.TextField(blank=True)
     summary = models.TextField()
-    url = models.URLField()
+    url = models.URLField(max_length=500, unique=True)
     image = models.FileField(upload_to="story_images/", blank=True)
     image_url = models.URLField(blank=True)
     source = models.ForeignKey(Source, on_delete=models.CASCADE, null=True)
@@ -42,23 +101,30 @@ class Story(models.Model):
     needsSum = models.IntegerField(default=0)
 
     needsPrimary = models.CharField(max_length=20, blank=True)
+    needsStatus = models.CharField(max_length=20, choices=NeedsStatus.choices, default=NeedsStatus.PENDING)
 
     labels = models.ManyToManyField(Label, through='StoryLabel', blank=True)
 
-    def save(self, *args, **kwargs):
-        user_needs = {
-            'know': self.needsKnow,
-            'understand': self.needsUnderstand,
-            'feel': self.needsFeel,
-            'do': self.needsDo
-        }
-        max_score_field = max(user_needs, key=user_needs.get)
-        self.needsPrimary = max_score_field.capitalize()
+    objects = StoryQuerySet.as_manager()
 
-        self.needsSum = self.needsKnow + self.needsUnderstand + self.needsFeel + self.needsDo
+    class Meta:
+        indexes = [
+            models.Index(fields=['needsStatus', 'id'], name='story_needs_status_idx'),
+            # Serves the newest first ordering and the cursor pagination of the API, and lookups by created date
+            models.Index(fields=['created', 'id'], name='story_created_id_idx'),
+        ]
 
+    def save(self, *args, **kwargs):
+        self.set_needs_totals()
         super().save(*args, **kwargs)
 
+    # Derive the primary user need and the sum of the user needs from the scores. Bulk writes use
+    # StoryQuerySet.recompute_needs instead, which derives them the same way in the database.
+    def set_needs_totals(self):
+        user_needs = {name: getattr(self, field) for field, name in USER_NEEDS}
+        self.needsPrimary = max(user_needs, key=user_needs.get)
+        self.needsSum = sum(user_needs.values())
+
     def __str__(self):
         return self.title
 
@@ -73,3 +139,13 @@ class StoryLabel(models.Model):
 
     def __str__(self):
         return f'{self.story.title} - {self.label.name}'
+
+
+# Counters in the database that every process reads, so a write in any process makes the cached API responses of all
+# processes stale. See stories/caching.py.
+class CacheGeneration(models.Model):
+    name = models.CharField(max_length=100, unique=True)
+    value = models.BigIntegerField()
+
+    def __str__(self):
+        return f'{self.name}: {self.value}'
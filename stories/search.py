@@ -0,0 +1,217 @@
+import re
+import unicodedata
+
+from django.db import connection
+from django.db.models import Q, Value, FloatField
+
+from .models import Story
+
+SEARCH_TABLE = 'stories_story_search'
+
+# The story fields that are searched
+SEARCH_FIELDS = ('title', 'summary', 'story', 'author')
+
+# Weights of the title, summary, story and author columns when ranking the matches
+COLUMN_WEIGHTS = (10.0, 4.0, 1.0, 2.0)
+
+STOPWORDS = {
+    'aan', 'al', 'alles', 'als', 'altijd', 'andere', 'ben', 'bij', 'daar', 'dan', 'dat', 'de', 'der', 'deze', 'die',
+    'dit', 'doch', 'doen', 'door', 'dus', 'een', 'eens', 'en', 'er', 'ge', 'geen', 'geweest', 'haar', 'had', 'heb',
+    'hebben', 'heeft', 'hem', 'het', 'hier', 'hij', 'hoe', 'hun', 'iemand', 'iets', 'ik', 'in', 'is', 'ja', 'je',
+    'kan', 'kon', 'kunnen', 'maar', 'me', 'meer', 'men', 'met', 'mij', 'mijn', 'moet', 'na', 'naar', 'niet', 'niets',
+    'nog', 'nu', 'of', 'om', 'omdat', 'onder', 'ons', 'ook', 'op', 'over', 'reeds', 'te', 'tegen', 'toch', 'toen',
+    'tot', 'u', 'uit', 'uw', 'van', 'veel', 'voor', 'want', 'waren', 'was', 'wat', 'werd', 'wezen', 'wie', 'wil',
+    'worden', 'wordt', 'zal', 'ze', 'zelf', 'zich', 'zij', 'zijn', 'zo', 'zonder', 'zou',
+}
+
+VOWELS = 'aeiouyè'
+
+
+def tokenize(text):
+    # Lowercase words without accents, so 'Café' and 'cafe' or 'geërgerd' and 'geergerd' match. Single letters, such
+    # as the s of "café's", are left out.
+    text = unicodedata.normalize('NFKD', (text or '').lower())
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return re.findall(r'\w\w+', text)
+
+
+def _regions(word):
+    # R1 is the part of the word after the first non-vowel following a vowel, starting at the fourth letter at the
+    # earliest. R2 is the same region within R1.
+    def region_start(start):
+        for i in range(start + 1, len(word)):
+            if word[i] not in VOWELS and word[i - 1] in VOWELS:
+                return i + 1
+        return len(word)
+
+    r1 = max(region_start(0), 3)
+    return r1, region_start(r1)
+
+
+def _undouble(word):
+    return word[:-1] if word.endswith(('kk', 'dd', 'tt')) else word
+
+
+def _valid_en_ending(stem):
+    return bool(stem) and stem[-1] not in VOWELS and not stem.endswith('gem')
+
+
+def _remove_en(word, r1):
+    for suffix in ('ene', 'en'):
+        if word.endswith(suffix) and len(word) - len(suffix) >= r1 and _valid_en_ending(word[:-len(suffix)]):
+            return _undouble(word[:-len(suffix)])
+    return word
+
+
+def _remove_e(word, r1):
+    if word.endswith('e') and len(word) - 1 >= r1 and len(word) > 1 and word[-2] not in VOWELS:
+        return _undouble(word[:-1]), True
+    return word, False
+
+
+# Dutch stemmer after the Snowball algorithm, so different forms of a word ('scholen', 'school') are found together
+def stem(word):
+    if len(word) <= 3:
+        return word
+
+    # Mark the y and i that act as consonants
+    chars = list(word)
+    for i, char in enumerate(chars):
+        if char == 'y' and (i == 0 or chars[i - 1] in VOWELS):
+            chars[i] = 'Y'
+        elif char == 'i' and 0 < i < len(chars) - 1 and chars[i - 1] in VOWELS and chars[i + 1] in VOWELS:
+            chars[i] = 'I'
+    word = ''.join(chars)
+    r1, r2 = _regions(word)
+
+    # Step 1: plural and inflection endings
+    if word.endswith('heden'):
+        if len(word) - 5 >= r1:
+            word = word[:-5] + 'heid'
+    elif word.endswith(('ene', 'en')):
+        word = _remove_en(word, r1)
+    elif word.endswith(('se', 's')):
+        suffix = 'se' if word.endswith('se') else 's'
+        stem_part = word[:-len(suffix)]
+        if len(stem_part) >= r1 and stem_part and stem_part[-1] not in VOWELS and stem_part[-1] != 'j':
+            word = stem_part
+
+    # Step 2: a final e
+    word, e_found = _remove_e(word, r1)
+
+    # Step 3a: -heid
+    if word.endswith('heid') and len(word) - 4 >= r2 and not word[:-4].endswith('c'):
+        word = _remove_en(word[:-4], r1)
+
+    # Step 3b: derivational endings
+    if word.endswith(('end', 'ing')):
+        if len(word) - 3 >= r2:
+            word = word[:-3]
+            if word.endswith('ig') and len(word) - 2 >= r2 and not word[:-2].endswith('e'):
+                word = word[:-2]
+            else:
+                word = _undouble(word)
+    elif word.endswith('ig'):
+        if len(word) - 2 >= r2 and not word[:-2].endswith('e'):
+            word = word[:-2]
+    elif word.endswith('lijk'):
+        if len(word) - 4 >= r2:
+            word, e_found = _remove_e(word[:-4], r1)
+    elif word.endswith('baar'):
+        if len(word) - 4 >= r2:
+            word = word[:-4]
+    elif word.endswith('bar'):
+        if len(word) - 3 >= r2 and e_found:
+            word = word[:-3]
+
+    # Step 4: undouble a vowel in a final closed syllable, 'maan' becomes 'man'
+    if len(word) >= 4 and word[-1] not in VOWELS + 'I' and word[-2] == word[-3] and word[-2] in 'aeou' \
+            and word[-4] not in VOWELS:
+        word = word[:-2] + word[-1]
+
+    return word.replace('Y', 'y').replace('I', 'i')
+
+
+def prepare_text(text):
+    # The stemmed words of the text, as they are stored in the search index
+    return ' '.join(stem(word) for word in tokenize(text) if word not in STOPWORDS)
+
+
+def build_match_query(query):
+    # Every word of the query has to occur in the story, the last one may be the start of a word
+    terms = [stem(word) for word in tokenize(query) if word not in STOPWORDS]
+    if not terms:
+        return None
+    terms = [f'"{term}"' for term in terms]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def is_search_index_available():
+    return connection.vendor == 'sqlite'
+
+
+def _story_row(story):
+    return story.id, prepare_text(story.title), prepare_text(story.summary), prepare_text(story.story), \
+        prepare_text(story.author)
+
+
+def index_stories(stories):
+    if not is_search_index_available():
+        return
+    rows = [_story_row(story) for story in stories]
+    if not rows:
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(f'DELETE FROM {SEARCH_TABLE} WHERE rowid = %s', [(row[0],) for row in rows])
+        cursor.executemany(f'INSERT INTO {SEARCH_TABLE} (rowid, title, summary, story, author) '
+                           f'VALUES (%s, %s, %s, %s, %s)', rows)
+
+
+def index_story(story):
+    index_stories([story])
+
+
+def remove_story(story_id):
+    if not is_search_index_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {SEARCH_TABLE} WHERE rowid = %s', [story_id])
+
+
+def rebuild_search_index(chunk_size=500):
+    if not is_search_index_available():
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {SEARCH_TABLE}')
+
+    indexed = 0
+    for chunk in Story.objects.all().iter_chunks(chunk_size, fields=('id', *SEARCH_FIELDS)):
+        index_stories(chunk)
+        indexed += len(chunk)
+    return indexed
+
+
+# Filter the stories on the search query, annotating them with a searchRank where lower is more relevant. Returns the
+# queryset unchanged when the query has no words to search for.
+def search_stories(queryset, query):
+    match_query = build_match_query(query)
+    if match_query is None:
+        return queryset
+
+    if not is_search_index_available():
+        condition = Q()
+        for word in tokenize(query):
+            condition &= Q(title__icontains=word) | Q(summary__icontains=word) | Q(story__icontains=word) \
+                | Q(author__icontains=word)
+        return queryset.filter(condition).annotate(searchRank=Value(0.0, output_field=FloatField()))
+
+    # Join the stories on the search table, so the query is matched once and the rank comes with each matched row
+    weights = ', '.join(str(weight) for weight in COLUMN_WEIGHTS)
+    table = queryset.model._meta.db_table
+    return queryset.extra(
+        select={'searchRank': f'bm25({SEARCH_TABLE}, {weights})'},
+        tables=[SEARCH_TABLE],
+        where=[f'{SEARCH_TABLE}.rowid = "{table}"."id"', f'{SEARCH_TABLE} MATCH %s'],
+        params=[match_query],
+    )
@@ -0,0 +1,42 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from sources.models import Source
+
+from .caching import invalidate_cache
+from .models import Story, Label, StoryLabel
+from .search import SEARCH_FIELDS, index_story, remove_story
+
+
+# Keep the search index in sync with the stories. Bulk writes that change the text of stories, which send no signals,
+# have to call index_stories themselves.
+@receiver(post_save, sender=Story)
+def index_saved_story(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and not set(update_fields) & set(SEARCH_FIELDS):
+        return
+    index_story(instance)
+
+
+@receiver(post_delete, sender=Story)
+def remove_deleted_story(sender, instance, **kwargs):
+    remove_story(instance.id)
+
+
+# Make the cached API responses stale when the data changes. Bulk writes, which send no signals, have to call
+# invalidate_cache themselves.
+@receiver(post_save, sender=Story)
+@receiver(post_save, sender=Source)
+@receiver(post_save, sender=Label)
+@receiver(post_save, sender=StoryLabel)
+@receiver(post_delete, sender=Story)
+@receiver(post_delete, sender=Source)
+@receiver(post_delete, sender=Label)
+@receiver(post_delete, sender=StoryLabel)
+def invalidate_cache_on_change(sender, **kwargs):
+    invalidate_cache()
+
+
+@receiver(m2m_changed, sender=Story.labels.through)
+def invalidate_cache_on_labels_change(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        invalidate_cache()
@@ -1,6 +1,16 @@
+from io import StringIO
+from itertools import product
+from unittest.mock import patch
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import F
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
-from .models import Story
+from django.core.cache import cache
+from .caching import get_generation, bump_generation
+from .models import Story, Label, CacheGeneration
+from .search import stem, prepare_text, build_match_query, search_stories, rebuild_search_index
 from sources.models import Source
 from django.urls import reverse
 
@@ -94,3 +104,151 @@ class StoryDetailTemplateTestCase(BaseTestCase):
         self.assertContains(response, self.story.source.name)
         self.assertContains(response, f'{self.story.needsSum}')
         self.assertContains(response, f'{self.story.needsPrimary}')
+
+    def test_story_index_sorted_by_needs_sum(self):
+        response = self.client.get(reverse('story_index'), {'sort': '-needs_sum'})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, self.story.title)
+
+
+class StoryNeedsRecomputeTestCase(BaseTestCase):
+    def test_recompute_needs_matches_save(self):
+        # Arrange, every combination of ties between the user needs
+        combinations = list(product([0, 1, 2], repeat=4))
+        Story.objects.bulk_create([
+            Story(title=f'Story {i}', summary='Summary', url=f'https://example.com/{i}', needsKnow=know,
+                  needsUnderstand=understand, needsFeel=feel, needsDo=do)
+            for i, (know, understand, feel, do) in enumerate(combinations)
+        ])
+
+        # Act
+        Story.objects.recompute_needs()
+
+        # Assert
+        for story in Story.objects.all():
+            needs_sum, needs_primary = story.needsSum, story.needsPrimary
+            story.set_needs_totals()
+            self.assertEqual((needs_sum, needs_primary), (story.needsSum, story.needsPrimary), story.title)
+
+    def test_repair_story_needs_fixes_drift(self):
+        # Arrange
+        Story.objects.filter(id=self.story.id).update(needsKnow=90)
+
+        # Act
+        drifted = list(Story.objects.needs_drift())
+        call_command('repair_story_needs', stdout=StringIO())
+
+        # Assert
+        self.assertEqual(drifted, [self.story])
+        self.story.refresh_from_db()
+        self.assertEqual((self.story.needsSum, self.story.needsPrimary), (210, 'Know'))
+        self.assertFalse(Story.objects.needs_drift().exists())
+
+    def test_iter_chunks_paginates_on_id(self):
+        # Arrange
+        Story.objects.bulk_create([Story(title=f'Story {i}', summary='Summary', url=f'https://example.com/{i}')
+                                   for i in range(5)])
+
+        # Act
+        with self.assertNumQueries(3):
+            chunks = list(Story.objects.order_by('-title').iter_chunks(4))
+
+        # Assert
+        story_ids = [story.id for chunk in chunks for story in chunk]
+        self.assertEqual([len(chunk) for chunk in chunks], [4, 2])
+        self.assertEqual(story_ids, sorted(Story.objects.values_list('id', flat=True)))
+        self.assertEqual(chunks[0][0].get_deferred_fields(), {field.attname for field in Story._meta.concrete_fields} - {'id', 'story'})
+
+
+class StorySearchTestCase(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.school_story = Story.objects.create(title='Nieuwe school in Tilburg', summary='Summary', url='https://example.com/school',
+                                                 story='De gemeente opent een school.')
+        self.other_story = Story.objects.create(title='Wegwerkzaamheden', summary='Summary', url='https://example.com/weg',
+                                                story='Kinderen van de scholen in Tilburg fietsen om.')
+
+    def test_stem_matches_word_forms(self):
+        self.assertEqual(stem('scholen'), stem('school'))
+        self.assertEqual(stem('kinderen'), stem('kinder'))
+        self.assertEqual(prepare_text('De Café’s van Tilburg'), 'caf tilburg')
+        self.assertEqual(build_match_query('de scholen in Til'), '"schol" "til"*')
+
+    def test_search_stories_ranks_title_matches_first(self):
+        stories = list(search_stories(Story.objects.all(), 'scholen').order_by('searchRank'))
+        self.assertEqual(stories, [self.school_story, self.other_story])
+        self.assertEqual(list(search_stories(Story.objects.all(), 'kinderen tilb')), [self.other_story])
+
+    def test_search_stories_matches_the_query_once(self):
+        with CaptureQueriesContext(connection) as queries:
+            stories = list(search_stories(Story.objects.all(), 'scholen').order_by('searchRank'))
+
+        self.assertEqual(stories, [self.school_story, self.other_story])
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(queries[0]['sql'].count('MATCH'), 1)
+
+    def test_search_stories_without_search_index_searches_all_columns(self):
+        with patch('stories.search.is_search_index_available', return_value=False):
+            self.assertEqual(list(search_stories(Story.objects.all(), 'test author')), [self.story])
+            self.assertEqual(list(search_stories(Story.objects.all(), 'Kinderen Tilburg')), [self.other_story])
+
+    def test_search_index_follows_saves_and_deletes(self):
+        self.other_story.title = 'Fietsers omgeleid'
+        self.other_story.save()
+        self.school_story.delete()
+
+        self.assertEqual(list(search_stories(Story.objects.all(), 'fietser')), [self.other_story])
+        self.assertFalse(search_stories(Story.objects.all(), 'gemeente').exists())
+
+    def test_rebuild_search_index(self):
+        Story.objects.filter(id=self.other_story.id).update(title='Fietsers omgeleid')
+
+        self.assertFalse(search_stories(Story.objects.all(), 'omgeleid').exists())
+        self.assertEqual(rebuild_search_index(chunk_size=2), 3)
+        self.assertEqual(list(search_stories(Story.objects.all(), 'omgeleid')), [self.other_story])
+
+    def test_story_index_search(self):
+        response = self.client.get(reverse('story_index'), {'q': 'school'})
+        self.assertEqual(list(response.context['stories']), [self.school_story, self.other_story])
+        self.assertNotContains(response, self.story.title)
+
+
+class StoryCacheGenerationTestCase(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+    def test_generation_is_shared_through_the_database(self):
+        generation = get_generation()
+        bump_generation()
+        self.assertEqual(get_generation(), generation + 1)
+
+        # A cleared cache keeps the generation, and a write by another process is seen
+        cache.clear()
+        self.assertEqual(get_generation(), generation + 1)
+        CacheGeneration.objects.update(value=F('value') + 1)
+        self.assertEqual(get_generation(), generation + 2)
+
+    def test_removed_generation_does_not_restart(self):
+        generation = get_generation()
+        CacheGeneration.objects.all().delete()
+
+        bump_generation()
+
+        self.assertGreater(get_generation(), generation)
+
+    def test_writes_bump_the_generation(self):
+        label = Label.objects.create(name='Verkeer', type='TOPIC')
+        writes = [
+            lambda: self.story.labels.add(label),
+            lambda: self.story.labels.clear(),
+            lambda: label.save(),
+            lambda: self.source.save(),
+            lambda: self.story.delete(),
+        ]
+
+        for write in writes:
+            generation = get_generation()
+            write()
+            self.assertGreater(get_generation(), generation)
+
@@ -1,6 +1,6 @@
 from django.shortcuts import render
-from django.db.models import Sum
 from stories.models import Story, Source, Label
+from stories.search import search_stories
 from itertools import groupby
 from operator import attrgetter
 
@@ -11,14 +11,15 @@ def story_index(request):
     filter_created = request.GET.get('created', '')
     filter_source = request.GET.get('source', '')
     label_id = request.GET.get('label_id', '')
+    query = request.GET.get('q', '')
 
-    # Apply sorting criteria
-    if sort_criteria == '-created':
+    # Apply sorting criteria, without a search query the relevance order falls back to the default order
+    if sort_criteria in ('-updated', 'relevance'):
+        stories = Story.objects.order_by('-updated')
+    elif sort_criteria == '-created':
         stories = Story.objects.order_by('-created')
     elif sort_criteria == 'created':
         stories = Story.objects.order_by('created')
-    elif sort_criteria == '-updated':
-        stories = Story.objects.order_by('-updated')
     elif sort_criteria == 'updated':
         stories = Story.objects.order_by('updated')
     elif sort_criteria == 'title':
@@ -26,9 +27,7 @@ def story_index(request):
     elif sort_criteria == 'source':
         stories = Story.objects.order_by('source__name')
     elif sort_criteria == '-needs_sum':
-        stories = Story.objects.annotate(
-            needsSum=Sum('needsKnow') + Sum('needsUnderstand') + Sum('needsFeel') + Sum('needsDo')
-        ).order_by('-needsSum')
+        stories = Story.objects.order_by('-needsSum')
     else:
         stories = Story.objects.all()
 
@@ -41,6 +40,11 @@ def story_index(request):
         stories = stories.filter(source_id=filter_source)
     if label_id:
         stories = stories.filter(labels__id=label_id)
+    if query:
+        stories = search_stories(stories, query)
+        # Unless another sort order is chosen, the most relevant stories come first
+        if 'sort' not in request.GET or sort_criteria == 'relevance':
+            stories = stories.order_by('searchRank')
 
     sources = Source.objects.order_by('name')
 
@@ -1,3 +1,17 @@
 from django.contrib import admin
+from story_collection.models import SourceSchedule, CrawledUrl
 
-# Register your models here.
+
+class SourceScheduleAdmin(admin.ModelAdmin):
+    list_display = ('source', 'nextDue', 'lastCrawled', 'lastYield', 'intervalFactor')
+
+
+admin.site.register(SourceSchedule, SourceScheduleAdmin)
+
+
+class CrawledUrlAdmin(admin.ModelAdmin):
+    list_display = ('url', 'source', 'lastCrawled')
+    search_fields = ('url',)
+
+
+admin.site.register(CrawledUrl, CrawledUrlAdmin)
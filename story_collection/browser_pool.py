@@ -0,0 +1,168 @@
+import atexit
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from selenium import webdriver
+from selenium.webdriver.chrome.options import Options
+from selenium.webdriver.chrome.service import Service
+
+
+def create_chrome_driver():
+    # Setup Chrome options
+    chrome_options = Options()
+    chrome_options.add_argument("--headless")  # Ensure GUI is off
+    chrome_options.add_argument("--no-sandbox")
+    chrome_options.add_argument("--disable-dev-shm-usage")
+    chrome_options.add_argument("--log-level=3")
+
+    webdriver_service = Service('/usr/bin/chromedriver')
+    return webdriver.Chrome(service=webdriver_service, options=chrome_options)
+
+
+class PooledDriver:
+    def __init__(self, driver):
+        self.driver = driver
+        self.pages = 0
+
+
+# Bounded pool of warm (headless) browser sessions, shared by the browser based scrapers.
+# Drivers are reset between pages, recycled after max_pages pages or when a page crashes them, and quit at exit.
+class BrowserPool:
+    def __init__(self, driver_factory=create_chrome_driver, size=2, max_pages=50, checkout_timeout=120):
+        self.driver_factory = driver_factory
+        self.size = size
+        self.max_pages = max_pages
+        self.checkout_timeout = checkout_timeout
+
+        self._slots = threading.BoundedSemaphore(size)
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._closed = False
+        self._stats = {
+            'pages': 0,
+            'drivers_started': 0,
+            'drivers_recycled': 0,
+            'wait_time': 0.0,
+            'render_time': 0.0,
+            'last_wait_time': 0.0,
+            'last_render_time': 0.0,
+        }
+
+    @contextmanager
+    def driver(self):
+        # Wait for a free slot in the pool
+        wait_start = time.monotonic()
+        if not self._slots.acquire(timeout=self.checkout_timeout):
+            raise TimeoutError(f"No browser became available within {self.checkout_timeout} seconds")
+        wait_time = time.monotonic() - wait_start
+
+        try:
+            pooled_driver = self._checkout()
+        except Exception:
+            self._slots.release()
+            raise
+
+        healthy = False
+        render_start = time.monotonic()
+        try:
+            yield pooled_driver.driver
+            healthy = True
+        finally:
+            render_time = time.monotonic() - render_start
+            self._record(wait_time, render_time)
+            self._checkin(pooled_driver, healthy)
+            self._slots.release()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        pages = stats['pages']
+        stats['average_wait_time'] = stats['wait_time'] / pages if pages else 0.0
+        stats['average_render_time'] = stats['render_time'] / pages if pages else 0.0
+        return stats
+
+    def close(self):
+        self._closed = True
+        while True:
+            try:
+                pooled_driver = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._quit(pooled_driver)
+
+    def _checkout(self):
+        if self._closed:
+            raise RuntimeError("The browser pool has been closed")
+
+        # Prefer the most recently used (warm) driver, otherwise start a new one
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        pooled_driver = PooledDriver(self.driver_factory())
+        with self._lock:
+            self._stats['drivers_started'] += 1
+        return pooled_driver
+
+    def _checkin(self, pooled_driver, healthy):
+        pooled_driver.pages += 1
+
+        # Recycle drivers that crashed, served their maximum amount of pages, or outlived the pool
+        if not healthy or pooled_driver.pages >= self.max_pages or self._closed:
+            self._recycle(pooled_driver)
+            return
+
+        # Reset the driver, so no state leaks into the next page
+        try:
+            pooled_driver.driver.delete_all_cookies()
+            pooled_driver.driver.get('about:blank')
+        except Exception as e:
+            print(f"An error occurred while resetting a browser, recycling it: {e}")
+            self._recycle(pooled_driver)
+            return
+
+        self._idle.put(pooled_driver)
+
+    def _recycle(self, pooled_driver):
+        self._quit(pooled_driver)
+        with self._lock:
+            self._stats['drivers_recycled'] += 1
+
+    def _quit(self, pooled_driver):
+        try:
+            pooled_driver.driver.quit()
+        except Exception as e:
+            print(f"An error occurred while closing a browser: {e}")
+
+    def _record(self, wait_time, render_time):
+        with self._lock:
+            self._stats['pages'] += 1
+            self._stats['wait_time'] += wait_time
+            self._stats['render_time'] += render_time
+            self._stats['last_wait_time'] = wait_time
+            self._stats['last_render_time'] = render_time
+
+
+_browser_pool = None
+_browser_pool_lock = threading.Lock()
+
+
+def get_browser_pool():
+    global _browser_pool
+    with _browser_pool_lock:
+        if _browser_pool is None:
+            _browser_pool = BrowserPool(
+                size=settings.BROWSER_POOL_SIZE,
+                max_pages=settings.BROWSER_POOL_MAX_PAGES,
+                checkout_timeout=settings.BROWSER_POOL_CHECKOUT_TIMEOUT,
+            )
+            atexit.register(_browser_pool.close)
+        return _browser_pool
+
+
+def browser_pool_started():
+    return _browser_pool is not None
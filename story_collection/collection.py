@@ -1,11 +1,27 @@
 import json
 
-from .models import Source, Story
+from .models import Source, Story, NeedsStatus
 from ai_utilities.openai_utils import process_content_with_openai, JSON_SCHEMAS
-from .scraping_utils import get_scraper, extract_all_urls, extract_story_content
+from .scraping_utils import scrape_url, fetch_page, extract_all_urls, extract_story_content
+from .browser_pool import get_browser_pool, browser_pool_started
+from .concurrency import HostLimiter, StoryBudget
+from .url_filter import prefilter_urls
+from .summary_checks import MAX_SUMMARY_WORDS, check_summary, truncate_summary
+from .seen_urls import get_crawled_url, is_recently_crawled, is_known_story_url, get_story_url, record_crawled_url, \
+    hash_content
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from django.conf import settings
 from django.db import models
+from news_hyperlocalizer.threads import closes_db_connection
 from datetime import datetime
 
+# Amount of known story URLs of a source used to learn its URL patterns
+KNOWN_STORY_URLS_SAMPLE_SIZE = 200
+
+SUMMARY_SETUP_PROMPT = "You are a helpful assistant designed to output JSON. " \
+                       "Your task is to write a summary of the given story, in the same language as the story."
+SUMMARY_ANSWER_FORMAT = f"Please write a summary of maximum {MAX_SUMMARY_WORDS} words based on the story."
+
 
 def extract_urls_from_source(source):
     try:
@@ -18,13 +34,19 @@ def extract_urls_from_source(source):
                 return []
 
         # Collect the HTML content from the source
-        scraper = get_scraper(source.website)
-        html_content = scraper.scrape_website(source.website)
+        html_content = scrape_url(source.website)
         if html_content is None:
             return []
 
         urls = extract_all_urls(html_content, source.website)
-        content = '\n'.join(urls)
+
+        # Pre-filter the URLs locally, so only the ambiguous ones have to be judged by OpenAI
+        story_urls, ambiguous_urls = prefilter_urls(urls, source.website, get_known_story_urls(source))
+        print(f"Pre-filtered {len(urls)} URLs from source '{source.name}': {len(story_urls)} likely stories, "
+              f"{len(ambiguous_urls)} ambiguous")
+        if not ambiguous_urls:
+            return story_urls
+        content = '\n'.join(ambiguous_urls)
 
         # Process content with OpenAI
         setup_prompt = "You are a helpful assistant designed to output JSON. " \
@@ -32,16 +54,16 @@ def extract_urls_from_source(source):
                        "and which are not, and return only those that may be news stories. "
         answer_format = "Please return the URLs to the news stories in a JSON format " \
                         "according to the schema provided below."
-        openai_result = process_content_with_openai(content, setup_prompt, answer_format,
+        openai_result = process_content_with_openai(setup_prompt, content, answer_format,
                                                     JSON_SCHEMAS['url_collection'])
         if openai_result is None:
-            return []
+            return story_urls
 
         # Parse the URLs from the OpenAI result
         try:
-            urls = json.loads(openai_result)['items']
+            urls = list(dict.fromkeys(story_urls + json.loads(openai_result)['items']))
         except json.JSONDecodeError:
-            return []
+            return story_urls
 
     except Exception:
         return []
@@ -49,9 +71,17 @@ def extract_urls_from_source(source):
         return urls
 
 
+def get_known_story_urls(source):
+    # The most recent story URLs of the source, from which the URL pre-filter learns its URL patterns
+    return list(Story.objects.filter(source_id=source.id).order_by('-id')
+                .values_list('url', flat=True)[:KNOWN_STORY_URLS_SAMPLE_SIZE])
+
+
 def interpret_html_content(html_content):
-    story_content = extract_story_content(html_content)
+    return interpret_story_content(extract_story_content(html_content))
 
+
+def interpret_story_content(story_content):
     # Convert story_content to a string if it's not already
     if not isinstance(story_content, str):
         story_content = str(story_content)
@@ -61,12 +91,23 @@ def interpret_html_content(html_content):
                    "the given content, which includes the extracted text content, meta properties and images of a " \
                    "HTML page. Any reference to publication, creation or release dates should be considered as the " \
                    "'created' date. "
-    answer_format = "Please return the story in a JSON format, extracting the following properties from the HTML " \
-                    "content: " \
-                    "title, created, updated, author, story, image_url" \
-                    "If you cannot find one of these properties, you can leave it as a blank string."
-    openai_result = process_content_with_openai(setup_prompt, story_content, answer_format,
-                                                JSON_SCHEMAS['story_collection'])
+    if settings.SUMMARY_SINGLE_PASS:
+        # Write and check the summary in the same call, so no separate summary calls are needed for most stories
+        answer_format = "Please return the story in a JSON format, extracting the following properties from the " \
+                        "HTML content: " \
+                        "title, created, updated, author, story, image_url. " \
+                        f"Also write a summary of maximum {MAX_SUMMARY_WORDS} words based on the story, in the same " \
+                        "language as the story, and set summary_check to 'yes' if the summary accurately represents " \
+                        "the story, or 'no' if it does not. " \
+                        "If you cannot find one of these properties, you can leave it as a blank string."
+        schema = JSON_SCHEMAS['story_extraction']
+    else:
+        answer_format = "Please return the story in a JSON format, extracting the following properties from the " \
+                        "HTML content: " \
+                        "title, created, updated, author, story, image_url" \
+                        "If you cannot find one of these properties, you can leave it as a blank string."
+        schema = JSON_SCHEMAS['story_collection']
+    openai_result = process_content_with_openai(setup_prompt, story_content, answer_format, schema)
 
     # Check if openai_result is not None before parsing it
     if openai_result is not None:
@@ -80,6 +121,27 @@ def interpret_html_content(html_content):
 
 
 def generate_summary(story_data):
+    # The self-check of the single-pass extraction is not a property of the story itself
+    summary_check = story_data.pop('summary_check', None)
+
+    if not settings.SUMMARY_SINGLE_PASS:
+        return generate_and_validate_summary(story_data)
+
+    # Keep the summary of the extraction, unless the model or the local checks reject it
+    problems = check_summary(story_data.get('story'), story_data.get('summary'))
+    if summary_check != 'no' and not problems:
+        return story_data
+
+    # Generate a new summary in a second call, keeping the extracted summary if that fails
+    summary = generate_summary_from_story(story_data['story'])
+    if summary:
+        story_data['summary'] = summary
+    if story_data.get('summary'):
+        story_data['summary'] = truncate_summary(story_data['summary'])
+    return story_data
+
+
+def generate_and_validate_summary(story_data):
     # Check if the story data contains a summary
     if 'summary' in story_data and story_data['summary']:
         # If the summary is longer than 30 words, generate a new summary
@@ -91,18 +153,16 @@ def generate_summary(story_data):
 
     # Validate the summary
     if not validate_summary(story_data['story'], story_data['summary']):
-        # If the summary is not valid, generate a new one
-        story_data['summary'] = generate_summary_from_story(story_data['story'])
+        # If the summary is not valid, generate a new one. The response cache would answer with the rejected summary.
+        story_data['summary'] = generate_summary_from_story(story_data['story'], use_cache=False)
 
     return story_data
 
 
-def generate_summary_from_story(story):
+def generate_summary_from_story(story, use_cache=True):
     # Process content with OpenAI
-    setup_prompt = "You are a helpful assistant designed to output JSON. " \
-                   "Your task is to write a summary of the given story, in the same language as the story."
-    answer_format = "Please write a summary of maximum 30 words based on the story."
-    openai_result = process_content_with_openai(setup_prompt, story, answer_format, JSON_SCHEMAS['story_summary'])
+    openai_result = process_content_with_openai(SUMMARY_SETUP_PROMPT, story, SUMMARY_ANSWER_FORMAT,
+                                                JSON_SCHEMAS['story_summary'], use_cache=use_cache)
 
     # Check if openai_result is not None before parsing it
     if openai_result is not None:
@@ -133,23 +193,72 @@ def validate_summary(story, summary):
         return False
 
 
-def extract_stories_from_urls(urls, source):
+def extract_stories_from_urls(urls, source, budget=None, host_limiter=None):
+    # Collect the stories concurrently, within the story budget and the politeness limit per host
+    if budget is None:
+        budget = StoryBudget(settings.COLLECTION_STORY_BUDGET)
+    if host_limiter is None:
+        host_limiter = HostLimiter(settings.COLLECTION_MAX_CONCURRENCY_PER_HOST)
+
     stories_scraped = 0
+    with ThreadPoolExecutor(max_workers=settings.COLLECTION_MAX_CONCURRENCY) as executor:
+        futures = [executor.submit(extract_story_from_url, url, source, budget, host_limiter) for url in urls]
+        for future in as_completed(futures):
+            try:
+                story = future.result()
+            except Exception as e:
+                print(f"An error occurred while collecting a story: {e}")
+                continue
+            if story is not None:
+                stories_scraped += 1
 
-    for url in urls:
-        # If 5 stories have been scraped, stop scraping
-        if stories_scraped >= 5:
-            print("5 stories have been scraped. For development purposes, stopping the scraping process.")
-            break
+    if budget.exhausted():
+        print(f"{budget.limit} stories have been scraped, which exhausts the story budget. Stopping the scraping process.")
 
-        # Collect the HTML content from the URL
-        scraper = get_scraper(url)
-        html_content = scraper.scrape_website(url)
+    return stories_scraped
 
-        # Interpret the HTML content into a 'story' object
-        story_data = interpret_html_content(html_content)
+
+@closes_db_connection
+def extract_story_from_url(url, source, budget, host_limiter):
+    # Skip the story if the budget was exhausted while it was waiting in the queue
+    if budget.exhausted():
+        return None
+
+    # Skip URLs that were checked for changes only recently
+    crawled_url = get_crawled_url(url)
+    if is_recently_crawled(crawled_url, settings.COLLECTION_REFRESH_INTERVAL):
+        return None
+
+    # Collect the HTML content from the URL, unless it did not change since the previous crawl
+    with host_limiter.limit(url):
+        if crawled_url is not None:
+            page = fetch_page(url, crawled_url.etag, crawled_url.lastModified)
+        else:
+            page = fetch_page(url)
+    if page is None:
+        return None
+    if not page.modified:
+        record_crawled_url(source, url, page)
+        return None
+
+    # Skip the story if its content did not change, or if it was collected before its fingerprint was recorded
+    story_content = str(extract_story_content(page.html_content))
+    content_hash = hash_content(story_content)
+    if crawled_url is not None and crawled_url.contentHash == content_hash \
+            or crawled_url is None and is_known_story_url(url):
+        record_crawled_url(source, url, page, content_hash)
+        return None
+
+    # Claim a place in the budget before the LLM calls, so stories beyond the budget do not pay for them. The place
+    # is released again when the story is not saved.
+    if not budget.reserve():
+        return None
+    saved = False
+    try:
+        # Interpret the story content into a 'story' object
+        story_data = interpret_story_content(story_content)
         if story_data is None:
-            continue
+            return None
 
         # Generate a summary for the 'story' object
         story_data = generate_summary(story_data)
@@ -157,15 +266,26 @@ def extract_stories_from_urls(urls, source):
         # Validate the story data
         validated_story_data = sanitize_story_data(story_data)
         if validated_story_data is None:
-            continue
+            record_crawled_url(source, url, page, content_hash)
+            return None
 
         validated_story_data['source'] = source
         validated_story_data['url'] = url
 
-        # Update or create the story
-        Story.objects.update_or_create(url=url, defaults=validated_story_data)
+        # New or changed stories have to be evaluated (again)
+        validated_story_data['needsStatus'] = NeedsStatus.PENDING
+
+        # Update or create the story, so it is available as soon as it's finished. A story stored under an older
+        # form of the URL gets the canonical URL.
+        story, created = Story.objects.update_or_create(url=get_story_url(url) or url,
+                                                        defaults=validated_story_data)
+        saved = True
+    finally:
+        if not saved:
+            budget.release()
 
-        stories_scraped += 1
+    record_crawled_url(source, url, page, content_hash)
+    return story
 
 
 def sanitize_story_data(story_data):
@@ -204,11 +324,19 @@ def sanitize_story_data(story_data):
     return story_data
 
 
-def collect_stories_from_source(source):
+def collect_stories_from_source(source, budget=None, host_limiter=None):
     print(f"Collecting stories from source '{source.name}'")
     urls = extract_urls_from_source(source)
     print(f"Extracted {len(urls)} potential story URLs from source '{source.name}'")
-    extract_stories_from_urls(urls, source)
+    stories_scraped = extract_stories_from_urls(urls, source, budget, host_limiter)
+    print(f"Collected {stories_scraped} stories from source '{source.name}'")
+
+    if browser_pool_started():
+        stats = get_browser_pool().stats()
+        print(f"Browser pool rendered {stats['pages']} pages, "
+              f"average wait {stats['average_wait_time']:.2f}s, average render {stats['average_render_time']:.2f}s")
+
+    return stories_scraped
 
 
 def test():
@@ -0,0 +1,53 @@
+import threading
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+
+# Limits the amount of concurrent requests to a single host, so the collection stays polite to the sources
+class HostLimiter:
+    def __init__(self, max_per_host=2):
+        self.max_per_host = max_per_host
+        self._semaphores = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def limit(self, url):
+        host = urlparse(url).netloc.lower()
+        with self._lock:
+            semaphore = self._semaphores.setdefault(host, threading.BoundedSemaphore(self.max_per_host))
+        with semaphore:
+            yield
+
+
+# Thread safe counter of the stories that may still be saved. A limit of None means the budget is unlimited.
+# A budget may have a parent budget (e.g. one shared by all sources in a crawl), which is claimed from as well.
+class StoryBudget:
+    def __init__(self, limit=None, parent=None):
+        self.limit = limit
+        self.parent = parent
+        self.used = 0
+        self._lock = threading.Lock()
+
+    def exhausted(self):
+        with self._lock:
+            if self._exhausted():
+                return True
+        return self.parent is not None and self.parent.exhausted()
+
+    def reserve(self):
+        with self._lock:
+            if self._exhausted():
+                return False
+            if self.parent is not None and not self.parent.reserve():
+                return False
+            self.used += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self.used -= 1
+            if self.parent is not None:
+                self.parent.release()
+
+    def _exhausted(self):
+        return self.limit is not None and self.used >= self.limit
@@ -0,0 +1,115 @@
+import re
+
+# Elements that never hold the story itself
+BOILERPLATE_TAGS = ['script', 'style', 'noscript', 'template', 'nav', 'footer', 'aside', 'form', 'iframe', 'svg',
+                    'button', 'select', 'input']
+
+# Class or id names of blocks around the story, such as menus, related articles, share buttons and cookie banners
+BOILERPLATE_PATTERN = re.compile(r'menu|navigation|navbar|sidebar|footer|related|share|social|cookie|consent|comment'
+                                 r'|newsletter|advert|banner|breadcrumb|promo|popup|modal|subscribe', re.IGNORECASE)
+
+# Meta properties that help to interpret a story
+USEFUL_META_PATTERN = re.compile(r'title|description|author|date|time|published|modified|image|^og:|^article:',
+                                 re.IGNORECASE)
+
+# Minimum length (in characters) for a paragraph to count towards the content score of its ancestors
+MIN_PARAGRAPH_LENGTH = 25
+
+# Maximum number of images passed along with a story
+MAX_IMAGES = 10
+
+# Rough amount of characters per token, which avoids depending on a tokenizer for the estimate
+CHARACTERS_PER_TOKEN = 4
+
+
+def estimate_tokens(text):
+    return (len(text) + CHARACTERS_PER_TOKEN - 1) // CHARACTERS_PER_TOKEN
+
+
+def truncate_to_token_budget(text, max_tokens):
+    if max_tokens is None or estimate_tokens(text) <= max_tokens:
+        return text
+    if max_tokens <= 0:
+        return ''
+
+    # Cut at the last whitespace within the budget, so no words are split
+    truncated = text[:max_tokens * CHARACTERS_PER_TOKEN]
+    last_whitespace = truncated.rfind(' ')
+    if last_whitespace > len(truncated) // 2:
+        truncated = truncated[:last_whitespace]
+    return truncated
+
+
+def remove_boilerplate(soup):
+    for element in soup.find_all(BOILERPLATE_TAGS):
+        element.decompose()
+
+    for element in soup.find_all(['div', 'section', 'ul', 'header']):
+        if element.decomposed:
+            continue
+
+        # Keep blocks that contain the headline, even if they are named like boilerplate
+        names = ' '.join(element.get('class') or []) + ' ' + (element.get('id') or '')
+        if BOILERPLATE_PATTERN.search(names) and not element.find('h1'):
+            element.decompose()
+
+    return soup
+
+
+def find_main_content(soup):
+    # Score the ancestors of each paragraph by the amount of text (and commas) in it, like readability tools do
+    scores = {}
+    candidates = {}
+    for paragraph in soup.find_all('p'):
+        text = paragraph.get_text(' ', strip=True)
+        if len(text) < MIN_PARAGRAPH_LENGTH:
+            continue
+
+        score = 1 + text.count(',') + min(len(text) // 100, 3)
+        parent = paragraph.parent
+        grandparent = parent.parent if parent is not None else None
+        for ancestor, weight in ((parent, 1), (grandparent, 0.5)):
+            if ancestor is None or ancestor.name in (None, '[document]'):
+                continue
+            scores[id(ancestor)] = scores.get(id(ancestor), 0) + score * weight
+            candidates[id(ancestor)] = ancestor
+
+    if not candidates:
+        return soup.body or soup
+
+    # Prefer the candidate with the most content, penalised by the share of its text that consists of links
+    def content_score(element):
+        text_length = len(element.get_text(' ', strip=True)) or 1
+        link_length = sum(len(link.get_text(' ', strip=True)) for link in element.find_all('a'))
+        return scores[id(element)] * (1 - min(link_length / text_length, 1))
+
+    return max(candidates.values(), key=content_score)
+
+
+def extract_meta_properties(soup):
+    meta_properties = {}
+    for meta in soup.find_all('meta'):
+        key = meta.get('name') or meta.get('property')
+        value = meta.get('content')
+        if key and value and USEFUL_META_PATTERN.search(key):
+            meta_properties[key] = value
+    return meta_properties
+
+
+def extract_images(element, meta_properties):
+    images = []
+    if meta_properties.get('og:image'):
+        images.append(meta_properties['og:image'])
+
+    for img in element.find_all('img'):
+        src = img.get('src')
+        if src and not src.startswith('data:'):
+            images.append(src)
+
+    # Remove duplicates, while keeping the order
+    return list(dict.fromkeys(images))[:MAX_IMAGES]
+
+
+def normalize_whitespace(text):
+    text = re.sub(r'[ \t\r\f\v]+', ' ', text)
+    return re.sub(r'\s*\n\s*', '\n', text).strip()
@@ -0,0 +1,79 @@
+import json
+
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from ai_utilities.openai_utils import JSON_SCHEMAS, set_openai_client
+from ai_utilities.stubs import StubOpenAIClient
+from story_collection.collection import interpret_story_content, generate_summary
+
+STORY_TEMPLATE = "De gemeente {town} heeft dinsdag besloten om het plein bij het station opnieuw in te richten. " \
+                 "Volgens wethouder {name} krijgt het plein meer bomen, bankjes en een speeltuin voor kinderen. " \
+                 "Bewoners konden de afgelopen maanden hun ideeën inleveren, en daar is volgens de gemeente goed " \
+                 "naar geluisterd. De werkzaamheden beginnen in het voorjaar en duren ongeveer een half jaar."
+SUMMARY_TEMPLATE = "Gemeente {town} richt het stationsplein opnieuw in met bomen, bankjes en een speeltuin."
+LONG_SUMMARY = ' '.join(['De gemeente heeft een besluit genomen over het plein bij het station.'] * 4)
+
+TOWNS = ['Zwolle', 'Deventer', 'Kampen', 'Hengelo', 'Almelo', 'Enschede', 'Hardenberg', 'Raalte']
+NAMES = ['De Vries', 'Jansen', 'Bakker', 'Visser', 'Smit', 'Meijer']
+
+
+# Count the OpenAI calls per story of the story interpretation and summary steps, in the legacy mode (separate
+# summary and validation calls) and the single-pass mode, using a stand-in OpenAI client
+class Command(BaseCommand):
+    help = "Benchmark the OpenAI calls per story of the single-pass summary against the separate summary calls"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--stories', type=int, default=40, help="Number of synthetic stories")
+        parser.add_argument('--rejected-share', type=float, default=0.25,
+                            help="Share of the extracted summaries that fail the checks and need a second call")
+
+    def handle(self, *args, **options):
+        stories = self.build_stories(options['stories'], options['rejected_share'])
+
+        for single_pass in (False, True):
+            client = StubOpenAIClient(responder=lambda request: self.respond(request, stories))
+            previous_client = set_openai_client(client)
+            try:
+                with override_settings(SUMMARY_SINGLE_PASS=single_pass, LLM_CACHE_ENABLED=False):
+                    for content in stories:
+                        story_data = interpret_story_content(content)
+                        generate_summary(story_data)
+            finally:
+                set_openai_client(previous_client)
+
+            mode = 'single-pass' if single_pass else 'separate calls'
+            self.stdout.write(f"{mode}: {len(client.calls)} calls for {len(stories)} stories, "
+                              f"{len(client.calls) / len(stories):.2f} calls per story")
+
+    @staticmethod
+    def build_stories(count, rejected_share):
+        stories = {}
+        rejected_count = round(count * rejected_share)
+        for i in range(count):
+            town = TOWNS[i % len(TOWNS)]
+            story = STORY_TEMPLATE.format(town=town, name=NAMES[i % len(NAMES)])
+            summary = LONG_SUMMARY if i < rejected_count else SUMMARY_TEMPLATE.format(town=town)
+            content = str({'text': f"Verhaal {i}\n{story}", 'meta_properties': {}, 'images': []})
+            stories[content] = {'story': story, 'summary': summary, 'town': town}
+        return stories
+
+    @staticmethod
+    def respond(request, stories):
+        messages = request['messages']
+        schema_message = messages[2]['content']
+        content = messages[-1]['content']
+
+        if json.dumps(JSON_SCHEMAS['story_summary']) in schema_message:
+            story = next(data for data in stories.values() if data['story'] == content)
+            return json.dumps({'summary': SUMMARY_TEMPLATE.format(town=story['town'])})
+        if json.dumps(JSON_SCHEMAS['summary_validation']) in schema_message:
+            return json.dumps({'validation': 'yes'})
+
+        story = stories[content]
+        story_data = {'title': 'Stationsplein', 'created': '2024-05-14T10:00:00', 'updated': '', 'author': '',
+                      'story': story['story'], 'image_url': ''}
+        if json.dumps(JSON_SCHEMAS['story_extraction']) in schema_message:
+            story_data['summary'] = story['summary']
+            story_data['summary_check'] = 'yes'
+        return json.dumps(story_data)
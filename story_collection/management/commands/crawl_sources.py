@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from story_collection.scheduler import CrawlScheduler
+
+
+class Command(BaseCommand):
+    help = "Crawl the sources whose next crawl is due, based on their release frequency and observed yield"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Crawl the due sources once, instead of running continuously")
+        parser.add_argument('--workers', type=int, help="Number of sources crawled in parallel")
+        parser.add_argument('--max-sources', type=int, help="Maximum number of sources crawled per cycle")
+        parser.add_argument('--story-budget', type=int, help="Maximum number of stories collected per cycle")
+        parser.add_argument('--poll-interval', type=int, default=60, help="Maximum seconds between two cycles")
+
+    def handle(self, *args, **options):
+        scheduler = CrawlScheduler(
+            max_workers=options['workers'],
+            max_sources=options['max_sources'],
+            story_budget=options['story_budget'],
+        )
+
+        if options['once']:
+            results = scheduler.run_once()
+            self.stdout.write(f"Crawled {len(results)} sources, collecting {sum(results.values())} stories")
+        else:
+            scheduler.run_forever(poll_interval=options['poll_interval'])
@@ -0,0 +1,27 @@
+# Generated by Django 5.0.4 on 2026-10-18 06:28
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('sources', '0001_squashed_0002_alter_source_commercialpublisher_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SourceSchedule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nextDue', models.DateTimeField(db_index=True)),
+                ('lastCrawled', models.DateTimeField(blank=True, null=True)),
+                ('lastYield', models.IntegerField(default=0)),
+                ('intervalFactor', models.FloatField(default=1)),
+                ('source', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='schedule', to='sources.source')),
+            ],
+        ),
+    ]
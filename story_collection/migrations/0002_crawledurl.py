@@ -0,0 +1,27 @@
+# Generated by Django 5.0.4 on 2026-10-18 06:36
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sources', '0001_squashed_0002_alter_source_commercialpublisher_and_more'),
+        ('story_collection', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CrawledUrl',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('url', models.URLField(max_length=500, unique=True)),
+                ('etag', models.CharField(blank=True, max_length=200)),
+                ('lastModified', models.CharField(blank=True, max_length=100)),
+                ('contentHash', models.CharField(blank=True, max_length=64)),
+                ('lastCrawled', models.DateTimeField()),
+                ('source', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='crawled_urls', to='sources.source')),
+            ],
+        ),
+    ]
@@ -0,0 +1,53 @@
+import re
+from urllib.parse import urlparse, urlunparse, parse_qsl, urlencode
+
+from django.db import migrations
+
+# A copy of story_collection.url_filter.canonicalize_url as it was when this migration was written, so later changes
+# to it do not change what this migration does
+TRACKING_PARAMETERS = re.compile(r'^(utm_.*|fbclid|gclid|dclid|msclkid|mc_cid|mc_eid|_ga|ref|share)$', re.IGNORECASE)
+
+
+def canonicalize_url(url):
+    parsed = urlparse(url.strip())
+    host = (parsed.hostname or '').lower()
+    if parsed.port and not (parsed.scheme == 'http' and parsed.port == 80
+                            or parsed.scheme == 'https' and parsed.port == 443):
+        host = f'{host}:{parsed.port}'
+
+    query = urlencode([(key, value) for key, value in parse_qsl(parsed.query, keep_blank_values=True)
+                       if not TRACKING_PARAMETERS.match(key)])
+    path = re.sub(r'/{2,}', '/', parsed.path).rstrip('/') or '/'
+    return urlunparse((parsed.scheme.lower(), host, path, '', query, ''))
+
+
+def canonicalize_model_urls(model):
+    # URLs whose canonical form is already taken by another row are left as they are, they are still found by
+    # looking up both forms
+    taken = set(model.objects.values_list('url', flat=True))
+    for row_id, url in model.objects.values_list('id', 'url').iterator():
+        if urlparse(url).scheme not in ('http', 'https'):
+            continue
+        canonical_url = canonicalize_url(url)
+        if canonical_url == url or canonical_url in taken or len(canonical_url) > 500:
+            continue
+        model.objects.filter(id=row_id).update(url=canonical_url)
+        taken.discard(url)
+        taken.add(canonical_url)
+
+
+def canonicalize_urls(apps, schema_editor):
+    canonicalize_model_urls(apps.get_model('stories', 'Story'))
+    canonicalize_model_urls(apps.get_model('story_collection', 'CrawledUrl'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stories', '0014_story_search'),
+        ('story_collection', '0002_crawledurl'),
+    ]
+
+    operations = [
+        migrations.RunPython(canonicalize_urls, migrations.RunPython.noop),
+    ]
@@ -1,2 +1,27 @@
+from django.db import models
 from sources.models import Source
-from stories.models import Story, Label
+from stories.models import Story, Label, NeedsStatus
+
+
+class SourceSchedule(models.Model):
+    source = models.OneToOneField(Source, on_delete=models.CASCADE, related_name='schedule')
+    nextDue = models.DateTimeField(db_index=True)
+    lastCrawled = models.DateTimeField(blank=True, null=True)
+    lastYield = models.IntegerField(default=0)
+    intervalFactor = models.FloatField(default=1)
+
+    def __str__(self):
+        return f'{self.source.name}: {self.nextDue}'
+
+
+# A URL that was crawled before, with the validators and content fingerprint used to detect changes on the next crawl
+class CrawledUrl(models.Model):
+    source = models.ForeignKey(Source, on_delete=models.CASCADE, null=True, related_name='crawled_urls')
+    url = models.URLField(max_length=500, unique=True)
+    etag = models.CharField(max_length=200, blank=True)
+    lastModified = models.CharField(max_length=100, blank=True)
+    contentHash = models.CharField(max_length=64, blank=True)
+    lastCrawled = models.DateTimeField()
+
+    def __str__(self):
+        return self.url
@@ -0,0 +1,141 @@
+import heapq
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from news_hyperlocalizer.threads import closes_db_connection
+from sources.models import ReleaseFrequency
+from .collection import collect_stories_from_source
+from .concurrency import HostLimiter, StoryBudget
+from .models import Source, SourceSchedule
+
+# Time between two crawls of a source, based on how often the source releases new stories
+RELEASE_FREQUENCY_INTERVALS = {
+    ReleaseFrequency.DAILY: timedelta(days=1),
+    ReleaseFrequency.WEEKLY: timedelta(weeks=1),
+    ReleaseFrequency.MONTHLY: timedelta(days=30),
+    ReleaseFrequency.UNSURE: timedelta(days=3),
+}
+DEFAULT_INTERVAL = RELEASE_FREQUENCY_INTERVALS[ReleaseFrequency.UNSURE]
+
+# Bounds for scaling the interval by the observed yield of a source
+MIN_INTERVAL_FACTOR = 0.25
+MAX_INTERVAL_FACTOR = 4
+
+
+def adjust_interval_factor(interval_factor, stories_collected, high_yield):
+    # Crawl sources that yielded nothing less often, and sources that yielded a lot more often
+    if stories_collected == 0:
+        return min(interval_factor * 2, MAX_INTERVAL_FACTOR)
+    elif stories_collected >= high_yield:
+        return max(interval_factor / 2, MIN_INTERVAL_FACTOR)
+    return interval_factor
+
+
+def get_crawl_interval(source, interval_factor=1):
+    base_interval = RELEASE_FREQUENCY_INTERVALS.get(source.releaseFrequency, DEFAULT_INTERVAL)
+    return base_interval * interval_factor
+
+
+# Keeps a priority queue of sources ordered by the time their next crawl is due, and crawls due sources in parallel.
+# The schedule is persisted in SourceSchedule, so a restart continues where the previous run stopped.
+class CrawlScheduler:
+    def __init__(self, max_workers=None, max_sources=None, story_budget=None, high_yield=None):
+        self.max_workers = max_workers or settings.CRAWL_MAX_CONCURRENT_SOURCES
+        self.max_sources = max_sources
+        self.story_budget = story_budget
+        self.high_yield = high_yield or settings.CRAWL_HIGH_YIELD
+        self.queue = []
+
+    def load(self, now=None):
+        now = now or timezone.now()
+
+        # Sources that were never crawled are due right away
+        sources_without_schedule = Source.objects.exclude(website='').filter(schedule__isnull=True)
+        SourceSchedule.objects.bulk_create(
+            [SourceSchedule(source=source, nextDue=now) for source in sources_without_schedule],
+            ignore_conflicts=True,
+        )
+
+        self.queue = [
+            (schedule.nextDue, schedule.source_id)
+            for schedule in SourceSchedule.objects.exclude(source__website='').only('nextDue', 'source_id')
+        ]
+        heapq.heapify(self.queue)
+
+    def pop_due_sources(self, now=None):
+        now = now or timezone.now()
+        due_source_ids = []
+        while self.queue and self.queue[0][0] <= now:
+            if self.max_sources is not None and len(due_source_ids) >= self.max_sources:
+                break
+            due_source_ids.append(heapq.heappop(self.queue)[1])
+        return due_source_ids
+
+    def next_due(self):
+        return self.queue[0][0] if self.queue else None
+
+    def run_once(self, now=None):
+        if not self.queue:
+            self.load(now)
+
+        due_source_ids = self.pop_due_sources(now)
+        if not due_source_ids:
+            return {}
+
+        sources = Source.objects.in_bulk(due_source_ids)
+        budget = StoryBudget(self.story_budget)
+        host_limiter = HostLimiter(settings.COLLECTION_MAX_CONCURRENCY_PER_HOST)
+        print(f"Crawling {len(sources)} due sources")
+
+        results = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {
+                executor.submit(crawl_source, source, budget, host_limiter): source
+                for source in sources.values()
+            }
+            for future in as_completed(futures):
+                source = futures[future]
+                stories_collected = future.result()
+                results[source.id] = stories_collected
+                self.reschedule(source, stories_collected)
+
+        return results
+
+    def reschedule(self, source, stories_collected):
+        now = timezone.now()
+        schedule, created = SourceSchedule.objects.get_or_create(source=source, defaults={'nextDue': now})
+
+        schedule.intervalFactor = adjust_interval_factor(schedule.intervalFactor, stories_collected, self.high_yield)
+        schedule.lastCrawled = now
+        schedule.lastYield = stories_collected
+        schedule.nextDue = now + get_crawl_interval(source, schedule.intervalFactor)
+        schedule.save()
+
+        heapq.heappush(self.queue, (schedule.nextDue, source.id))
+
+    def run_forever(self, poll_interval=60):
+        self.load()
+        while True:
+            self.run_once()
+
+            # Sleep until the next source is due, but check regularly for newly added sources
+            next_due = self.next_due()
+            sleep_time = poll_interval
+            if next_due is not None:
+                sleep_time = min(max((next_due - timezone.now()).total_seconds(), 0), poll_interval)
+            time.sleep(sleep_time)
+            self.load()
+
+
+@closes_db_connection
+def crawl_source(source, budget, host_limiter):
+    try:
+        source_budget = StoryBudget(settings.COLLECTION_STORY_BUDGET, parent=budget)
+        return collect_stories_from_source(source, budget=source_budget, host_limiter=host_limiter) or 0
+    except Exception as e:
+        print(f"An error occurred while crawling source '{source.name}': {e}")
+        return 0
@@ -2,14 +2,22 @@ import re
 from abc import ABC, abstractmethod
 from bs4 import BeautifulSoup
 import requests
-from selenium import webdriver
+from collections import namedtuple
+from selenium.common.exceptions import TimeoutException
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as ec
-from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.common.by import By
-from selenium.webdriver.chrome.options import Options
-from webdriver_manager.chrome import ChromeDriverManager
 from urllib.parse import urljoin
+from django.conf import settings
+from .browser_pool import get_browser_pool
+from .content_extraction import estimate_tokens, truncate_to_token_budget, remove_boilerplate, find_main_content, \
+    extract_meta_properties, extract_images, normalize_whitespace
+
+# Timeout (in seconds) for plain HTTP requests
+REQUEST_TIMEOUT = 30
+
+# Minimum amount of visible text (in characters) for a static page to be considered complete without JavaScript
+MIN_STATIC_TEXT_LENGTH = 500
 
 
 class WebsiteScraper(ABC):
@@ -34,87 +42,155 @@ class StaticWebsiteScraper(WebsiteScraper):
 
 # Class for scraping dynamic websites that use JavaScript to load content
 class DynamicWebsiteScraper(WebsiteScraper):
+    def __init__(self, pool=None):
+        self.pool = pool
+
     def scrape_website(self, url):
-        # Setup Chrome options
-        chrome_options = Options()
-        chrome_options.add_argument("--headless")
-        chrome_options.add_argument("--no-sandbox")
-        chrome_options.add_argument("--disable-dev-shm-usage")
-        chrome_options.add_argument("--log-level=3")
+        pool = self.pool or get_browser_pool()
 
         try:
-            webdriver_service = Service('/usr/bin/chromedriver')
-            driver = webdriver.Chrome(service=webdriver_service, options=chrome_options)
-            driver.get(url)
+            with pool.driver() as driver:
+                driver.get(url)
+
+                try:
+                    # This will ensure that the page is loaded before the html is retrieved
+                    WebDriverWait(driver, timeout=10).until(
+                        lambda d: d.execute_script('return document.readyState') == 'complete'
+                    )
+                except TimeoutException:
+                    pass
+
+                page_source = driver.page_source
         except Exception as e:
             print(f"An error occurred while trying to scrape {url}: {e}")
             return None
 
-        # This will ensure that the page is loaded before the html is retrieved
-        WebDriverWait(driver, timeout=10).until(lambda d: d.execute_script('return document.readyState') == 'complete')
-
-        soup = BeautifulSoup(driver.page_source, 'html.parser')
-        driver.quit()
+        soup = BeautifulSoup(page_source, 'html.parser')
         return str(soup)
 
 
 # Class for scraping websites that use AJAX to load content
 class AjaxWebsiteScraper(WebsiteScraper):
+    def __init__(self, pool=None):
+        self.pool = pool
+
     def scrape_website(self, url):
-        # Setup Chrome options
-        chrome_options = Options()
-        chrome_options.add_argument("--headless")  # Ensure GUI is off
-        chrome_options.add_argument("--no-sandbox")
-        chrome_options.add_argument("--disable-dev-shm-usage")
-        chrome_options.add_argument("--log-level=3")
+        pool = self.pool or get_browser_pool()
 
         try:
-            webdriver_service = Service('/usr/bin/chromedriver')
-            driver = webdriver.Chrome(service=webdriver_service, options=chrome_options)
-            driver.get(url)
+            with pool.driver() as driver:
+                driver.get(url)
+
+                try:
+                    # Wait for the AJAX content to load
+                    WebDriverWait(driver, 10).until(
+                        ec.presence_of_element_located((By.CSS_SELECTOR, "your_css_selector"))
+                    )
+                except TimeoutException:
+                    pass
+
+                page_source = driver.page_source
         except Exception as e:
             print(f"An error occurred while trying to scrape {url}: {e}")
             return None
 
-        try:
-            # Wait for the AJAX content to load
-            WebDriverWait(driver, 10).until(
-                ec.presence_of_element_located((By.CSS_SELECTOR, "your_css_selector"))
-            )
-        except Exception as e:
-            pass
-        finally:
-            # Get the page source and parse it with BeautifulSoup
-            soup = BeautifulSoup(driver.page_source, 'html.parser')
-            driver.quit()
-
+        # Parse the page source with BeautifulSoup
+        soup = BeautifulSoup(page_source, 'html.parser')
         return str(soup)
 
 
+# Select the scraper for a URL, returning a tuple of (scraper, html_content).
+# The URL is fetched and parsed only once: if the static document already holds the page content, it is returned
+# right away. Only pages that need JavaScript return None as html_content, and should be scraped with the scraper.
 def get_scraper(url):
     try:
         # Send a GET request to the URL
-        response = requests.get(url)
+        response = requests.get(url, timeout=REQUEST_TIMEOUT)
         response.raise_for_status()
     except requests.exceptions.RequestException as e:
         print(f"An error occurred while trying to scrape {url}: {e}")
-        return None
+        return None, None
+
+    return select_scraper(BeautifulSoup(response.content, 'html.parser'))
 
-    # Parse the HTML content
-    soup = BeautifulSoup(response.content, 'html.parser')
 
-    # Check if the HTML contains <script> tags
-    is_dynamic = bool(soup.find('script'))
+def select_scraper(soup):
+    # Pages that already contain their content do not need a browser
+    if not requires_javascript(soup):
+        return StaticWebsiteScraper(), str(soup)
 
     # Check if the HTML contains AJAX calls
-    is_ajax = bool(soup.find('script', text=re.compile('.*ajax.*')))
+    is_ajax = bool(soup.find('script', string=re.compile('.*ajax.*')))
 
     if is_ajax:
-        return AjaxWebsiteScraper()
-    elif is_dynamic:
-        return DynamicWebsiteScraper()
+        return AjaxWebsiteScraper(), None
     else:
-        return StaticWebsiteScraper()
+        return DynamicWebsiteScraper(), None
+
+
+def requires_javascript(soup):
+    # Pages without any scripts can never be rendered client side
+    if not soup.find('script'):
+        return False
+
+    # Pages that ask the visitor to enable JavaScript will not show their content without it
+    for noscript in soup.find_all('noscript'):
+        if 'javascript' in noscript.get_text().lower():
+            return True
+
+    # Pages with a (nearly) empty body are rendered client side
+    body = soup.body or soup
+    text = ''.join(
+        string.strip() for string in body.find_all(string=True)
+        if string.parent.name not in ('script', 'style', 'noscript', 'template')
+    )
+    return len(text) < MIN_STATIC_TEXT_LENGTH
+
+
+def scrape_url(url):
+    # Select the scraper, which returns the document right away when it does not need a browser
+    scraper, html_content = get_scraper(url)
+    if scraper is None:
+        return None
+
+    # Escalate to a browser only for pages that require JavaScript
+    if html_content is None:
+        html_content = scraper.scrape_website(url)
+
+    return html_content
+
+
+# Result of a (conditional) fetch. When the page was not modified since the given ETag / Last-Modified, html_content
+# is None and modified is False.
+FetchedPage = namedtuple('FetchedPage', ['html_content', 'etag', 'last_modified', 'modified'])
+
+
+def fetch_page(url, etag='', last_modified=''):
+    # Ask the server to only return the page when it changed since it was last fetched
+    headers = {}
+    if etag:
+        headers['If-None-Match'] = etag
+    if last_modified:
+        headers['If-Modified-Since'] = last_modified
+
+    try:
+        response = requests.get(url, headers=headers, timeout=REQUEST_TIMEOUT)
+        response.raise_for_status()
+    except requests.exceptions.RequestException as e:
+        print(f"An error occurred while trying to scrape {url}: {e}")
+        return None
+
+    if response.status_code == 304:
+        return FetchedPage(None, etag, last_modified, False)
+
+    # Escalate to a browser only for pages that require JavaScript
+    scraper, html_content = select_scraper(BeautifulSoup(response.content, 'html.parser'))
+    if html_content is None:
+        html_content = scraper.scrape_website(url)
+        if html_content is None:
+            return None
+
+    return FetchedPage(html_content, response.headers.get('ETag', ''), response.headers.get('Last-Modified', ''), True)
 
 
 def extract_all_urls(html_content, base_url):
@@ -123,17 +199,26 @@ def extract_all_urls(html_content, base_url):
     return urls
 
 
-def extract_story_content(html_content):
-    soup = BeautifulSoup(html_content, 'html.parser')
+def extract_story_content(html_content, max_tokens=None):
+    if max_tokens is None:
+        max_tokens = settings.STORY_CONTENT_MAX_TOKENS
 
-    # Extract the text content
-    text = soup.get_text()
+    soup = BeautifulSoup(html_content, 'html.parser')
+    original_tokens = estimate_tokens(soup.get_text())
 
     # Extract the meta properties
-    meta_properties = {meta.get('name') or meta.get('property'): meta.get('content') for meta in soup.find_all('meta') if (meta.get('name') or meta.get('property')) and meta.get('content')}
+    meta_properties = extract_meta_properties(soup)
+
+    # Extract the text content of the story, without the navigation, footers, related articles etc. around it
+    main_content = find_main_content(remove_boilerplate(soup))
+    text = normalize_whitespace(main_content.get_text('\n'))
 
-    # Extract the images
-    images = [img.get('src') for img in soup.find_all('img') if img.get('src')]
+    # Extract the images of the story
+    images = extract_images(main_content, meta_properties)
+
+    # Trim the text content, so the whole content fits within the token budget
+    other_tokens = estimate_tokens(str({'text': '', 'meta_properties': meta_properties, 'images': images}))
+    text = truncate_to_token_budget(text, max_tokens - other_tokens)
 
     # Unify the text content, meta properties, and images into a single format
     content = {
@@ -142,4 +227,8 @@ def extract_story_content(html_content):
         'images': images
     }
 
-    return content
\ No newline at end of file
+    content_tokens = estimate_tokens(str(content))
+    print(f"Reduced the page content from {original_tokens} to {content_tokens} tokens "
+          f"(saved {max(original_tokens - content_tokens, 0)} tokens)")
+
+    return content
@@ -0,0 +1,51 @@
+import hashlib
+from datetime import timedelta
+from urllib.parse import urlparse, urlunparse
+
+from django.utils import timezone
+
+from .models import CrawledUrl, Story
+
+
+def hash_content(content):
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+def get_crawled_url(url):
+    return CrawledUrl.objects.filter(url=url).first()
+
+
+def is_recently_crawled(crawled_url, refresh_interval, now=None):
+    if crawled_url is None or refresh_interval is None:
+        return False
+    now = now or timezone.now()
+    return now - crawled_url.lastCrawled < timedelta(seconds=refresh_interval)
+
+
+def url_variants(url):
+    # Stories collected before their URLs were canonicalised may be stored with a trailing slash
+    parsed = urlparse(url)
+    if parsed.path.endswith('/'):
+        return [url]
+    return [url, urlunparse(parsed._replace(path=parsed.path + '/'))]
+
+
+def get_story_url(url):
+    # The URL under which the story at the canonical URL is stored, or None when it is not known
+    return Story.objects.filter(url__in=url_variants(url)).order_by('url').values_list('url', flat=True).first()
+
+
+def is_known_story_url(url):
+    return get_story_url(url) is not None
+
+
+def record_crawled_url(source, url, page=None, content_hash=None):
+    defaults = {'source': source, 'lastCrawled': timezone.now()}
+    if page is not None and page.modified:
+        defaults['etag'] = page.etag
+        defaults['lastModified'] = page.last_modified
+    if content_hash is not None:
+        defaults['contentHash'] = content_hash
+
+    crawled_url, created = CrawledUrl.objects.update_or_create(url=url, defaults=defaults)
+    return crawled_url
@@ -0,0 +1,71 @@
+import re
+
+# Maximum length of a summary, in words
+MAX_SUMMARY_WORDS = 30
+
+# Minimum share of the words of a summary that should occur in the story, so the summary is about the story
+MIN_SUMMARY_OVERLAP = 0.4
+
+# Frequent words, used to recognise the language of a text without depending on a language detection library
+STOPWORDS = {
+    'nl': {'de', 'het', 'een', 'en', 'van', 'is', 'dat', 'op', 'te', 'in', 'voor', 'met', 'zijn', 'niet', 'aan',
+           'er', 'om', 'ook', 'als', 'bij', 'door', 'naar', 'wordt', 'worden', 'maar', 'nog', 'heeft', 'hij', 'ze',
+           'dit', 'deze', 'werd', 'uit', 'over', 'wat', 'wel', 'tot', 'geen', 'zich'},
+    'en': {'the', 'a', 'an', 'and', 'of', 'is', 'that', 'on', 'to', 'in', 'for', 'with', 'are', 'not', 'at',
+           'it', 'as', 'by', 'from', 'was', 'were', 'be', 'has', 'have', 'he', 'she', 'they', 'this', 'these',
+           'but', 'will', 'its', 'their', 'been', 'which', 'about', 'or', 'who'},
+}
+
+WORD_PATTERN = re.compile(r'\w+', re.UNICODE)
+
+
+def words(text):
+    return WORD_PATTERN.findall((text or '').lower())
+
+
+def detect_language(text):
+    text_words = words(text)
+    counts = {language: sum(word in stopwords for word in text_words) for language, stopwords in STOPWORDS.items()}
+    language = max(counts, key=counts.get)
+    return language if counts[language] > 0 else None
+
+
+def ngrams(text_words, n):
+    return {tuple(text_words[i:i + n]) for i in range(len(text_words) - n + 1)}
+
+
+def ngram_overlap(summary, story, n=1):
+    # Share of the content words (or n-grams of words) of the summary that also occur in the story
+    summary_words = [word for word in words(summary) if not any(word in stopwords for stopwords in STOPWORDS.values())]
+    story_words = [word for word in words(story) if not any(word in stopwords for stopwords in STOPWORDS.values())]
+    summary_ngrams = ngrams(summary_words, n)
+    if not summary_ngrams:
+        return 0
+    return len(summary_ngrams & ngrams(story_words, n)) / len(summary_ngrams)
+
+
+# Check a summary locally, returning the problems found. An empty list means the summary can be used as it is.
+def check_summary(story, summary):
+    if not summary:
+        return ['missing']
+
+    problems = []
+    if len(summary.split()) > MAX_SUMMARY_WORDS:
+        problems.append('too long')
+
+    story_language = detect_language(story)
+    summary_language = detect_language(summary)
+    if story_language and summary_language and story_language != summary_language:
+        problems.append('different language')
+
+    if ngram_overlap(summary, story) < MIN_SUMMARY_OVERLAP:
+        problems.append('unrelated to the story')
+
+    return problems
+
+
+def truncate_summary(summary, max_words=MAX_SUMMARY_WORDS):
+    summary_words = summary.split()
+    if len(summary_words) <= max_words:
+        return summary
+    return ' '.join(summary_words[:max_words]).rstrip('.,;:') + '...'
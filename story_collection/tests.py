@@ -1,41 +1,86 @@
 import unittest
 import json
+import threading
+import tempfile
+import time
+from datetime import timedelta
+from pathlib import Path
 from unittest.mock import patch, MagicMock
 
+from django.test import TestCase
+from django.utils import timezone
+
 import requests
 
+from ai_utilities.llm_cache import LLMResponseCache
+from ai_utilities.openai_utils import set_openai_client
+from ai_utilities.stubs import StubOpenAIClient
 from story_collection import collection
-from story_collection.scraping_utils import StaticWebsiteScraper
+from story_collection.scraping_utils import StaticWebsiteScraper, DynamicWebsiteScraper, get_scraper, scrape_url, \
+    extract_story_content, fetch_page, FetchedPage
+from story_collection.content_extraction import estimate_tokens, truncate_to_token_budget
+from story_collection.url_filter import canonicalize_url, prefilter_urls
+from story_collection.browser_pool import BrowserPool
+from story_collection.concurrency import HostLimiter, StoryBudget
+from story_collection.models import SourceSchedule, CrawledUrl, Story
+from story_collection.seen_urls import hash_content
+from story_collection.summary_checks import check_summary, truncate_summary
+from story_collection.scheduler import CrawlScheduler, adjust_interval_factor
+from sources.models import Source, ReleaseFrequency
 
 
 # Tests for story_collection/collection.py
 class TestCollection(unittest.TestCase):
-    @patch('story_collection.collection.get_scraper')
+    @patch('story_collection.collection.get_known_story_urls')
+    @patch('story_collection.collection.scrape_url')
     @patch('story_collection.collection.process_content_with_openai')
     @patch('os.environ', {'OPENAI_API_KEY': 'test_openai_api_key' })
-    def test_extract_urls_from_source(self, mock_process_content_with_openai, mock_get_scraper):
+    def test_extract_urls_from_source(self, mock_process_content_with_openai, mock_scrape_url, mock_get_known_story_urls):
         # Arrange
-        mock_scraper = MagicMock()
-        mock_get_scraper.return_value = mock_scraper
-        mock_scraper.scrape_website.return_value = "<html></html>"
-        mock_process_content_with_openai.return_value = '{"items": ["http://example.com/story1", "http://example.com/story2"]}'
+        mock_scrape_url.return_value = "<html><a href='/nieuws/story1'></a><a href='/nieuws/story2'></a></html>"
+        mock_process_content_with_openai.return_value = '{"items": ["http://example.com/nieuws/story1", "http://example.com/nieuws/story2"]}'
+        mock_get_known_story_urls.return_value = []
         source = MagicMock()
+        source.website = "http://example.com"
 
         # Act
         result = collection.extract_urls_from_source(source)
 
         # Assert
-        self.assertEqual(result, ["http://example.com/story1", "http://example.com/story2"])
-        mock_get_scraper.assert_called_once_with(source.website)
-        mock_scraper.scrape_website.assert_called_once_with(source.website)
+        self.assertEqual(result, ["http://example.com/nieuws/story1", "http://example.com/nieuws/story2"])
+        mock_scrape_url.assert_called_once_with(source.website)
         mock_process_content_with_openai.assert_called_once()
 
-    @patch('story_collection.collection.get_scraper')
+    @patch('story_collection.collection.get_known_story_urls')
+    @patch('story_collection.collection.scrape_url')
+    @patch('story_collection.collection.process_content_with_openai')
+    def test_extract_urls_from_source_only_sends_ambiguous_urls(self, mock_process_content_with_openai, mock_scrape_url, mock_get_known_story_urls):
+        # Arrange
+        mock_scrape_url.return_value = """<html>
+            <a href='/'>Home</a><a href='/sport'>Sport</a><a href='/tag/tilburg'>Tilburg</a>
+            <a href='https://www.facebook.com/example'>Facebook</a><a href='mailto:redactie@example.com'>Mail</a>
+            <a href='/nieuws/2024/05/12/brand-verwoest-loods-in-tilburg'>Brand</a>
+            <a href='/nieuws/2024/05/12/brand-verwoest-loods-in-tilburg?utm_source=home#reacties'>Reacties</a>
+            <a href='/agenda/markt'>Markt</a>
+        </html>"""
+        mock_process_content_with_openai.return_value = '{"items": ["http://example.com/agenda/markt"]}'
+        mock_get_known_story_urls.return_value = []
+        source = MagicMock()
+        source.website = "http://example.com"
+
+        # Act
+        result = collection.extract_urls_from_source(source)
+
+        # Assert
+        self.assertEqual(result, ["http://example.com/nieuws/2024/05/12/brand-verwoest-loods-in-tilburg", "http://example.com/agenda/markt"])
+        self.assertEqual(mock_process_content_with_openai.call_args.args[1], "http://example.com/agenda/markt")
+
+    @patch('story_collection.collection.scrape_url')
     @patch('story_collection.collection.process_content_with_openai')
     @patch('os.environ', {'OPENAI_API_KEY': 'test_openai_api_key' })
-    def test_extract_urls_from_source_with_invalid_source(self, mock_process_content_with_openai, mock_get_scraper):
+    def test_extract_urls_from_source_with_invalid_source(self, mock_process_content_with_openai, mock_scrape_url):
         # Arrange
-        mock_get_scraper.side_effect = Exception
+        mock_scrape_url.side_effect = Exception
         source = MagicMock()
 
         # Act
@@ -44,19 +89,23 @@ class TestCollection(unittest.TestCase):
         # Assert
         self.assertEqual(result, [])
 
-    @patch('story_collection.collection.get_scraper')
+    @patch('story_collection.collection.get_story_url', return_value=None)
+    @patch('story_collection.collection.record_crawled_url')
+    @patch('story_collection.collection.is_known_story_url', return_value=False)
+    @patch('story_collection.collection.get_crawled_url', return_value=None)
+    @patch('story_collection.collection.fetch_page')
     @patch('story_collection.collection.process_content_with_openai')
     @patch('story_collection.collection.extract_story_content')
     @patch('story_collection.collection.Story.objects.update_or_create')
     @patch('story_collection.collection.validate_summary')
+    @patch('django.conf.settings.SUMMARY_SINGLE_PASS', False)
     @patch('os.environ', {'OPENAI_API_KEY': 'test_openai_api_key' })
-    def test_extract_stories_from_urls(self, mock_validate_summary, mock_update_or_create, mock_extract_story_content, mock_process_content_with_openai, mock_get_scraper):
+    def test_extract_stories_from_urls(self, mock_validate_summary, mock_update_or_create, mock_extract_story_content, mock_process_content_with_openai, mock_fetch_page, mock_get_crawled_url, mock_is_known_story_url, mock_record_crawled_url, mock_get_story_url):
         # Arrange
-        mock_scraper = MagicMock()
-        mock_get_scraper.return_value = mock_scraper
-        mock_scraper.scrape_website.return_value = "<html></html>"
+        mock_fetch_page.return_value = FetchedPage("<html></html>", '"v1"', '', True)
         mock_extract_story_content.return_value = "Test Story Content"
         mock_process_content_with_openai.return_value = '{"title": "Test Title", "created": "2022-01-01T00:00:00Z", "updated": "2022-01-01T00:00:00Z", "author": "Test Author", "story": "Test Story", "summary": "Test Summary", "image_url": "http://example.com/image.jpg"}'
+        mock_update_or_create.return_value = (MagicMock(), True)
         mock_validate_summary.return_value = True
         urls = ["http://example.com/story1", "http://example.com/story2"]
         source = MagicMock()
@@ -65,13 +114,118 @@ class TestCollection(unittest.TestCase):
         collection.extract_stories_from_urls(urls, source)
 
         # Assert
-        mock_get_scraper.assert_called()
-        mock_scraper.scrape_website.assert_any_call("http://example.com/story1")
-        mock_scraper.scrape_website.assert_any_call("http://example.com/story2")
+        mock_fetch_page.assert_any_call("http://example.com/story1")
+        mock_fetch_page.assert_any_call("http://example.com/story2")
         mock_extract_story_content.assert_called()
         mock_process_content_with_openai.assert_called()
         mock_update_or_create.assert_called()
         mock_validate_summary.assert_called()
+        self.assertEqual(mock_record_crawled_url.call_count, 2)
+
+    @patch('story_collection.collection.get_story_url', return_value=None)
+    @patch('story_collection.collection.record_crawled_url')
+    @patch('story_collection.collection.is_known_story_url', return_value=False)
+    @patch('story_collection.collection.get_crawled_url', return_value=None)
+    @patch('story_collection.collection.fetch_page')
+    @patch('story_collection.collection.extract_story_content')
+    @patch('story_collection.collection.interpret_story_content')
+    @patch('story_collection.collection.generate_summary')
+    @patch('story_collection.collection.Story.objects.update_or_create')
+    def test_extract_stories_from_urls_respects_budget(self, mock_update_or_create, mock_generate_summary, mock_interpret_story_content, mock_extract_story_content, mock_fetch_page, mock_get_crawled_url, mock_is_known_story_url, mock_record_crawled_url, mock_get_story_url):
+        # Arrange
+        mock_fetch_page.return_value = FetchedPage("<html></html>", '', '', True)
+        mock_extract_story_content.return_value = "Test Story Content"
+        mock_interpret_story_content.return_value = {"title": "Test Title", "story": "Test Story", "summary": "Test Summary"}
+        mock_generate_summary.side_effect = lambda story_data: story_data
+        mock_update_or_create.return_value = (MagicMock(), True)
+        urls = [f"http://example.com/story{i}" for i in range(10)]
+
+        # Act
+        result = collection.extract_stories_from_urls(urls, MagicMock(), budget=StoryBudget(3))
+
+        # Assert
+        self.assertEqual(result, 3)
+        self.assertEqual(mock_update_or_create.call_count, 3)
+        self.assertEqual(mock_interpret_story_content.call_count, 3)
+
+    @patch('story_collection.collection.record_crawled_url')
+    @patch('story_collection.collection.is_known_story_url', return_value=False)
+    @patch('story_collection.collection.get_crawled_url', return_value=None)
+    @patch('story_collection.collection.fetch_page')
+    @patch('story_collection.collection.extract_story_content')
+    @patch('story_collection.collection.interpret_story_content')
+    @patch('story_collection.collection.generate_summary')
+    @patch('story_collection.collection.Story.objects.update_or_create')
+    def test_extract_story_from_url_releases_budget_when_not_saved(self, mock_update_or_create, mock_generate_summary, mock_interpret_story_content, mock_extract_story_content, mock_fetch_page, mock_get_crawled_url, mock_is_known_story_url, mock_record_crawled_url):
+        # Arrange
+        mock_fetch_page.return_value = FetchedPage("<html></html>", '', '', True)
+        mock_extract_story_content.return_value = "Test Story Content"
+        mock_interpret_story_content.return_value = None
+        budget = StoryBudget(1)
+
+        # Act
+        result = collection.extract_story_from_url("http://example.com/story", MagicMock(), budget, HostLimiter(1))
+        mock_interpret_story_content.return_value = {"title": "Test Title", "story": "Test Story", "summary": "Test Summary"}
+        mock_generate_summary.side_effect = Exception("Summary failed")
+        with self.assertRaises(Exception):
+            collection.extract_story_from_url("http://example.com/story", MagicMock(), budget, HostLimiter(1))
+
+        # Assert
+        self.assertIsNone(result)
+        self.assertEqual(budget.used, 0)
+        mock_update_or_create.assert_not_called()
+
+    @patch('story_collection.collection.generate_summary_from_story')
+    @patch('django.conf.settings.SUMMARY_SINGLE_PASS', True)
+    def test_generate_summary_keeps_checked_summary(self, mock_generate_summary_from_story):
+        # Arrange
+        story_data = {"story": "De gemeente Zwolle legt een nieuw park aan bij het station, met bomen en bankjes.",
+                      "summary": "Zwolle legt een park aan bij het station.", "summary_check": "yes"}
+
+        # Act
+        result = collection.generate_summary(story_data)
+
+        # Assert
+        self.assertEqual(result["summary"], "Zwolle legt een park aan bij het station.")
+        self.assertNotIn("summary_check", result)
+        mock_generate_summary_from_story.assert_not_called()
+
+    @patch('story_collection.collection.generate_summary_from_story')
+    @patch('django.conf.settings.SUMMARY_SINGLE_PASS', True)
+    def test_generate_summary_regenerates_rejected_summary(self, mock_generate_summary_from_story):
+        # Arrange
+        mock_generate_summary_from_story.return_value = "Zwolle legt een park aan."
+        story_data = {"story": "De gemeente Zwolle legt een nieuw park aan bij het station, met bomen en bankjes.",
+                      "summary": "Zwolle legt een park aan bij het station.", "summary_check": "no"}
+
+        # Act
+        result = collection.generate_summary(story_data)
+
+        # Assert
+        self.assertEqual(result["summary"], "Zwolle legt een park aan.")
+        mock_generate_summary_from_story.assert_called_once()
+
+    @patch('story_collection.collection.validate_summary', side_effect=[False])
+    @patch('django.conf.settings.LLM_CACHE_ENABLED', True)
+    @patch('django.conf.settings.SUMMARY_SINGLE_PASS', False)
+    def test_generate_summary_replaces_summary_rejected_by_validation(self, mock_validate_summary):
+        # Arrange
+        client = StubOpenAIClient(responses=['{"summary": "Afgekeurde samenvatting."}',
+                                             '{"summary": "Zwolle legt een park aan."}'])
+        previous_client = set_openai_client(client)
+        self.addCleanup(set_openai_client, previous_client)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        cache = LLMResponseCache(Path(directory.name) / 'llm_cache.sqlite3')
+        story_data = {"story": "De gemeente Zwolle legt een nieuw park aan bij het station, met bomen en bankjes."}
+
+        # Act
+        with patch('ai_utilities.openai_utils.get_llm_cache', return_value=cache):
+            result = collection.generate_summary(story_data)
+
+        # Assert
+        self.assertEqual(result["summary"], "Zwolle legt een park aan.")
+        self.assertEqual(len(client.calls), 2)
 
     def test_sanitize_story_data(self):
         # Arrange
@@ -132,6 +286,570 @@ class TestScrapingUtils(unittest.TestCase):
         # Assert
         self.assertIsNone(result)
 
+    @patch('requests.get')
+    def test_get_scraper_returns_static_document(self, mock_get):
+        # Arrange
+        html = f"<html><body><script>var x;</script><p>{'Nieuws uit de regio. ' * 50}</p></body></html>"
+        mock_response = MagicMock()
+        mock_get.return_value = mock_response
+        mock_response.content = html
+
+        # Act
+        scraper, html_content = get_scraper("http://example.com")
+
+        # Assert
+        self.assertIsInstance(scraper, StaticWebsiteScraper)
+        self.assertIn("Nieuws uit de regio.", html_content)
+        mock_get.assert_called_once()
+
+    @patch('requests.get')
+    def test_get_scraper_escalates_javascript_pages(self, mock_get):
+        # Arrange
+        html = "<html><body><div id='app'></div><script src='app.js'></script></body></html>"
+        mock_response = MagicMock()
+        mock_get.return_value = mock_response
+        mock_response.content = html
+
+        # Act
+        scraper, html_content = get_scraper("http://example.com")
+
+        # Assert
+        self.assertIsInstance(scraper, DynamicWebsiteScraper)
+        self.assertIsNone(html_content)
+
+    @patch('story_collection.scraping_utils.get_scraper')
+    def test_scrape_url_fetches_static_pages_once(self, mock_get_scraper):
+        # Arrange
+        mock_scraper = MagicMock()
+        mock_get_scraper.return_value = (mock_scraper, "<html></html>")
+
+        # Act
+        result = scrape_url("http://example.com")
+
+        # Assert
+        self.assertEqual(result, "<html></html>")
+        mock_scraper.scrape_website.assert_not_called()
+
+    @patch('story_collection.scraping_utils.get_scraper')
+    def test_scrape_url_escalates_to_browser(self, mock_get_scraper):
+        # Arrange
+        mock_scraper = MagicMock()
+        mock_scraper.scrape_website.return_value = "<html>rendered</html>"
+        mock_get_scraper.return_value = (mock_scraper, None)
+
+        # Act
+        result = scrape_url("http://example.com")
+
+        # Assert
+        self.assertEqual(result, "<html>rendered</html>")
+        mock_scraper.scrape_website.assert_called_once_with("http://example.com")
+
+    @patch('requests.get')
+    def test_fetch_page_sends_conditional_headers(self, mock_get):
+        # Arrange
+        mock_response = MagicMock()
+        mock_response.status_code = 304
+        mock_get.return_value = mock_response
+
+        # Act
+        page = fetch_page("http://example.com", etag='"v1"', last_modified='Wed, 21 Oct 2015 07:28:00 GMT')
+
+        # Assert
+        self.assertFalse(page.modified)
+        self.assertIsNone(page.html_content)
+        headers = mock_get.call_args.kwargs['headers']
+        self.assertEqual(headers['If-None-Match'], '"v1"')
+        self.assertEqual(headers['If-Modified-Since'], 'Wed, 21 Oct 2015 07:28:00 GMT')
+
+    @patch('requests.get')
+    def test_fetch_page_returns_validators(self, mock_get):
+        # Arrange
+        mock_response = MagicMock()
+        mock_response.status_code = 200
+        mock_response.content = f"<html><body><p>{'Nieuws uit de regio. ' * 50}</p></body></html>"
+        mock_response.headers = {'ETag': '"v2"', 'Last-Modified': 'Thu, 22 Oct 2015 07:28:00 GMT'}
+        mock_get.return_value = mock_response
+
+        # Act
+        page = fetch_page("http://example.com")
+
+        # Assert
+        self.assertTrue(page.modified)
+        self.assertIn("Nieuws uit de regio.", page.html_content)
+        self.assertEqual(page.etag, '"v2"')
+        self.assertEqual(page.last_modified, 'Thu, 22 Oct 2015 07:28:00 GMT')
+        self.assertEqual(mock_get.call_args.kwargs['headers'], {})
+
+
+# Tests for story_collection/summary_checks.py
+class TestSummaryChecks(unittest.TestCase):
+    story = "De gemeente Zwolle legt een nieuw park aan bij het station. Het park krijgt bomen, bankjes en een " \
+            "speeltuin, en moet volgend jaar klaar zijn."
+
+    def test_check_summary_accepts_good_summary(self):
+        self.assertEqual(check_summary(self.story, "Zwolle legt bij het station een park aan met een speeltuin."), [])
+
+    def test_check_summary_rejects_long_summary(self):
+        self.assertIn('too long', check_summary(self.story, ' '.join(['park'] * 31)))
+
+    def test_check_summary_rejects_other_language(self):
+        summary = "The town of Zwolle is building a park with a playground near the station."
+        self.assertIn('different language', check_summary(self.story, summary))
+
+    def test_check_summary_rejects_unrelated_summary(self):
+        summary = "Het weer wordt morgen zonnig met temperaturen rond twintig graden."
+        self.assertIn('unrelated to the story', check_summary(self.story, summary))
+
+    def test_truncate_summary(self):
+        self.assertEqual(truncate_summary("een twee drie vier", max_words=2), "een twee...")
+
+
+# Tests for story_collection/url_filter.py
+class TestUrlFilter(unittest.TestCase):
+    def test_canonicalize_url(self):
+        self.assertEqual(canonicalize_url("HTTPS://WWW.Example.com:443/nieuws//brand/?utm_source=x&id=1#top"),
+                         "https://www.example.com/nieuws/brand?id=1")
+
+    def test_prefilter_urls(self):
+        # Arrange
+        urls = [
+            "https://www.example.com/",
+            "https://www.example.com/sport",
+            "https://www.example.com/tag/tilburg",
+            "https://www.example.com/logo.png",
+            "https://other.com/nieuws/brand-verwoest-loods-in-tilburg",
+            "https://www.example.com/tilburg/brand-verwoest-loods-in-tilburg~a1234567",
+            "https://www.example.com/tilburg/brand-verwoest-loods-in-tilburg~a1234567/",
+            "https://www.example.com/nieuws/brand",
+        ]
+
+        # Act
+        accepted, ambiguous = prefilter_urls(urls, "https://www.example.com/")
+
+        # Assert
+        self.assertEqual(accepted, ["https://www.example.com/tilburg/brand-verwoest-loods-in-tilburg~a1234567"])
+        self.assertEqual(ambiguous, ["https://www.example.com/nieuws/brand"])
+
+    def test_prefilter_urls_learns_from_known_story_urls(self):
+        # Arrange
+        urls = ["https://example.com/nieuws/brand", "https://example.com/verhaal/kat-vermist"]
+        known_story_urls = ["https://example.com/verhaal/hond-gered", "https://example.com/verhaal/paard-ontsnapt"]
+
+        # Act
+        accepted, ambiguous = prefilter_urls(urls, "https://example.com", known_story_urls)
+
+        # Assert
+        self.assertEqual(accepted, ["https://example.com/verhaal/kat-vermist"])
+        self.assertEqual(ambiguous, ["https://example.com/nieuws/brand"])
+
+    def test_prefilter_urls_does_not_accept_sections_under_story_prefix(self):
+        # Arrange
+        urls = ["https://example.com/nieuws/sport", "https://example.com/nieuws/regio",
+                "https://example.com/nieuws/7654321/kat-vermist"]
+        known_story_urls = ["https://example.com/nieuws/1234567/brand-in-woning-tilburg",
+                            "https://example.com/nieuws/2345678/fietser-gewond"]
+
+        # Act
+        accepted, ambiguous = prefilter_urls(urls, "https://example.com", known_story_urls)
+
+        # Assert
+        self.assertEqual(accepted, ["https://example.com/nieuws/7654321/kat-vermist"])
+        self.assertEqual(ambiguous, ["https://example.com/nieuws/sport", "https://example.com/nieuws/regio"])
+
+
+# Tests for story_collection/content_extraction.py
+class TestContentExtraction(unittest.TestCase):
+    html_content = """
+        <html><head>
+            <meta property="og:title" content="Brand in Tilburg">
+            <meta property="og:image" content="https://example.com/brand.jpg">
+            <meta name="viewport" content="width=device-width">
+        </head><body>
+            <header><nav><a href="/">Home</a><a href="/nieuws">Nieuws</a></nav></header>
+            <div class="cookie-banner"><p>Wij gebruiken cookies om je ervaring op deze website te verbeteren.</p></div>
+            <div class="content">
+                <article>
+                    <h1>Brand in Tilburg</h1>
+                    <p>Een grote brand heeft dinsdagavond een loods in Tilburg verwoest, zo meldt de brandweer.</p>
+                    <p>De brand ontstond rond acht uur, waarna omwonenden werd gevraagd ramen en deuren te sluiten.</p>
+                    <img src="https://example.com/brand.jpg"><img src="https://example.com/brand.jpg">
+                </article>
+                <div class="related-articles"><p>Ook interessant: een ander verhaal over een brand in Breda.</p></div>
+            </div>
+            <footer><p>Copyright 2024, alle rechten voorbehouden, Nieuwsblad Tilburg.</p></footer>
+        </body></html>
+    """
+
+    def test_extract_story_content_removes_boilerplate(self):
+        # Act
+        content = extract_story_content(self.html_content)
+
+        # Assert
+        self.assertIn("Een grote brand heeft dinsdagavond", content['text'])
+        self.assertIn("De brand ontstond rond acht uur", content['text'])
+        self.assertNotIn("cookies", content['text'])
+        self.assertNotIn("Breda", content['text'])
+        self.assertNotIn("Copyright", content['text'])
+        self.assertNotIn("Nieuws", content['text'])
+        self.assertEqual(content['meta_properties'], {'og:title': 'Brand in Tilburg', 'og:image': 'https://example.com/brand.jpg'})
+        self.assertEqual(content['images'], ['https://example.com/brand.jpg'])
+
+    def test_extract_story_content_respects_token_budget(self):
+        # Act
+        content = extract_story_content(self.html_content, max_tokens=60)
+
+        # Assert
+        self.assertTrue(content['text'].startswith("Brand in Tilburg"))
+        self.assertNotIn("De brand ontstond rond acht uur", content['text'])
+
+    def test_truncate_to_token_budget(self):
+        text = "woord " * 100
+        self.assertEqual(truncate_to_token_budget(text, 1000), text)
+        truncated = truncate_to_token_budget(text, 10)
+        self.assertLessEqual(estimate_tokens(truncated), 10)
+        self.assertTrue(truncated.endswith("woord"))
+
+
+# Tests for story_collection/concurrency.py
+class TestConcurrency(unittest.TestCase):
+    def test_story_budget(self):
+        budget = StoryBudget(2)
+        self.assertTrue(budget.reserve())
+        self.assertTrue(budget.reserve())
+        self.assertFalse(budget.reserve())
+        self.assertTrue(budget.exhausted())
+        budget.release()
+        self.assertFalse(budget.exhausted())
+
+    def test_unlimited_story_budget(self):
+        budget = StoryBudget(None)
+        for _ in range(100):
+            self.assertTrue(budget.reserve())
+        self.assertFalse(budget.exhausted())
+
+    def test_host_limiter_limits_concurrency_per_host(self):
+        # Arrange
+        host_limiter = HostLimiter(max_per_host=2)
+        active = {'example.com': 0, 'example.org': 0}
+        peak = {'example.com': 0, 'example.org': 0}
+        lock = threading.Lock()
+
+        def fetch(url, host):
+            with host_limiter.limit(url):
+                with lock:
+                    active[host] += 1
+                    peak[host] = max(peak[host], active[host])
+                time.sleep(0.01)
+                with lock:
+                    active[host] -= 1
+
+        # Act
+        threads = [threading.Thread(target=fetch, args=(f"http://{host}/{i}", host))
+                   for i in range(6) for host in ('example.com', 'example.org')]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # Assert
+        self.assertLessEqual(peak['example.com'], 2)
+        self.assertLessEqual(peak['example.org'], 2)
+
+
+# Tests for incremental crawling in story_collection/collection.py and story_collection/seen_urls.py
+class TestIncrementalCrawling(TestCase):
+    def setUp(self):
+        self.source = Source.objects.create(name='Source', website='https://example.com')
+        self.url = 'https://example.com/nieuws/story-about-the-town'
+        self.html = f"<html><body><p>{'Nieuws uit de regio. ' * 50}</p></body></html>"
+
+    def extract(self, page):
+        with patch('story_collection.collection.fetch_page', return_value=page) as mock_fetch_page, \
+                patch('story_collection.collection.interpret_story_content') as mock_interpret_story_content, \
+                patch('story_collection.collection.generate_summary', side_effect=lambda story_data: story_data), \
+                patch('news_hyperlocalizer.threads.connection'):
+            mock_interpret_story_content.return_value = {'title': 'Title', 'story': 'Story', 'summary': 'Summary'}
+            story = collection.extract_story_from_url(self.url, self.source, StoryBudget(), HostLimiter(2))
+        return story, mock_fetch_page, mock_interpret_story_content
+
+    @patch('django.conf.settings.COLLECTION_REFRESH_INTERVAL', None)
+    def test_new_url_is_collected_and_fingerprinted(self):
+        # Act
+        story, mock_fetch_page, mock_interpret_story_content = self.extract(FetchedPage(self.html, '"v1"', '', True))
+
+        # Assert
+        self.assertIsNotNone(story)
+        crawled_url = CrawledUrl.objects.get(url=self.url)
+        self.assertEqual(crawled_url.etag, '"v1"')
+        self.assertEqual(len(crawled_url.contentHash), 64)
+        mock_fetch_page.assert_called_once_with(self.url)
+
+    @patch('django.conf.settings.COLLECTION_REFRESH_INTERVAL', None)
+    def test_unchanged_content_is_not_interpreted_again(self):
+        # Arrange
+        self.extract(FetchedPage(self.html, '"v1"', '', True))
+
+        # Act
+        story, mock_fetch_page, mock_interpret_story_content = self.extract(FetchedPage(self.html, '"v2"', '', True))
+
+        # Assert
+        self.assertIsNone(story)
+        mock_fetch_page.assert_called_once_with(self.url, '"v1"', '')
+        mock_interpret_story_content.assert_not_called()
+        self.assertEqual(CrawledUrl.objects.get(url=self.url).etag, '"v2"')
+
+    @patch('django.conf.settings.COLLECTION_REFRESH_INTERVAL', None)
+    def test_not_modified_page_is_skipped(self):
+        # Arrange
+        CrawledUrl.objects.create(source=self.source, url=self.url, etag='"v1"', lastCrawled=timezone.now())
+
+        # Act
+        story, mock_fetch_page, mock_interpret_story_content = self.extract(FetchedPage(None, '"v1"', '', False))
+
+        # Assert
+        self.assertIsNone(story)
+        mock_interpret_story_content.assert_not_called()
+
+    @patch('django.conf.settings.COLLECTION_REFRESH_INTERVAL', None)
+    def test_changed_content_is_interpreted_again(self):
+        # Arrange
+        CrawledUrl.objects.create(source=self.source, url=self.url, contentHash=hash_content('old'), lastCrawled=timezone.now())
+
+        # Act
+        story, mock_fetch_page, mock_interpret_story_content = self.extract(FetchedPage(self.html, '', '', True))
+
+        # Assert
+        self.assertIsNotNone(story)
+        self.assertEqual(Story.objects.filter(url=self.url).count(), 1)
+
+    @patch('django.conf.settings.COLLECTION_REFRESH_INTERVAL', None)
+    def test_existing_story_without_fingerprint_is_skipped(self):
+        # Arrange
+        Story.objects.create(title='Title', summary='Summary', url=self.url, source=self.source)
+
+        # Act
+        story, mock_fetch_page, mock_interpret_story_content = self.extract(FetchedPage(self.html, '', '', True))
+
+        # Assert
+        self.assertIsNone(story)
+        mock_interpret_story_content.assert_not_called()
+        self.assertTrue(CrawledUrl.objects.filter(url=self.url).exists())
+
+    @patch('django.conf.settings.COLLECTION_REFRESH_INTERVAL', None)
+    def test_story_stored_with_trailing_slash_is_not_collected_twice(self):
+        # Arrange
+        Story.objects.create(title='Title', summary='Summary', url=self.url + '/', source=self.source)
+        self.extract(FetchedPage(self.html, '', '', True))
+        CrawledUrl.objects.filter(url=self.url).update(contentHash=hash_content('old'))
+
+        # Act
+        story, mock_fetch_page, mock_interpret_story_content = self.extract(FetchedPage(self.html, '', '', True))
+
+        # Assert
+        self.assertEqual(story.url, self.url)
+        self.assertEqual(Story.objects.count(), 1)
+
+    @patch('django.conf.settings.COLLECTION_REFRESH_INTERVAL', 60 * 60)
+    def test_recently_crawled_url_is_not_fetched(self):
+        # Arrange
+        CrawledUrl.objects.create(source=self.source, url=self.url, lastCrawled=timezone.now() - timedelta(minutes=5))
+
+        # Act
+        story, mock_fetch_page, mock_interpret_story_content = self.extract(FetchedPage(self.html, '', '', True))
+
+        # Assert
+        self.assertIsNone(story)
+        mock_fetch_page.assert_not_called()
+
+
+# Tests for story_collection/scheduler.py
+class TestCrawlScheduler(TestCase):
+    def setUp(self):
+        self.daily = Source.objects.create(name='Daily', website='https://daily.example.com', releaseFrequency=ReleaseFrequency.DAILY)
+        self.monthly = Source.objects.create(name='Monthly', website='https://monthly.example.com', releaseFrequency=ReleaseFrequency.MONTHLY)
+        Source.objects.create(name='No website', website='')
+
+    def test_adjust_interval_factor(self):
+        self.assertEqual(adjust_interval_factor(1, 0, 5), 2)
+        self.assertEqual(adjust_interval_factor(1, 5, 5), 0.5)
+        self.assertEqual(adjust_interval_factor(1, 2, 5), 1)
+        self.assertEqual(adjust_interval_factor(4, 0, 5), 4)
+
+    def test_load_schedules_new_sources_as_due(self):
+        # Act
+        scheduler = CrawlScheduler()
+        scheduler.load()
+
+        # Assert
+        self.assertEqual(SourceSchedule.objects.count(), 2)
+        self.assertEqual(sorted(scheduler.pop_due_sources()), sorted([self.daily.id, self.monthly.id]))
+
+    @patch('story_collection.scheduler.collect_stories_from_source')
+    def test_run_once_reschedules_by_release_frequency(self, mock_collect_stories_from_source):
+        # Arrange
+        mock_collect_stories_from_source.return_value = 2
+        scheduler = CrawlScheduler(max_workers=2)
+
+        # Act
+        results = scheduler.run_once()
+
+        # Assert
+        self.assertEqual(results, {self.daily.id: 2, self.monthly.id: 2})
+        daily_schedule = SourceSchedule.objects.get(source=self.daily)
+        monthly_schedule = SourceSchedule.objects.get(source=self.monthly)
+        self.assertEqual(daily_schedule.lastYield, 2)
+        self.assertAlmostEqual((daily_schedule.nextDue - daily_schedule.lastCrawled).total_seconds(), timedelta(days=1).total_seconds())
+        self.assertAlmostEqual((monthly_schedule.nextDue - monthly_schedule.lastCrawled).total_seconds(), timedelta(days=30).total_seconds())
+
+        # Nothing is due anymore, also not after a restart
+        self.assertEqual(scheduler.run_once(), {})
+        self.assertEqual(CrawlScheduler().run_once(), {})
+        self.assertEqual(mock_collect_stories_from_source.call_count, 2)
+
+    @patch('story_collection.scheduler.collect_stories_from_source')
+    def test_run_once_respects_max_sources(self, mock_collect_stories_from_source):
+        # Arrange
+        mock_collect_stories_from_source.return_value = 0
+        scheduler = CrawlScheduler(max_sources=1)
+
+        # Act
+        results = scheduler.run_once()
+
+        # Assert
+        self.assertEqual(len(results), 1)
+        schedule = SourceSchedule.objects.get(source_id=list(results)[0])
+        self.assertEqual(schedule.intervalFactor, 2)
+        self.assertEqual(len(scheduler.run_once()), 1)
+
+    def test_pop_due_sources_orders_by_next_due(self):
+        # Arrange
+        now = timezone.now()
+        SourceSchedule.objects.create(source=self.daily, nextDue=now - timedelta(hours=1))
+        SourceSchedule.objects.create(source=self.monthly, nextDue=now - timedelta(hours=2))
+        scheduler = CrawlScheduler()
+        scheduler.load(now)
+
+        # Act & Assert
+        self.assertEqual(scheduler.pop_due_sources(now), [self.monthly.id, self.daily.id])
+
+
+# Fake webdriver, so the browser pool can be tested without starting a browser
+class FakeDriver:
+    def __init__(self):
+        self.page_source = "<html></html>"
+        self.visited = []
+        self.quit_called = False
+
+    def get(self, url):
+        self.visited.append(url)
+        if url != 'about:blank':
+            self.page_source = f"<html><body>{url}</body></html>"
+
+    def execute_script(self, script):
+        return 'complete'
+
+    def delete_all_cookies(self):
+        pass
+
+    def quit(self):
+        self.quit_called = True
+
+
+# Tests for story_collection/browser_pool.py
+class TestBrowserPool(unittest.TestCase):
+    def setUp(self):
+        self.drivers = []
+
+    def driver_factory(self):
+        driver = FakeDriver()
+        self.drivers.append(driver)
+        return driver
+
+    def test_driver_is_reused_and_reset(self):
+        # Arrange
+        pool = BrowserPool(driver_factory=self.driver_factory, size=1, max_pages=10)
+
+        # Act
+        with pool.driver() as driver:
+            driver.get("http://example.com/1")
+        with pool.driver() as driver:
+            driver.get("http://example.com/2")
+
+        # Assert
+        self.assertEqual(len(self.drivers), 1)
+        self.assertEqual(self.drivers[0].visited, ["http://example.com/1", "about:blank", "http://example.com/2", "about:blank"])
+        self.assertEqual(pool.stats()['pages'], 2)
+
+    def test_driver_is_recycled_after_max_pages(self):
+        # Arrange
+        pool = BrowserPool(driver_factory=self.driver_factory, size=1, max_pages=2)
+
+        # Act
+        for _ in range(3):
+            with pool.driver() as driver:
+                driver.get("http://example.com")
+
+        # Assert
+        self.assertEqual(len(self.drivers), 2)
+        self.assertTrue(self.drivers[0].quit_called)
+        self.assertFalse(self.drivers[1].quit_called)
+        self.assertEqual(pool.stats()['drivers_recycled'], 1)
+
+    def test_driver_is_recycled_on_crash(self):
+        # Arrange
+        pool = BrowserPool(driver_factory=self.driver_factory, size=1)
+
+        # Act
+        with self.assertRaises(RuntimeError):
+            with pool.driver():
+                raise RuntimeError("browser crashed")
+        with pool.driver() as driver:
+            driver.get("http://example.com")
+
+        # Assert
+        self.assertEqual(len(self.drivers), 2)
+        self.assertTrue(self.drivers[0].quit_called)
+
+    def test_pool_is_bounded(self):
+        # Arrange
+        pool = BrowserPool(driver_factory=self.driver_factory, size=1, checkout_timeout=0.01)
+
+        # Act & Assert
+        with pool.driver():
+            with self.assertRaises(TimeoutError):
+                with pool.driver():
+                    pass
+        self.assertEqual(len(self.drivers), 1)
+
+    def test_close_quits_idle_drivers(self):
+        # Arrange
+        pool = BrowserPool(driver_factory=self.driver_factory, size=2)
+        with pool.driver():
+            pass
+
+        # Act
+        pool.close()
+
+        # Assert
+        self.assertTrue(self.drivers[0].quit_called)
+        with self.assertRaises(RuntimeError):
+            with pool.driver():
+                pass
+
+    def test_dynamic_website_scraper_uses_pool(self):
+        # Arrange
+        pool = BrowserPool(driver_factory=self.driver_factory, size=1)
+        scraper = DynamicWebsiteScraper(pool=pool)
+
+        # Act
+        result = scraper.scrape_website("http://example.com")
+
+        # Assert
+        self.assertEqual(result, "<html><body>http://example.com</body></html>")
+        stats = pool.stats()
+        self.assertEqual(stats['pages'], 1)
+        self.assertGreaterEqual(stats['average_render_time'], 0)
+
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
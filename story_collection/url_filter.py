@@ -0,0 +1,150 @@
+import re
+from collections import Counter
+from urllib.parse import urlparse, urlunparse, parse_qsl, urlencode
+
+# Query parameters that only track where a visitor came from
+TRACKING_PARAMETERS = re.compile(r'^(utm_.*|fbclid|gclid|dclid|msclkid|mc_cid|mc_eid|_ga|ref|share)$', re.IGNORECASE)
+
+# Links to files, which are never news stories
+NON_STORY_EXTENSIONS = re.compile(r'\.(jpe?g|png|gif|webp|svg|ico|pdf|zip|mp3|mp4|css|js|xml|json|rss|docx?|xlsx?)$',
+                                  re.IGNORECASE)
+
+# Path segments of pages that list, search or describe content, instead of being a story themselves
+NON_STORY_SEGMENTS = {
+    'tag', 'tags', 'categorie', 'category', 'categories', 'rubriek', 'rubrieken', 'thema', 'zoeken', 'search',
+    'contact', 'over-ons', 'about', 'about-us', 'login', 'inloggen', 'registreren', 'account', 'privacy',
+    'privacyverklaring', 'cookies', 'cookiebeleid', 'disclaimer', 'abonnement', 'abonneren', 'adverteren',
+    'colofon', 'page', 'pagina', 'author', 'auteur', 'feed', 'rss', 'wp-admin', 'wp-login.php', 'archief',
+    'archive', 'nieuwsbrief', 'newsletter', 'vacatures', 'voorwaarden', 'algemene-voorwaarden', 'sitemap',
+}
+
+SOCIAL_HOSTS = {
+    'facebook.com', 'twitter.com', 'x.com', 'instagram.com', 'linkedin.com', 'youtube.com', 'whatsapp.com',
+    'pinterest.com', 'tiktok.com', 't.me', 'wa.me',
+}
+
+DATE_PATTERN = re.compile(r'/(19|20)\d{2}/\d{1,2}(/\d{1,2})?(/|$)|(19|20)\d{2}-\d{2}-\d{2}')
+ID_PATTERN = re.compile(r'\d{5,}')
+
+# URLs scoring at least ACCEPT_SCORE are stories, URLs scoring at most REJECT_SCORE are not. Others are ambiguous.
+ACCEPT_SCORE = 3
+REJECT_SCORE = -1
+
+
+def canonicalize_url(url):
+    parsed = urlparse(url.strip())
+    host = (parsed.hostname or '').lower()
+    if parsed.port and not (parsed.scheme == 'http' and parsed.port == 80
+                            or parsed.scheme == 'https' and parsed.port == 443):
+        host = f'{host}:{parsed.port}'
+
+    query = urlencode([(key, value) for key, value in parse_qsl(parsed.query, keep_blank_values=True)
+                       if not TRACKING_PARAMETERS.match(key)])
+    path = re.sub(r'/{2,}', '/', parsed.path).rstrip('/') or '/'
+    return urlunparse((parsed.scheme.lower(), host, path, '', query, ''))
+
+
+def site_host(url):
+    host = (urlparse(url).hostname or '').lower()
+    return host[4:] if host.startswith('www.') else host
+
+
+def is_same_site(url, source_url):
+    host = site_host(url)
+    source = site_host(source_url)
+    return host == source or host.endswith('.' + source)
+
+
+def path_segments(url):
+    return [segment for segment in urlparse(url).path.lower().split('/') if segment]
+
+
+def segment_shape(segment):
+    if segment.isdigit():
+        return '{year}' if len(segment) == 4 and segment[:2] in ('19', '20') else '{number}'
+    if ID_PATTERN.search(segment):
+        return '{id}'
+    if segment.count('-') >= 2:
+        return '{slug}'
+    return segment
+
+
+def path_shape(url):
+    shapes = [segment_shape(segment) for segment in path_segments(url)]
+
+    # The last segment of a deeper path that looks like a slug identifies the page itself, so only its kind matters.
+    # A plain word, such as the sport of /nieuws/sport, is more likely a section of the website.
+    segments = path_segments(url)
+    if len(shapes) > 1 and not shapes[-1].startswith('{') and '-' in segments[-1]:
+        shapes[-1] = '{slug}'
+    return '/' + '/'.join(shapes)
+
+
+# Learn the URL patterns of a source from the URLs of its known stories
+class UrlPatterns:
+    def __init__(self, story_urls=()):
+        story_urls = list(story_urls)
+        self.shapes = Counter(path_shape(url) for url in story_urls)
+        self.prefixes = Counter(path_segments(url)[0] for url in story_urls if path_segments(url))
+
+
+def score_url(url, patterns=None):
+    segments = path_segments(url)
+    if not segments:
+        return -3
+
+    score = 0
+    if DATE_PATTERN.search(urlparse(url).path):
+        score += 2
+    if any(segment.count('-') >= 2 for segment in segments):
+        score += 2
+    if any(ID_PATTERN.search(segment) for segment in segments):
+        score += 1
+    if any(segment in NON_STORY_SEGMENTS for segment in segments):
+        score -= 3
+    if len(segments) == 1 and segment_shape(segments[0]) == segments[0] and '-' not in segments[0]:
+        # A single plain word is usually a section of the website, such as /sport
+        score -= 1
+    if re.search(r'(^|&)(page|p|s|q)=', urlparse(url).query):
+        score -= 2
+
+    # URLs shaped like the known stories of the source are very likely stories as well
+    if patterns is not None:
+        if patterns.shapes[path_shape(url)]:
+            score += 3
+        elif patterns.prefixes[segments[0]]:
+            score += 1
+
+    return score
+
+
+# Split the URLs found on a source into the ones that are likely stories, and the ambiguous ones.
+# URLs are canonicalised and deduplicated, and off-site, social, file and listing links are dropped.
+def prefilter_urls(urls, source_url, known_story_urls=()):
+    patterns = UrlPatterns(known_story_urls)
+    source_url = canonicalize_url(source_url)
+
+    accepted = []
+    ambiguous = []
+    seen = {source_url}
+    for url in urls:
+        if urlparse(url).scheme not in ('http', 'https'):
+            continue
+
+        url = canonicalize_url(url)
+        if url in seen:
+            continue
+        seen.add(url)
+
+        if not is_same_site(url, source_url) or site_host(url) in SOCIAL_HOSTS:
+            continue
+        if NON_STORY_EXTENSIONS.search(urlparse(url).path):
+            continue
+
+        score = score_url(url, patterns)
+        if score >= ACCEPT_SCORE:
+            accepted.append(url)
+        elif score > REJECT_SCORE:
+            ambiguous.append(url)
+
+    return accepted, ambiguous
@@ -1,3 +1,19 @@
 from django.contrib import admin
+from story_evaluation.models import UserNeedsFailure, StoryEvaluationStage
 
-# Register your models here.
+
+class UserNeedsFailureAdmin(admin.ModelAdmin):
+    list_display = ('story', 'statusCode', 'attempts', 'lastAttempt')
+    search_fields = ('story__title', 'error')
+
+
+admin.site.register(UserNeedsFailure, UserNeedsFailureAdmin)
+
+
+class StoryEvaluationStageAdmin(admin.ModelAdmin):
+    list_display = ('story', 'stage', 'status', 'updated')
+    list_filter = ('stage', 'status')
+    search_fields = ('story__title',)
+
+
+admin.site.register(StoryEvaluationStage, StoryEvaluationStageAdmin)
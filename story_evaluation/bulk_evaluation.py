@@ -0,0 +1,156 @@
+import json
+from itertools import islice
+
+from django.db import transaction
+from django.db.models import QuerySet
+
+from .models import Story, LabelType
+from .story_labels import BATCH_SETUP_PROMPT, BATCH_ANSWER_FORMAT, build_batch_content, parse_labels_per_story, \
+    save_labels
+from ai_utilities.batch import BatchError, build_batch_request, run_batch, is_expired_error
+from ai_utilities.openai_utils import JSON_SCHEMAS
+from story_collection.collection import SUMMARY_SETUP_PROMPT, SUMMARY_ANSWER_FORMAT
+from story_collection.summary_checks import truncate_summary
+from stories.caching import invalidate_cache
+from stories.search import index_story
+
+# Stories read from the database at a time, when building the requests and when applying the results
+CHUNK_SIZE = 500
+
+# Times the requests that expired before their batch finished are submitted again
+MAX_RESUBMISSIONS = 2
+
+# The story fields the requests are built from, and the search index is updated from when a result is applied
+STORY_FIELDS = ('id', 'title', 'summary', 'story', 'author')
+
+
+def build_label_requests(stories):
+    for story in stories:
+        yield build_batch_request(f'labels-{story.id}', BATCH_SETUP_PROMPT, build_batch_content([story]),
+                                  BATCH_ANSWER_FORMAT, JSON_SCHEMAS['story_labels_batch'])
+
+
+def build_summary_requests(stories):
+    for story in stories:
+        yield build_batch_request(f'summary-{story.id}', SUMMARY_SETUP_PROMPT, story.story, SUMMARY_ANSWER_FORMAT,
+                                  JSON_SCHEMAS['story_summary'])
+
+
+def apply_label_result(story, content):
+    story_labels = parse_labels_per_story(content, {story.id}).get(story.id)
+    if story_labels is None:
+        return False
+
+    with transaction.atomic():
+        save_labels(story, story_labels['topics'], LabelType.TOPIC)
+        save_labels(story, story_labels['locations'], LabelType.LOCATION)
+    return True
+
+
+def apply_summary_result(story, content):
+    try:
+        summary = json.loads(content)['summary']
+    except (json.JSONDecodeError, KeyError, TypeError):
+        return False
+    if not summary:
+        return False
+
+    story.summary = truncate_summary(summary)
+    Story.objects.filter(id=story.id).update(summary=story.summary)
+    index_story(story)
+    return True
+
+
+BULK_TASKS = {
+    'labels': (build_label_requests, apply_label_result),
+    'summaries': (build_summary_requests, apply_summary_result),
+}
+
+
+def iter_stories(stories, chunk_size=CHUNK_SIZE):
+    # Stream the stories in chunks paginated on the id, so the stories are never all in memory or in one query
+    if isinstance(stories, QuerySet):
+        for chunk in stories.iter_chunks(chunk_size, fields=STORY_FIELDS):
+            yield from chunk
+    else:
+        yield from stories
+
+
+def iter_stories_by_id(story_ids, chunk_size=CHUNK_SIZE):
+    for start in range(0, len(story_ids), chunk_size):
+        chunk_ids = story_ids[start:start + chunk_size]
+        stories = Story.objects.only(*STORY_FIELDS).in_bulk(chunk_ids)
+        yield from (stories[story_id] for story_id in chunk_ids if story_id in stories)
+
+
+def parse_story_id(custom_id):
+    try:
+        return int(custom_id.rsplit('-', 1)[1])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+# Apply the results of a batch, reading the stories of each chunk of results in one query, and making the cached API
+# responses stale once per chunk. Returns the number of applied and failed results, and the ids of the stories whose
+# requests expired.
+def apply_batch_results(results, apply_result, chunk_size=CHUNK_SIZE):
+    applied = 0
+    failed = 0
+    expired_ids = []
+    results = iter(results)
+    while chunk := list(islice(results, chunk_size)):
+        stories = Story.objects.only(*STORY_FIELDS).in_bulk(
+            [story_id for story_id in (parse_story_id(custom_id) for custom_id, content, error in chunk)
+             if story_id is not None])
+
+        for custom_id, content, error in chunk:
+            story = stories.get(parse_story_id(custom_id))
+            if story is None:
+                print(f"No Story object found for batch result '{custom_id}'")
+                failed += 1
+            elif is_expired_error(error):
+                expired_ids.append(story.id)
+            elif error is not None or not apply_result(story, content):
+                print(f"Failed to apply the batch result for story '{story.title}': {error}")
+                failed += 1
+            else:
+                applied += 1
+        invalidate_cache()
+
+    return applied, failed, expired_ids
+
+
+# Re-evaluate many stories at once through the Batch API, applying the results to the stories as they are read. The
+# requests that expired before the batch finished are submitted again in a new batch. The requests of a batch that
+# failed or timed out count as failed.
+def run_bulk_evaluation(task, stories, backend=None, limit=None, chunk_size=CHUNK_SIZE, **batch_options):
+    build_requests, apply_result = BULK_TASKS[task]
+    requests = build_requests(islice(iter_stories(stories, chunk_size), limit))
+
+    applied = 0
+    failed = 0
+    for attempt in range(MAX_RESUBMISSIONS + 1):
+        name = task if attempt == 0 else f'{task}_resubmission_{attempt}'
+        try:
+            batch_applied, batch_failed, expired_ids = apply_batch_results(
+                run_batch(requests, backend=backend, name=name, **batch_options), apply_result, chunk_size)
+        except BatchError as e:
+            # The results of a batch are only read once it has finished, so none of its requests were applied
+            print(f"An error occurred while running the {task} batch: {e}")
+            failed += e.request_count
+            break
+        applied += batch_applied
+        failed += batch_failed
+        if not expired_ids:
+            break
+
+        if attempt == MAX_RESUBMISSIONS:
+            print(f"The {task} requests of {len(expired_ids)} stories expired {attempt + 1} times, giving up on "
+                  f"stories {', '.join(str(story_id) for story_id in expired_ids)}")
+            failed += len(expired_ids)
+            break
+        print(f"The {task} requests of {len(expired_ids)} stories expired, submitting them again")
+        requests = build_requests(iter_stories_by_id(expired_ids, chunk_size))
+
+    print(f"Applied {applied} {task} results, {failed} failed")
+    return {'applied': applied, 'failed': failed}
@@ -1,7 +1,110 @@
-from story_evaluation.story_labels import classify_story
-from story_evaluation.story_userneeds import evaluate_story_userneeds
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
 
+from news_hyperlocalizer.threads import closes_db_connection
+from story_evaluation.models import LabelType, EvaluationStage, EvaluationStageStatus, StoryEvaluationStage
+from story_evaluation.story_labels import TOPIC_SETUP_PROMPT, TOPIC_ANSWER_FORMAT, LOCATION_SETUP_PROMPT, \
+    LOCATION_ANSWER_FORMAT, collect_topics_for_story, collect_locations_for_story, save_labels
+from story_evaluation.story_userneeds import collect_story_userneeds, save_story_userneeds, record_failures, \
+    UserNeedsError
 
-def evaluate_story(story):
-    evaluate_story_userneeds(story)
-    classify_story(story)
\ No newline at end of file
+# A stage collects its result in a worker thread, which may only read from the database, and applies the result in
+# the calling thread. The inputs of a stage are the values that change its result; a prompt change reruns the stage.
+StageDefinition = namedtuple('StageDefinition', ['inputs', 'collect', 'apply', 'fail'])
+
+
+def fail_userneeds(story, error):
+    if isinstance(error, UserNeedsError):
+        record_failures([(story, error)])
+
+
+EVALUATION_STAGES = {
+    EvaluationStage.USERNEEDS: StageDefinition(
+        inputs=lambda story: [story.story],
+        collect=collect_story_userneeds,
+        apply=save_story_userneeds,
+        fail=fail_userneeds,
+    ),
+    EvaluationStage.TOPICS: StageDefinition(
+        inputs=lambda story: [TOPIC_SETUP_PROMPT, TOPIC_ANSWER_FORMAT, story.title, story.summary, story.story],
+        # A failed request raises, so the stage is recorded as failed and runs again
+        collect=lambda story: collect_topics_for_story(story, raise_errors=True),
+        apply=lambda story, labels: save_labels(story, labels, LabelType.TOPIC),
+        fail=None,
+    ),
+    EvaluationStage.LOCATIONS: StageDefinition(
+        inputs=lambda story: [LOCATION_SETUP_PROMPT, LOCATION_ANSWER_FORMAT, story.title, story.summary, story.story],
+        collect=lambda story: collect_locations_for_story(story, raise_errors=True),
+        apply=lambda story, labels: save_labels(story, labels, LabelType.LOCATION),
+        fail=None,
+    ),
+}
+
+
+def hash_stage_inputs(story, stage):
+    inputs = EVALUATION_STAGES[stage].inputs(story)
+    return hashlib.sha256('\0'.join(value or '' for value in inputs).encode('utf-8')).hexdigest()
+
+
+def find_pending_stages(stories, stages=None):
+    # Return {story id: [stage]} with the stages of each story that never ran, failed, or ran on other inputs
+    stages = stages or list(EVALUATION_STAGES)
+    stories = list(stories)
+    finished = {
+        (story_id, stage): input_hash
+        for story_id, stage, input_hash in StoryEvaluationStage.objects.filter(
+            story__in=[story.id for story in stories], stage__in=stages, status=EvaluationStageStatus.DONE
+        ).values_list('story_id', 'stage', 'inputHash')
+    }
+    return {
+        story.id: [stage for stage in stages if finished.get((story.id, stage)) != hash_stage_inputs(story, stage)]
+        for story in stories
+    }
+
+
+@closes_db_connection
+def collect_stage_result(stage, story):
+    try:
+        return EVALUATION_STAGES[stage].collect(story), None
+    except Exception as e:
+        return None, e
+
+
+# Run the evaluation stages of the story that are pending, running the independent stages in parallel. Returns
+# {stage: status} for every requested stage, with None for the stages that were skipped.
+def evaluate_story(story, stages=None, force=False):
+    stages = stages or list(EVALUATION_STAGES)
+    pending = stages if force else find_pending_stages([story], stages)[story.id]
+    results = {stage: None for stage in stages}
+    if not pending:
+        return results
+
+    input_hashes = {stage: hash_stage_inputs(story, stage) for stage in pending}
+    with ThreadPoolExecutor(max_workers=len(pending)) as executor:
+        futures = {stage: executor.submit(collect_stage_result, stage, story) for stage in pending}
+
+    # The results are applied one by one, so the stages never write to the database at the same time
+    for stage, future in futures.items():
+        result, error = future.result()
+        if error is None:
+            try:
+                EVALUATION_STAGES[stage].apply(story, result)
+            except Exception as e:
+                error = e
+
+        if error is None:
+            status = EvaluationStageStatus.DONE
+        else:
+            print(f"An error occurred in the {stage} stage of story '{story.title}': {error}")
+            status = EvaluationStageStatus.FAILED
+            if EVALUATION_STAGES[stage].fail is not None:
+                EVALUATION_STAGES[stage].fail(story, error)
+
+        StoryEvaluationStage.objects.update_or_create(
+            story=story, stage=stage,
+            defaults={'status': status, 'inputHash': input_hashes[stage], 'error': '' if error is None else str(error)},
+        )
+        results[stage] = status
+
+    return results
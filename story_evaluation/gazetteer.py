@@ -0,0 +1,192 @@
+import threading
+import time
+from collections import deque
+from pathlib import Path
+
+from django.conf import settings
+
+from .models import Source, Label, LabelType
+
+GAZETTEER_PATH = Path(__file__).resolve().parent / 'data' / 'gazetteer.txt'
+
+# Existing location labels longer than this are unlikely to be plain place names
+MAX_LABEL_WORDS = 4
+
+# Characters before a match that mean it starts a sentence, where any word is capitalised
+SENTENCE_ENDS = '.!?:\n'
+
+
+# Aho-Corasick automaton, finding all occurrences of many patterns in a single pass over the text
+class AhoCorasick:
+    def __init__(self):
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [[]]
+
+    def add(self, pattern, value):
+        state = 0
+        for char in pattern:
+            if char not in self.goto[state]:
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append([])
+                self.goto[state][char] = len(self.goto) - 1
+            state = self.goto[state][char]
+        self.output[state].append((len(pattern), value))
+
+    def build(self):
+        # Breadth-first, link every state to the longest proper suffix that is also a state
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fail_state = self.fail[state]
+                while fail_state and char not in self.goto[fail_state]:
+                    fail_state = self.fail[fail_state]
+                self.fail[next_state] = self.goto[fail_state].get(char, 0)
+                if self.fail[next_state] == next_state:
+                    self.fail[next_state] = 0
+                self.output[next_state] = self.output[next_state] + self.output[self.fail[next_state]]
+        return self
+
+    def iter_matches(self, text):
+        # Yield (start, end, value) for every pattern occurring in the text
+        state = 0
+        for index, char in enumerate(text):
+            while state and char not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(char, 0)
+            for length, value in self.output[state]:
+                yield index - length + 1, index + 1, value
+
+
+def lower(text):
+    # Lowercase the text without changing its length, so positions in the lowercase text match the original text
+    return ''.join(char if len(char.lower()) != 1 else char.lower() for char in text)
+
+
+def read_gazetteer_file(path=GAZETTEER_PATH):
+    # Return the {alias: (name, ambiguous)} entries of a gazetteer file, and the names of the areas in it
+    entries = {}
+    areas = set()
+    with open(path, encoding='utf-8') as file:
+        for line in file:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            alias, _, name = line.partition('=')
+            alias = alias.strip()
+            ambiguous = '*' in alias
+            area = '^' in alias
+            alias = alias.rstrip('*^').strip()
+            name = (name.strip() or alias).rstrip('*^')
+            entries[alias] = (name, ambiguous)
+            if area:
+                areas.add(name)
+    return entries, areas
+
+
+class Gazetteer:
+    def __init__(self, entries, areas=()):
+        self.entries = entries
+        # Names of countries, provinces and regions, which are larger than the municipalities and towns
+        self.areas = set(areas)
+        self.automaton = AhoCorasick()
+        for alias in entries:
+            self.automaton.add(lower(alias), alias)
+        self.automaton.build()
+
+    def is_area(self, name):
+        return name in self.areas
+
+    def find_mentions(self, text):
+        # Return the (start, end, alias) of each place name in the text, preferring the longest of overlapping names
+        lower_text = lower(text)
+        matches = []
+        for start, end, alias in self.automaton.iter_matches(lower_text):
+            if start > 0 and lower_text[start - 1].isalnum() or end < len(lower_text) and lower_text[end].isalnum():
+                continue
+            matches.append((start, end, alias))
+
+        mentions = []
+        last_end = -1
+        for start, end, alias in sorted(matches, key=lambda match: (match[0], match[0] - match[1])):
+            if start >= last_end:
+                mentions.append((start, end, alias))
+                last_end = end
+        return mentions
+
+    def tag(self, text, title=''):
+        # Return the location labels found in the text, and whether any mention is ambiguous
+        counts = {}
+        ambiguous = False
+        for start, end, alias in self.find_mentions(text):
+            name, ambiguous_name = self.entries[alias]
+            first_letter = next((char for char in text[start:end] if char.isalpha()), '')
+
+            # Place names are capitalised, so lowercase matches are ordinary words
+            if not first_letter.isupper() and not text[start:end].startswith("'s"):
+                continue
+
+            if ambiguous_name:
+                preceding = text[:start].rstrip()
+                if not preceding or preceding[-1] in SENTENCE_ENDS:
+                    # A capital at the start of a sentence does not tell whether the place is meant
+                    ambiguous = True
+                    continue
+
+            counts[name] = counts.get(name, 0) + 1
+
+        title_names = {self.entries[alias][0] for start, end, alias in self.find_mentions(title)}
+        labels = [
+            {'name': name, 'confidence': location_confidence(count, name in title_names)}
+            for name, count in sorted(counts.items(), key=lambda item: -item[1])
+        ]
+        return labels, ambiguous
+
+
+def location_confidence(mentions, in_title):
+    # Places mentioned more often, or in the title, are more central to the story
+    confidence = 0.6 + 0.1 * (mentions - 1) + (0.2 if in_title else 0)
+    return round(min(confidence, 0.99), 2)
+
+
+def load_gazetteer():
+    entries, areas = read_gazetteer_file()
+
+    # Add the areas covered by the sources, and the locations that were labelled before
+    names = set()
+    for province, region, municipality in Source.objects.values_list('province', 'region', 'municipality'):
+        for name, area in ((province, True), (region, True), (municipality, False)):
+            if name and name.strip():
+                names.add(name.strip())
+                if area:
+                    areas.add(name.strip())
+    names.update(Label.objects.filter(type=LabelType.LOCATION).values_list('name', flat=True))
+
+    for name in names:
+        if len(name.split()) <= MAX_LABEL_WORDS and name not in entries:
+            entries[name] = (name, False)
+    return Gazetteer(entries, areas)
+
+
+_gazetteer = None
+_gazetteer_loaded = 0
+_gazetteer_lock = threading.Lock()
+
+
+def get_gazetteer():
+    # The gazetteer is rebuilt regularly, so new sources and location labels are picked up
+    global _gazetteer, _gazetteer_loaded
+    with _gazetteer_lock:
+        if _gazetteer is None or time.monotonic() - _gazetteer_loaded > settings.GAZETTEER_MAX_AGE:
+            _gazetteer = load_gazetteer()
+            _gazetteer_loaded = time.monotonic()
+        return _gazetteer
+
+
+def clear_gazetteer():
+    global _gazetteer
+    with _gazetteer_lock:
+        _gazetteer = None
@@ -0,0 +1,109 @@
+import threading
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Label
+from .label_similarity import get_label_similarity_index
+from stories.models import normalize_label_name
+
+
+# In-process index of labels by their normalised name, so resolving the labels of a story takes one query to check the
+# known labels, at most one query for the labels that are not known yet, and one insert for the labels that do not
+# exist yet
+class LabelIndex:
+    def __init__(self):
+        self.labels = {}
+        self._lock = threading.Lock()
+
+    def resolve(self, label_types):
+        # Map the given {name: type} to Label objects by normalised name, creating the labels that do not exist yet
+        names = {normalize_label_name(name): (name, label_type) for name, label_type in label_types.items()}
+        with self._lock:
+            resolved = {key: self.labels[key] for key in names if key in self.labels}
+
+        # Labels may have been deleted by another process, such as when merging duplicate labels, so check that the
+        # remembered labels still exist, and resolve the others again
+        if resolved:
+            existing_ids = set(Label.objects.filter(id__in={label.id for label in resolved.values()})
+                               .values_list('id', flat=True))
+            deleted = [key for key, label in resolved.items() if label.id not in existing_ids]
+            if deleted:
+                self.forget(deleted)
+                for key in deleted:
+                    del resolved[key]
+
+        missing = [key for key in names if key not in resolved]
+        if missing:
+            found = {label.normalizedName: label for label in Label.objects.filter(normalizedName__in=missing)}
+
+            # Map names that are near-duplicates of an existing label (e.g. 'Gemeente Tilburg' and 'Tilburg') onto it
+            similar_ids = {}
+            similarity_index = get_label_similarity_index()
+            for key in missing:
+                if key not in found:
+                    label_id, similarity = similarity_index.match(names[key][0], names[key][1])
+                    if label_id is not None:
+                        similar_ids[key] = label_id
+            if similar_ids:
+                similar_labels = Label.objects.in_bulk(set(similar_ids.values()))
+                for key, label_id in similar_ids.items():
+                    # The index may be outdated, so check the label it points to
+                    label = similar_labels.get(label_id)
+                    if label is not None and label.type == names[key][1] \
+                            and similarity_index.is_similar(names[key][0], label.name, label.type):
+                        found[key] = label
+
+            new_labels = [Label(name=names[key][0].strip(), normalizedName=key, type=names[key][1])
+                          for key in missing if key not in found]
+            if new_labels:
+                # Labels created concurrently by another worker are ignored here, and read back below
+                Label.objects.bulk_create(new_labels, ignore_conflicts=True)
+                created = list(Label.objects.filter(normalizedName__in=[label.normalizedName for label in new_labels]))
+                found.update({label.normalizedName: label for label in created})
+                transaction.on_commit(lambda: similarity_index.add(created))
+
+            # Only remember the labels once they are committed, so a rollback cannot leave unknown labels behind
+            transaction.on_commit(lambda: self.remember(found))
+            resolved.update(found)
+
+        return resolved
+
+    def remember(self, labels):
+        with self._lock:
+            self.labels.update(labels)
+
+    def forget(self, keys):
+        with self._lock:
+            for key in keys:
+                self.labels.pop(key, None)
+
+    def discard(self, label):
+        with self._lock:
+            self.labels.pop(label.normalizedName, None)
+
+    def clear(self):
+        with self._lock:
+            self.labels.clear()
+
+
+_label_index = LabelIndex()
+
+
+def get_label_index():
+    return _label_index
+
+
+@receiver(post_delete, sender=Label)
+def discard_deleted_label(sender, instance, **kwargs):
+    _label_index.discard(instance)
+    get_label_similarity_index().clear()
+
+
+@receiver(post_save, sender=Label)
+def clear_changed_labels(sender, instance, created, **kwargs):
+    # A renamed label may be indexed by its previous name
+    if not created:
+        _label_index.clear()
+        get_label_similarity_index().clear()
@@ -0,0 +1,202 @@
+import re
+import threading
+import zlib
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+
+from .models import Label, LabelType, StoryLabel
+from stories.caching import invalidate_cache
+from stories.models import normalize_label_name
+
+# Size of the hashed character n-gram vectors
+VECTOR_SIZE = 1024
+NGRAM_SIZES = (2, 3, 4)
+
+# Words around a place name that do not change the place it refers to, e.g. 'Gemeente Tilburg' or 'Tilburg centrum'
+LOCATION_QUALIFIERS = {
+    'gemeente', 'provincie', 'regio', 'stad', 'dorp', 'wijk', 'buurt', 'centrum', 'binnenstad', 'stadscentrum',
+    'omgeving', 'de', 'het', 'van', 'in', 'nabij',
+}
+
+
+def canonical_form(name, label_type=None):
+    name = re.sub(r'[-_/,.()]+', ' ', normalize_label_name(name))
+    words = name.split()
+    if label_type == LabelType.LOCATION:
+        place_words = [word for word in words if word not in LOCATION_QUALIFIERS]
+        words = place_words or words
+    return ' '.join(words)
+
+
+def same_numbers(form, other_form):
+    # Names that only differ in a number, such as 'A1' and 'A2', refer to different things
+    return re.findall(r'\d+', form) == re.findall(r'\d+', other_form)
+
+
+def vectorize(names):
+    # Hash the character n-grams of each name into a fixed size vector, normalised to unit length for cosine similarity
+    vectors = np.zeros((len(names), VECTOR_SIZE), dtype=np.float32)
+    for row, name in enumerate(names):
+        padded = f' {name} '
+        for size in NGRAM_SIZES:
+            for i in range(len(padded) - size + 1):
+                vectors[row, zlib.crc32(padded[i:i + size].encode('utf-8')) % VECTOR_SIZE] += 1
+
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return vectors / norms
+
+
+# Vector index of the canonical labels of one type, answering which label a new name most likely refers to
+class LabelVectors:
+    def __init__(self, label_type):
+        self.label_type = label_type
+        self.label_ids = []
+        self.forms = []
+        self.canonical_names = {}
+        self._vectors = np.zeros((64, VECTOR_SIZE), dtype=np.float32)
+
+    @property
+    def vectors(self):
+        return self._vectors[:len(self.label_ids)]
+
+    def add(self, label_ids, names):
+        forms = [canonical_form(name, self.label_type) for name in names]
+        for label_id, form in zip(label_ids, forms):
+            self.canonical_names.setdefault(form, label_id)
+
+        # Grow the matrix by doubling it, so adding labels one at a time stays cheap
+        size = len(self.label_ids)
+        capacity = len(self._vectors)
+        while capacity < size + len(label_ids):
+            capacity *= 2
+        if capacity > len(self._vectors):
+            self._vectors = np.vstack([self._vectors,
+                                       np.zeros((capacity - len(self._vectors), VECTOR_SIZE), dtype=np.float32)])
+
+        self._vectors[size:size + len(label_ids)] = vectorize(forms)
+        self.label_ids.extend(label_ids)
+        self.forms.extend(forms)
+
+    def match(self, name, threshold):
+        # Return the id and similarity of the most similar label, if it is similar enough
+        form = canonical_form(name, self.label_type)
+        if form in self.canonical_names:
+            return self.canonical_names[form], 1.0
+        if not self.label_ids:
+            return None, 0.0
+
+        similarities = self.vectors @ vectorize([form])[0]
+        best = int(np.argmax(similarities))
+        if similarities[best] < threshold or not same_numbers(form, self.forms[best]):
+            return None, float(similarities[best])
+        return self.label_ids[best], float(similarities[best])
+
+
+class LabelSimilarityIndex:
+    def __init__(self, threshold=None):
+        self.threshold = threshold if threshold is not None else settings.LABEL_SIMILARITY_THRESHOLD
+        self.vectors = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        self.vectors = {label_type: LabelVectors(label_type) for label_type in LabelType.values}
+        labels_by_type = {label_type: ([], []) for label_type in LabelType.values}
+        for label_id, name, label_type in Label.objects.order_by('id').values_list('id', 'name', 'type'):
+            if label_type in labels_by_type:
+                labels_by_type[label_type][0].append(label_id)
+                labels_by_type[label_type][1].append(name)
+        for label_type, (label_ids, names) in labels_by_type.items():
+            if label_ids:
+                self.vectors[label_type].add(label_ids, names)
+
+    def match(self, name, label_type):
+        with self._lock:
+            if self.vectors is None:
+                self._load()
+            if label_type not in self.vectors:
+                return None, 0.0
+            return self.vectors[label_type].match(name, self.threshold)
+
+    def is_similar(self, name, other_name, label_type):
+        forms = [canonical_form(name, label_type), canonical_form(other_name, label_type)]
+        vectors = vectorize(forms)
+        return float(vectors[0] @ vectors[1]) >= self.threshold and same_numbers(*forms)
+
+    def add(self, labels):
+        with self._lock:
+            if self.vectors is None:
+                return
+            for label in labels:
+                if label.type in self.vectors:
+                    self.vectors[label.type].add([label.id], [label.name])
+
+    def clear(self):
+        with self._lock:
+            self.vectors = None
+
+
+_label_similarity_index = None
+_label_similarity_index_lock = threading.Lock()
+
+
+def get_label_similarity_index():
+    global _label_similarity_index
+    with _label_similarity_index_lock:
+        if _label_similarity_index is None:
+            _label_similarity_index = LabelSimilarityIndex()
+        return _label_similarity_index
+
+
+# Group labels of the same type that refer to the same thing. The most used label of each group is kept as the
+# canonical label. Returns a {duplicate label id: canonical label id} mapping.
+def find_duplicate_labels(labels, threshold=None):
+    threshold = threshold if threshold is not None else settings.LABEL_SIMILARITY_THRESHOLD
+    canonical_vectors = {label_type: LabelVectors(label_type) for label_type in LabelType.values}
+
+    duplicates = {}
+    for label in sorted(labels, key=lambda label: (-getattr(label, 'story_count', 0), label.id)):
+        vectors = canonical_vectors.get(label.type)
+        if vectors is None:
+            continue
+        canonical_id, similarity = vectors.match(label.name, threshold)
+        if canonical_id is not None:
+            duplicates[label.id] = canonical_id
+        else:
+            vectors.add([label.id], [label.name])
+    return duplicates
+
+
+# Merge the near-duplicate labels into their canonical label, moving their stories in bulk. Returns the
+# {duplicate label id: canonical label id} mapping that was (or, with dry_run, would be) merged.
+def merge_duplicate_labels(threshold=None, dry_run=False):
+    labels = Label.objects.annotate(story_count=Count('storylabel')).only('id', 'name', 'type')
+    duplicates = find_duplicate_labels(labels, threshold)
+    if dry_run or not duplicates:
+        return duplicates
+
+    with transaction.atomic():
+        tagged = set(StoryLabel.objects.filter(label_id__in=set(duplicates.values()))
+                     .values_list('story_id', 'label_id'))
+
+        moved_story_labels = []
+        removed_story_label_ids = []
+        for story_label in StoryLabel.objects.filter(label_id__in=list(duplicates)).order_by('-confidence', 'id'):
+            canonical_id = duplicates[story_label.label_id]
+            if (story_label.story_id, canonical_id) in tagged:
+                removed_story_label_ids.append(story_label.id)
+            else:
+                tagged.add((story_label.story_id, canonical_id))
+                story_label.label_id = canonical_id
+                moved_story_labels.append(story_label)
+
+        StoryLabel.objects.filter(id__in=removed_story_label_ids).delete()
+        StoryLabel.objects.bulk_update(moved_story_labels, ['label'], batch_size=500)
+        Label.objects.filter(id__in=list(duplicates)).delete()
+        invalidate_cache()
+
+    get_label_similarity_index().clear()
+    return duplicates
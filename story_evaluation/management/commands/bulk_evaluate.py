@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from ai_utilities.batch import get_batch_backend, BATCH_BACKENDS
+from story_evaluation.bulk_evaluation import run_bulk_evaluation, BULK_TASKS
+from stories.models import Story
+
+
+class Command(BaseCommand):
+    help = "Re-label or re-summarise stories in bulk through the OpenAI Batch API"
+
+    def add_arguments(self, parser):
+        parser.add_argument('task', choices=sorted(BULK_TASKS), help="What to re-evaluate")
+        parser.add_argument('--backend', choices=sorted(BATCH_BACKENDS), help="Batch backend, instead of BATCH_BACKEND")
+        parser.add_argument('--unlabeled', action='store_true', help="Only include stories without labels")
+        parser.add_argument('--limit', type=int, help="Maximum number of stories")
+        parser.add_argument('--poll-interval', type=int, help="Seconds between two status checks of the batch")
+
+    def handle(self, *args, **options):
+        stories = Story.objects.all()
+        if options['unlabeled']:
+            stories = stories.filter(labels__isnull=True)
+
+        result = run_bulk_evaluation(options['task'], stories, backend=get_batch_backend(options['backend']),
+                                     limit=options['limit'], poll_interval=options['poll_interval'])
+        self.stdout.write(f"Applied {result['applied']} results, {result['failed']} failed")
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from story_evaluation.story_labels import classify_stories
+from stories.models import Story
+
+
+class Command(BaseCommand):
+    help = "Collect the topic and location labels of stories in batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--unlabeled', action='store_true', help="Only classify stories without labels")
+        parser.add_argument('--batch-size', type=int, help="Number of stories classified in a single call")
+        parser.add_argument('--workers', type=int, help="Number of batches classified in parallel")
+
+    def handle(self, *args, **options):
+        stories = Story.objects.order_by('id')
+        if options['unlabeled']:
+            stories = stories.filter(labels__isnull=True)
+
+        stories_classified = classify_stories(stories, batch_size=options['batch_size'], max_workers=options['workers'])
+        self.stdout.write(f"Classified {stories_classified} stories")
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from story_evaluation.story_userneeds import evaluate_stories_userneeds, retry_failed_userneeds
+
+
+class Command(BaseCommand):
+    help = "Evaluate the user needs of stories that were not evaluated yet, or retry the stories that failed before"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--retry-failed', action='store_true', help="Only evaluate the stories that failed before")
+        parser.add_argument('--workers', type=int, help="Number of stories evaluated in parallel")
+
+    def handle(self, *args, **options):
+        if options['retry_failed']:
+            result = retry_failed_userneeds(max_workers=options['workers'])
+        else:
+            result = evaluate_stories_userneeds(max_workers=options['workers'])
+        self.stdout.write(f"Evaluated {result['evaluated']} stories, {result['failed']} failed")
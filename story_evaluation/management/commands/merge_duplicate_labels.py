@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from story_evaluation.label_similarity import merge_duplicate_labels
+from story_evaluation.models import Label
+
+
+class Command(BaseCommand):
+    help = "Merge labels that are near-duplicates of each other, such as 'Gemeente Tilburg' and 'Tilburg'"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threshold', type=float, help="Minimum similarity, instead of LABEL_SIMILARITY_THRESHOLD")
+        parser.add_argument('--dry-run', action='store_true', help="Only show the labels that would be merged")
+
+    def handle(self, *args, **options):
+        duplicates = merge_duplicate_labels(threshold=options['threshold'], dry_run=options['dry_run'])
+
+        if options['dry_run']:
+            names = dict(Label.objects.filter(id__in=set(duplicates) | set(duplicates.values())).values_list('id', 'name'))
+            for duplicate_id, canonical_id in duplicates.items():
+                self.stdout.write(f"{names[duplicate_id]} -> {names[canonical_id]}")
+            self.stdout.write(f"Would merge {len(duplicates)} labels")
+        else:
+            self.stdout.write(f"Merged {len(duplicates)} labels")
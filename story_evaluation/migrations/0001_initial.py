@@ -0,0 +1,27 @@
+# Generated by Django 5.0.4 on 2026-10-18 06:51
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('stories', '0011_label_normalizedname'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserNeedsFailure',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('error', models.TextField(blank=True)),
+                ('statusCode', models.IntegerField(blank=True, null=True)),
+                ('attempts', models.IntegerField(default=0)),
+                ('lastAttempt', models.DateTimeField()),
+                ('story', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='userneeds_failure', to='stories.story')),
+            ],
+        ),
+    ]
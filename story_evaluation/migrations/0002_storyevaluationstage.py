@@ -0,0 +1,31 @@
+# Generated by Django 5.0.4 on 2026-10-18 06:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stories', '0012_story_needsstatus'),
+        ('story_evaluation', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoryEvaluationStage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('stage', models.CharField(choices=[('USERNEEDS', 'User needs'), ('TOPICS', 'Topic labels'), ('LOCATIONS', 'Location labels')], max_length=20)),
+                ('status', models.CharField(choices=[('DONE', 'Done'), ('FAILED', 'Failed')], max_length=20)),
+                ('inputHash', models.CharField(max_length=64)),
+                ('error', models.TextField(blank=True)),
+                ('updated', models.DateTimeField(auto_now=True)),
+                ('story', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='evaluation_stages', to='stories.story')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='storyevaluationstage',
+            constraint=models.UniqueConstraint(fields=('story', 'stage'), name='unique_story_evaluation_stage'),
+        ),
+    ]
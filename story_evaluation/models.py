@@ -1,2 +1,45 @@
+from django.db import models
 from sources.models import Source
 from stories.models import Story, Label, StoryLabel, LabelType
+
+
+# A story whose user needs could not be evaluated, kept so the evaluation can be retried later
+class UserNeedsFailure(models.Model):
+    story = models.OneToOneField(Story, on_delete=models.CASCADE, related_name='userneeds_failure')
+    error = models.TextField(blank=True)
+    statusCode = models.IntegerField(blank=True, null=True)
+    attempts = models.IntegerField(default=0)
+    lastAttempt = models.DateTimeField()
+
+    def __str__(self):
+        return f'{self.story.title}: {self.error}'
+
+
+class EvaluationStage(models.TextChoices):
+    USERNEEDS = 'USERNEEDS', 'User needs'
+    TOPICS = 'TOPICS', 'Topic labels'
+    LOCATIONS = 'LOCATIONS', 'Location labels'
+
+
+class EvaluationStageStatus(models.TextChoices):
+    DONE = 'DONE', 'Done'
+    FAILED = 'FAILED', 'Failed'
+
+
+# The outcome of one evaluation stage of a story, with a hash of the inputs it was run on, so the stage only runs
+# again when it failed or its inputs changed
+class StoryEvaluationStage(models.Model):
+    story = models.ForeignKey(Story, on_delete=models.CASCADE, related_name='evaluation_stages')
+    stage = models.CharField(max_length=20, choices=EvaluationStage.choices)
+    status = models.CharField(max_length=20, choices=EvaluationStageStatus.choices)
+    inputHash = models.CharField(max_length=64)
+    error = models.TextField(blank=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['story', 'stage'], name='unique_story_evaluation_stage'),
+        ]
+
+    def __str__(self):
+        return f'{self.story.title} {self.stage}: {self.status}'
@@ -1,11 +1,51 @@
 import json
-from django.db import IntegrityError
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from django.conf import settings
+from django.db import transaction
 
 from .models import Source, Story, Label, StoryLabel, LabelType
+from .label_index import get_label_index
+from .gazetteer import get_gazetteer
+from stories.caching import invalidate_cache
+from stories.models import normalize_label_name
+from news_hyperlocalizer.threads import closes_db_connection
 from ai_utilities.openai_utils import process_content_with_openai, JSON_SCHEMAS
+from ai_utilities.rate_limiting import get_openai_rate_limiter
+from story_collection.content_extraction import truncate_to_token_budget
 
+TOPIC_SETUP_PROMPT = "You are an expert in classifying news stories by topic based on IPTC NewsCodes and " \
+                     "providing tags in Dutch. Your task is to read the following story and classify the text to " \
+                     "return a collection of topic labels. Each label should include a name and a confidence score. "
+TOPIC_ANSWER_FORMAT = "Please use the IPTC NewsCodes aka Media Topics taxonomy, with broad specificity, " \
+                      "and provide them in Dutch. Example: 'Onderwijs' NOT 'Education', 'Klimaat' NOT 'Climate'. " \
+                      "You should always capitalize the first letter of nouns in the topic. Example: 'Onderwijs' " \
+                      "NOT 'onderwijs', 'Wet en Regelgeving' NOT 'wet en regelgeving'. "
 
-def collect_labels_for_story(story, setup_prompt, answer_format):
+LOCATION_SETUP_PROMPT = "You are an expert in extracting location information from stories. Your task is to read " \
+                        "the following story and identify and list all relevant locations mentioned in the story. " \
+                        "Focus on general locations (cities, towns, neighborhoods) that are central to the " \
+                        "story's content, and avoid mentioning locations that are only tangentially referenced. " \
+                        "Each label should include a name and a confidence score. "
+LOCATION_ANSWER_FORMAT = "Please use the Dutch names for the locations. "
+
+BATCH_SETUP_PROMPT = "You are an expert in classifying news stories by topic based on IPTC NewsCodes, and in " \
+                     "extracting location information from stories. Your task is to read each of the following " \
+                     "stories, which are separated by their id, and return both a collection of topic labels and a " \
+                     "collection of location labels for every story. Each label should include a name and a " \
+                     "confidence score. For the locations, focus on general locations (cities, towns, " \
+                     "neighborhoods) that are central to the story's content, and avoid mentioning locations that " \
+                     "are only tangentially referenced. "
+BATCH_ANSWER_FORMAT = "Please return one item per story in 'stories', with the id of the story, its 'topics' and " \
+                      "its 'locations'. " + TOPIC_ANSWER_FORMAT + LOCATION_ANSWER_FORMAT
+
+
+class LabelsError(Exception):
+    pass
+
+
+# Returns [] when the labels could not be collected, or raises LabelsError with raise_errors, so a failed request can be
+# told apart from a story without labels
+def collect_labels_for_story(story, setup_prompt, answer_format, raise_errors=False):
     try:
         # If story is an ID, retrieve the Story instance
         if isinstance(story, int):
@@ -19,10 +59,10 @@ def collect_labels_for_story(story, setup_prompt, answer_format):
 
         # Process content with OpenAI
 
-        openai_result = process_content_with_openai(content, setup_prompt, answer_format, JSON_SCHEMAS['story_labels'])
+        openai_result = process_content_with_openai(setup_prompt, content, answer_format, JSON_SCHEMAS['story_labels'])
         if openai_result is None:
             print(f"Failed to collect labels for story '{story.title}'")
-            return []
+            raise LabelsError(f"Failed to collect labels for story '{story.title}'")
 
         # Parse the Labels from the OpenAI result
         try:
@@ -37,11 +77,13 @@ def collect_labels_for_story(story, setup_prompt, answer_format):
                 labels = openai_data['locations']
             else:
                 print(f"Failed to collect labels (they were mislabeled) for story '{story.title}'")
-                labels = []
+                raise LabelsError(f"The labels of story '{story.title}' were mislabeled")
         except json.JSONDecodeError:
-            labels = []
+            raise LabelsError(f"The labels of story '{story.title}' are not valid JSON")
 
-    except Exception:
+    except Exception as e:
+        if raise_errors:
+            raise e if isinstance(e, LabelsError) else LabelsError(f"Failed to collect labels: {e}") from e
         return []
     else:
         return labels
@@ -53,6 +95,7 @@ def save_labels(story, labels, labeltype):
         print(f"Invalid label type: {labeltype}")
         return
 
+    names = {}
     for label_data in labels:
         # Validate the label data
         if 'name' not in label_data or 'confidence' not in label_data:
@@ -60,22 +103,27 @@ def save_labels(story, labels, labeltype):
             continue
 
         # Validate the name field
-        if len(label_data['name']) > 200 or len(label_data['name']) < 1:
+        if len(label_data['name']) > 200 or len(label_data['name'].strip()) < 1:
             print(f"Invalid label name: {label_data['name']}")
             continue
 
-        # Get or create the Label object
-        label, created = Label.objects.get_or_create(name__iexact=label_data['name'],
-                                                     defaults={'name': label_data['name'], 'type': labeltype})
+        # Keep the first occurrence of names that only differ in case or whitespace
+        names.setdefault(normalize_label_name(label_data['name']), (label_data['name'], label_data['confidence']))
+    if not names:
+        return
 
-        # Create the StoryLabel object
-        story_label = StoryLabel(story=story, label=label, confidence=label_data['confidence'])
+    with transaction.atomic():
+        # Get or create the Label objects
+        labels_by_name = get_label_index().resolve({name: labeltype for name, confidence in names.values()})
 
-        # Save the StoryLabel object
-        try:
-            story_label.save()
-        except IntegrityError:
-            print(f"StoryLabel already exists for story '{story.title}' and label '{label.name}'")
+        # Create the StoryLabel objects, keeping the first of the names that map onto the same label, and skipping
+        # the labels the story already has
+        story_labels = {}
+        for key, (name, confidence) in names.items():
+            label = labels_by_name[key]
+            story_labels.setdefault(label.id, StoryLabel(story=story, label=label, confidence=confidence))
+        StoryLabel.objects.bulk_create(story_labels.values(), ignore_conflicts=True)
+        invalidate_cache()
 
 
 def classify_story(story):
@@ -89,36 +137,126 @@ def classify_story(story):
 
     print(f"Collecting labels for story '{story.title}'")
 
-    topic_setup_prompt = "You are an expert in classifying news stories by topic based on IPTC NewsCodes and " \
-                         "providing tags in Dutch. Your task is to read the following story and classify the text to " \
-                         "return a collection of topic labels. Each label should include a name and a confidence " \
-                         "score. "
-    topic_answer_format = "Please use the IPTC NewsCodes aka Media Topics taxonomy, with broad specificity, " \
-                          "and provide them in Dutch. Example: 'Onderwijs' NOT 'Education', 'Klimaat' NOT 'Climate'. " \
-                          "You should always capitalize the first letter of nouns in the topic. Example: 'Onderwijs' " \
-                          "NOT 'onderwijs', 'Wet en Regelgeving' NOT 'wet en regelgeving'. "
+    classify_story_topics(story)
+    classify_story_locations(story)
+
 
-    topic_labels = collect_labels_for_story(story, topic_setup_prompt, topic_answer_format)
+def collect_topics_for_story(story, raise_errors=False):
+    return collect_labels_for_story(story, TOPIC_SETUP_PROMPT, TOPIC_ANSWER_FORMAT, raise_errors=raise_errors)
+
+
+def classify_story_topics(story):
+    topic_labels = collect_topics_for_story(story)
     print(f"Collected {len(topic_labels)} potential topic labels for '{story.title}'")
 
     save_labels(story, topic_labels, LabelType.TOPIC)
 
-    location_setup_prompt = "You are an expert in extracting location information from stories. Your task is to read " \
-                            "the following story and identify and list all relevant locations mentioned in the story. " \
-                            "Focus on general locations (cities, towns, neighborhoods) that are central to the " \
-                            "story's content, and avoid mentioning locations that are only tangentially referenced. " \
-                            "Each label should include a name and a confidence score. "
-    location_answer_format = "Please use the Dutch names for the locations. "
 
-    location_labels = collect_labels_for_story(story, location_setup_prompt, location_answer_format)
+def classify_story_locations(story):
+    location_labels = collect_locations_for_story(story)
     print(f"Collected {len(location_labels)} potential location labels for '{story.title}'")
 
     save_labels(story, location_labels, LabelType.LOCATION)
 
 
-def classify_stories(stories):
+def collect_locations_for_story(story, raise_errors=False):
+    # Find the locations with the gazetteer, and only ask OpenAI when the gazetteer is unsure, or finds no municipality
+    # or town. The gazetteer covers the towns of Noord-Brabant, but elsewhere mostly the country, provinces and large
+    # cities, so a story that only mentions such areas may be about a town the gazetteer does not know.
+    location_labels = []
+    if settings.LOCATION_TAGGER_ENABLED:
+        gazetteer = get_gazetteer()
+        location_labels, ambiguous = gazetteer.tag(f"{story.summary}\n{story.story}", story.title)
+        if not ambiguous and any(not gazetteer.is_area(label['name']) for label in location_labels):
+            return location_labels
+
+    openai_labels = collect_labels_for_story(story, LOCATION_SETUP_PROMPT, LOCATION_ANSWER_FORMAT,
+                                             raise_errors=raise_errors)
+
+    # Keep the locations the gazetteer found, adding the ones only OpenAI found
+    names = {normalize_label_name(label['name']) for label in location_labels}
+    return location_labels + [label for label in openai_labels
+                              if normalize_label_name(str(label.get('name', ''))) not in names]
+
+
+def classify_stories(stories, batch_size=None, max_workers=None):
+    # Classify the stories in batches, so a single call collects the topics and locations of several stories
+    batch_size = batch_size or settings.LABEL_BATCH_SIZE
+    max_workers = max_workers or settings.LABEL_BATCH_MAX_CONCURRENCY
+    stories = list(stories)
+    batches = [stories[i:i + batch_size] for i in range(0, len(stories), batch_size)]
+
+    stories_classified = 0
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(classify_story_batch, batch) for batch in batches]
+        for future in as_completed(futures):
+            try:
+                stories_classified += future.result()
+            except Exception as e:
+                print(f"An error occurred while classifying a batch of stories: {e}")
+
+    print(f"Classified {stories_classified} of {len(stories)} stories in {len(batches)} batches")
+    return stories_classified
+
+
+@closes_db_connection
+def classify_story_batch(stories):
+    rate_limiter = get_openai_rate_limiter()
+    rate_limiter.acquire()
+    labels_per_story = collect_labels_for_stories(stories)
+
+    stories_classified = 0
     for story in stories:
-        classify_story(story)
+        story_labels = labels_per_story.get(story.id)
+        if story_labels is None:
+            # Classify the stories that are missing from the response one by one (one call per label type)
+            rate_limiter.acquire(2)
+            classify_story(story)
+        else:
+            save_labels(story, story_labels['topics'], LabelType.TOPIC)
+            save_labels(story, story_labels['locations'], LabelType.LOCATION)
+        stories_classified += 1
+    return stories_classified
+
+
+def collect_labels_for_stories(stories):
+    # Collect the topic and location labels of several stories at once, returning them by story id
+    openai_result = process_content_with_openai(BATCH_SETUP_PROMPT, build_batch_content(stories), BATCH_ANSWER_FORMAT,
+                                                JSON_SCHEMAS['story_labels_batch'])
+    if openai_result is None:
+        print(f"Failed to collect labels for a batch of {len(stories)} stories")
+        return {}
+
+    return parse_labels_per_story(openai_result, {story.id for story in stories})
+
+
+def build_batch_content(stories):
+    return '\n\n'.join(
+        f"Id: {story.id}\nTitle: {story.title}\nSummary: {story.summary}\n"
+        f"Story: {truncate_to_token_budget(story.story, settings.LABEL_BATCH_STORY_MAX_TOKENS)}"
+        for story in stories
+    )
+
+
+def parse_labels_per_story(openai_result, story_ids):
+    # Split the labels per story, skipping stories of which the labels cannot be read
+    try:
+        items = json.loads(openai_result)['stories']
+    except (json.JSONDecodeError, KeyError, TypeError):
+        print(f"Failed to parse the labels for a batch of {len(story_ids)} stories")
+        return {}
+
+    labels_per_story = {}
+    for item in items if isinstance(items, list) else []:
+        try:
+            story_id = int(item['id'])
+        except (KeyError, TypeError, ValueError):
+            continue
+        topics = item.get('topics', [])
+        locations = item.get('locations', [])
+        if story_id in story_ids and isinstance(topics, list) and isinstance(locations, list):
+            labels_per_story[story_id] = {'topics': topics, 'locations': locations}
+    return labels_per_story
 
 
 def test():
@@ -1,38 +1,56 @@
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
 from dotenv import load_dotenv
-from stories.models import Story
-from django.db.models import Q
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q, F
+from django.utils import timezone
+from requests.adapters import HTTPAdapter
+from stories.caching import invalidate_cache
+from stories.models import Story, NeedsStatus
+from story_evaluation.models import UserNeedsFailure
+from ai_utilities.rate_limiting import TokenBucket
+import threading
 import random
 import requests
+import time
 import os
 
 
 # Load environment variables from .env file
 load_dotenv()
 
+USER_NEEDS_FIELDS = ['needsKnow', 'needsUnderstand', 'needsFeel', 'needsDo']
 
-def evaluate_stories_userneeds(date=None):
-    if date is None:
-        stories = Story.objects.filter(needsKnow=0, needsUnderstand=0, needsFeel=0, needsDo=0)
-    else:
-        stories = Story.objects.filter(Q(created=date) | Q(updated=date))
-    for story in stories:
-        evaluate_story_userneeds(story)
+# Stories whose scores are saved in a single statement
+SAVE_BATCH_SIZE = 500
 
+# Status codes after which the same request may succeed when it is sent again
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
 
-def evaluate_story_userneeds(story):
-    user_needs = evaluate_userneeds(story.story)
-    for field, value in user_needs.items():
-        setattr(story, field, value)
-    story.save()
 
+class UserNeedsError(Exception):
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
 
-def evaluate_userneeds(text):
-    api_key = os.getenv('SMARTOCTO_API_KEY')
 
-    if api_key:
-        url = "https://api.contentinsights.com/api/v2/analyze"
+# Client for the SmartOcto user needs API, sharing one connection pool and one rate limit between threads, and
+# retrying requests that failed because of rate limiting, server errors or network errors
+class SmartOctoClient:
+    def __init__(self, api_key, url=None, session=None, rate_limiter=None, max_retries=None, timeout=None,
+                 sleep=time.sleep):
+        self.api_key = api_key
+        self.url = url or settings.SMARTOCTO_API_URL
+        self.session = session or create_session()
+        self.rate_limiter = rate_limiter or get_smartocto_rate_limiter()
+        self.max_retries = max_retries if max_retries is not None else settings.SMARTOCTO_MAX_RETRIES
+        self.timeout = timeout or settings.SMARTOCTO_TIMEOUT
+        self.sleep = sleep
+
+    def analyze(self, text):
         headers = {
-            "Authorization": f"Bearer {api_key}",
+            "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json"
         }
         data = {
@@ -40,21 +58,225 @@ def evaluate_userneeds(text):
             "cpi_perspective": "user_needs"
         }
 
-        response = requests.post(url, headers=headers, json=data)
+        attempt = 0
+        while True:
+            self.rate_limiter.acquire()
+            try:
+                response = self.session.post(self.url, headers=headers, json=data, timeout=self.timeout)
+            except requests.RequestException as e:
+                error = UserNeedsError(f"POST API call to {self.url} failed: {e}")
+                retry_after = None
+            else:
+                if response.status_code == 200:
+                    try:
+                        return parse_userneeds(response.json())
+                    except (ValueError, AttributeError) as e:
+                        raise UserNeedsError(f"POST API call to {self.url} returned an invalid response: {e}")
+                error = UserNeedsError(f"POST API call to {self.url} failed with status code: {response.status_code}",
+                                       response.status_code)
+                if response.status_code not in RETRY_STATUS_CODES:
+                    raise error
+                retry_after = parse_retry_after(response.headers.get('Retry-After'))
+
+            if attempt >= self.max_retries:
+                raise error
+            self.sleep(backoff_delay(attempt, retry_after))
+            attempt += 1
+
+
+def parse_userneeds(result):
+    return {
+        'needsKnow': result.get('know', 0),
+        'needsUnderstand': result.get('context', 0),
+        'needsFeel': result.get('emotion', 0),
+        'needsDo': result.get('action', 0)
+    }
+
+
+def parse_retry_after(value):
+    # Retry-After is either a number of seconds or an HTTP date
+    if not value:
+        return None
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        pass
+    try:
+        return max((parsedate_to_datetime(value) - timezone.now()).total_seconds(), 0)
+    except (TypeError, ValueError):
+        return None
+
 
-        if response.status_code == 200:
-            result = response.json()
-            return {
-                'needsKnow': result.get('know', 0),
-                'needsUnderstand': result.get('context', 0),
-                'needsFeel': result.get('emotion', 0),
-                'needsDo': result.get('action', 0)
-            }
+def backoff_delay(attempt, retry_after=None):
+    # Wait as long as the server asks, or exponentially longer after each attempt, with jitter so threads spread out
+    if retry_after is not None:
+        return min(retry_after, settings.SMARTOCTO_MAX_BACKOFF)
+    delay = settings.SMARTOCTO_BACKOFF * 2 ** attempt
+    return min(delay + random.uniform(0, delay / 2), settings.SMARTOCTO_MAX_BACKOFF)
+
+
+def create_session():
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=settings.SMARTOCTO_MAX_CONCURRENCY)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+_smartocto_session = None
+_smartocto_rate_limiter = None
+_smartocto_lock = threading.Lock()
+
+
+def get_smartocto_session():
+    global _smartocto_session
+    with _smartocto_lock:
+        if _smartocto_session is None:
+            _smartocto_session = create_session()
+        return _smartocto_session
+
+
+def get_smartocto_rate_limiter():
+    global _smartocto_rate_limiter
+    with _smartocto_lock:
+        if _smartocto_rate_limiter is None:
+            _smartocto_rate_limiter = TokenBucket(settings.SMARTOCTO_REQUESTS_PER_MINUTE / 60,
+                                                  capacity=settings.SMARTOCTO_MAX_BURST)
+        return _smartocto_rate_limiter
+
+
+def get_smartocto_client():
+    api_key = os.getenv('SMARTOCTO_API_KEY')
+    if not api_key:
+        return None
+    return SmartOctoClient(api_key, session=get_smartocto_session())
+
+
+def evaluate_stories_userneeds(date=None, stories=None, max_workers=None, chunk_size=None):
+    if stories is None:
+        if date is None:
+            stories = Story.objects.filter(needsStatus=NeedsStatus.PENDING)
         else:
-            print(f"POST API call to {url} failed with status code: {response.status_code}")
-            return generate_random_userneeds()
+            stories = Story.objects.filter(Q(created=date) | Q(updated=date))
+    chunk_size = chunk_size or settings.SMARTOCTO_CHUNK_SIZE
+
+    client = get_smartocto_client()
+    max_workers = max_workers or settings.SMARTOCTO_MAX_CONCURRENCY
+    evaluated = 0
+    failed = 0
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # Work through the stories in chunks, so only one chunk of story texts is in memory at a time
+        for chunk in stories.iter_chunks(chunk_size):
+            chunk_evaluated, chunk_failed = evaluate_chunk_userneeds(chunk, client, executor)
+            evaluated += chunk_evaluated
+            failed += chunk_failed
+
+    print(f"Evaluated the user needs of {evaluated} stories, {failed} failed")
+    return {'evaluated': evaluated, 'failed': failed}
+
+
+def evaluate_chunk_userneeds(stories, client, executor):
+    if client is None:
+        results = [(story, generate_random_userneeds(), None) for story in stories]
     else:
+        # Only the API calls run in the threads, the results are saved together afterwards
+        def evaluate(story):
+            try:
+                return story, client.analyze(story.story), None
+            except UserNeedsError as e:
+                return story, None, e
+
+        results = list(executor.map(evaluate, stories))
+
+    evaluated = [(story, user_needs) for story, user_needs, error in results if error is None]
+    failed = [(story, error) for story, user_needs, error in results if error is not None]
+    save_userneeds(evaluated)
+    record_failures(failed)
+    return len(evaluated), len(failed)
+
+
+# Evaluate the stories whose evaluation failed before again
+def retry_failed_userneeds(max_workers=None):
+    stories = Story.objects.filter(needsStatus=NeedsStatus.FAILED)
+    return evaluate_stories_userneeds(stories=stories, max_workers=max_workers)
+
+
+def evaluate_story_userneeds(story):
+    try:
+        user_needs = collect_story_userneeds(story)
+    except UserNeedsError as e:
+        print(f"An error occurred while evaluating the user needs of story '{story.title}': {e}")
+        record_failures([(story, e)])
+        return False
+
+    save_story_userneeds(story, user_needs)
+    return True
+
+
+# Raises UserNeedsError when the user needs could not be evaluated
+def collect_story_userneeds(story):
+    client = get_smartocto_client()
+    if client is None:
         return generate_random_userneeds()
+    return client.analyze(story.story)
+
+
+def save_story_userneeds(story, user_needs):
+    for field, value in user_needs.items():
+        setattr(story, field, value)
+    story.needsStatus = NeedsStatus.EVALUATED
+    story.save()
+    UserNeedsFailure.objects.filter(story=story).delete()
+
+
+def save_userneeds(evaluated):
+    stories = []
+    for story, user_needs in evaluated:
+        for field, value in user_needs.items():
+            setattr(story, field, value)
+        story.needsStatus = NeedsStatus.EVALUATED
+        stories.append(story)
+
+    with transaction.atomic():
+        for start in range(0, len(stories), SAVE_BATCH_SIZE):
+            batch = stories[start:start + SAVE_BATCH_SIZE]
+            story_ids = [story.id for story in batch]
+            Story.objects.bulk_update(batch, USER_NEEDS_FIELDS + ['needsStatus'])
+            Story.objects.filter(id__in=story_ids).recompute_needs()
+            UserNeedsFailure.objects.filter(story__in=story_ids).delete()
+        invalidate_cache()
+
+
+def record_failures(failed):
+    if not failed:
+        return
+
+    now = timezone.now()
+    errors = {story.id: error for story, error in failed}
+    Story.objects.filter(id__in=list(errors)).update(needsStatus=NeedsStatus.FAILED)
+    invalidate_cache()
+    existing_ids = set(UserNeedsFailure.objects.filter(story__in=list(errors)).values_list('story_id', flat=True))
+    for story_id in existing_ids:
+        error = errors[story_id]
+        UserNeedsFailure.objects.filter(story_id=story_id).update(
+            error=str(error), statusCode=error.status_code, attempts=F('attempts') + 1, lastAttempt=now)
+    UserNeedsFailure.objects.bulk_create([
+        UserNeedsFailure(story_id=story_id, error=str(error), statusCode=error.status_code, attempts=1, lastAttempt=now)
+        for story_id, error in errors.items() if story_id not in existing_ids
+    ])
+
+
+def evaluate_userneeds(text):
+    client = get_smartocto_client()
+    if client is None:
+        return generate_random_userneeds()
+
+    try:
+        return client.analyze(text)
+    except UserNeedsError as e:
+        print(e)
+        return None
+
 
 def generate_random_userneeds():
     return {
@@ -62,4 +284,4 @@ def generate_random_userneeds():
         'needsUnderstand': random.randint(0, 100),
         'needsFeel': random.randint(0, 100),
         'needsDo': random.randint(0, 100)
-    }
\ No newline at end of file
+    }
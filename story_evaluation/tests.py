@@ -1,17 +1,37 @@
-from django.test import TestCase
+from django.test import TestCase, TransactionTestCase
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import os
+import threading
+from decimal import Decimal
+import re
+import tempfile
+from pathlib import Path
 import unittest
 from unittest.mock import patch, MagicMock
 
-from .models import Story, Label, StoryLabel, LabelType
-from story_evaluation.story_userneeds import evaluate_userneeds
-from story_evaluation.story_labels import collect_labels_for_story, classify_story
+from .models import Source, Story, Label, StoryLabel, LabelType, UserNeedsFailure, EvaluationStage, \
+    EvaluationStageStatus, StoryEvaluationStage
+from stories.models import NeedsStatus
+from story_evaluation.label_index import get_label_index
+from story_evaluation.label_similarity import get_label_similarity_index, canonical_form, find_duplicate_labels, \
+    merge_duplicate_labels
+from story_evaluation.story_userneeds import evaluate_userneeds, evaluate_stories_userneeds, retry_failed_userneeds, \
+    parse_retry_after, UserNeedsError
+from story_evaluation.bulk_evaluation import run_bulk_evaluation, apply_batch_results, apply_summary_result
+from story_evaluation.evaluation import evaluate_story
+from story_evaluation.gazetteer import AhoCorasick, Gazetteer, clear_gazetteer, read_gazetteer_file
+from ai_utilities.batch import LocalBatchBackend
+from story_evaluation.story_labels import collect_labels_for_story, classify_story, classify_stories, \
+    collect_labels_for_stories, save_labels, collect_locations_for_story, LabelsError
 
 
 # Unit tests for story_evaluation/story_userneeds.py
 class EvaluateUserNeedsTestCase(TestCase):
-    @patch('story_evaluation.story_userneeds.requests.post')
+    @patch('story_evaluation.story_userneeds.get_smartocto_rate_limiter')
+    @patch('story_evaluation.story_userneeds.get_smartocto_session')
     @patch('os.getenv')
-    def test_evaluate_userneeds_with_api_key(self, mock_getenv, mock_post):
+    def test_evaluate_userneeds_with_api_key(self, mock_getenv, mock_get_smartocto_session, mock_get_smartocto_rate_limiter):
         # Arrange
         expected_response = {
             'know': 80,
@@ -19,6 +39,7 @@ class EvaluateUserNeedsTestCase(TestCase):
             'emotion': 60,
             'action': 50
         }
+        mock_post = mock_get_smartocto_session.return_value.post
         mock_post.return_value.status_code = 200
         mock_post.return_value.json.return_value = expected_response
         mock_getenv.return_value = 'test_api_key'
@@ -47,6 +68,101 @@ class EvaluateUserNeedsTestCase(TestCase):
             self.assertTrue(0 <= value <= 100, f"Value of {key} is not between 0 and 100: {value}")
 
 
+# Stand-in for the SmartOcto API, answering with the scores in the text, rate limiting texts containing 'busy' once, and
+# failing for texts containing 'broken'
+class SmartOctoHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        text = body['text']
+        with self.server.lock:
+            self.server.requests.append(text)
+            attempts = self.server.requests.count(text)
+
+        if 'broken' in text:
+            self.respond(500, {'error': 'Internal server error'})
+        elif 'busy' in text and attempts == 1:
+            self.respond(429, {'error': 'Too many requests'}, {'Retry-After': '0'})
+        else:
+            know, context, emotion, action = (int(score) for score in text.split()[-4:])
+            self.respond(200, {'know': know, 'context': context, 'emotion': emotion, 'action': action})
+
+    def respond(self, status_code, result, headers=None):
+        content = json.dumps(result).encode('utf-8')
+        self.send_response(status_code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        for header, value in (headers or {}).items():
+            self.send_header(header, value)
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+
+# Tests for concurrent user needs evaluation in story_evaluation/story_userneeds.py
+@patch.dict(os.environ, {'SMARTOCTO_API_KEY': 'test_api_key'})
+@patch('story_evaluation.story_userneeds.get_smartocto_rate_limiter')
+class EvaluateStoriesUserNeedsTestCase(TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), SmartOctoHandler)
+        self.server.lock = threading.Lock()
+        self.server.requests = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+        settings = self.settings(SMARTOCTO_API_URL=f'http://127.0.0.1:{self.server.server_port}/api/v2/analyze',
+                                 SMARTOCTO_MAX_RETRIES=2, SMARTOCTO_BACKOFF=0)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        self.ok_story = Story.objects.create(title="Ok", summary="Summary", story="Story 10 40 20 30", url="https://example.com/ok")
+        self.busy_story = Story.objects.create(title="Busy", summary="Summary", story="Story busy 50 10 10 10", url="https://example.com/busy")
+        self.broken_story = Story.objects.create(title="Broken", summary="Summary", story="Story broken 1 2 3 4", url="https://example.com/broken")
+
+    def test_evaluate_stories_userneeds_saves_scores_and_records_failures(self, mock_get_smartocto_rate_limiter):
+        # Act
+        result = evaluate_stories_userneeds(max_workers=3, chunk_size=2)
+
+        # Assert
+        self.assertEqual(result, {'evaluated': 2, 'failed': 1})
+        self.assertEqual(dict(Story.objects.values_list('title', 'needsStatus')),
+                         {'Ok': NeedsStatus.EVALUATED, 'Busy': NeedsStatus.EVALUATED, 'Broken': NeedsStatus.FAILED})
+        self.ok_story.refresh_from_db()
+        self.assertEqual((self.ok_story.needsKnow, self.ok_story.needsUnderstand, self.ok_story.needsFeel, self.ok_story.needsDo), (10, 40, 20, 30))
+        self.assertEqual(self.ok_story.needsSum, 100)
+        self.assertEqual(self.ok_story.needsPrimary, 'Understand')
+        self.busy_story.refresh_from_db()
+        self.assertEqual(self.busy_story.needsPrimary, 'Know')
+        self.assertEqual(self.server.requests.count(self.busy_story.story), 2)
+
+        self.broken_story.refresh_from_db()
+        self.assertEqual(self.broken_story.needsSum, 0)
+        self.assertEqual(self.server.requests.count(self.broken_story.story), 3)
+        failure = UserNeedsFailure.objects.get(story=self.broken_story)
+        self.assertEqual((failure.statusCode, failure.attempts), (500, 1))
+
+    def test_retry_failed_userneeds_clears_fixed_failures(self, mock_get_smartocto_rate_limiter):
+        # Arrange
+        evaluate_stories_userneeds(max_workers=3)
+        Story.objects.filter(id=self.broken_story.id).update(story="Story fixed 1 2 3 4")
+
+        # Act
+        result = retry_failed_userneeds()
+
+        # Assert
+        self.assertEqual(result, {'evaluated': 1, 'failed': 0})
+        self.assertFalse(UserNeedsFailure.objects.exists())
+        self.broken_story.refresh_from_db()
+        self.assertEqual(self.broken_story.needsSum, 10)
+
+    def test_parse_retry_after(self, mock_get_smartocto_rate_limiter):
+        self.assertEqual(parse_retry_after('5'), 5)
+        self.assertEqual(parse_retry_after('Thu, 01 Jan 1970 00:00:00 GMT'), 0)
+        self.assertIsNone(parse_retry_after('soon'))
+
+
 # Unit tests for story_evaluation/story_labels.py
 class CollectLabelsForStoryTestCase(unittest.TestCase):
     @patch('story_evaluation.story_labels.process_content_with_openai')
@@ -79,6 +195,22 @@ class CollectLabelsForStoryTestCase(unittest.TestCase):
         self.assertEqual(labels[0]['type'], 'Test Type')
         self.assertEqual(labels[0]['confidence'], 0.9)
 
+    @patch('story_evaluation.story_labels.process_content_with_openai')
+    def test_collect_labels_for_story_sends_story_as_content(self, mock_process_content_with_openai):
+        # Arrange
+        mock_process_content_with_openai.return_value = '{"items": []}'
+        mock_story = MagicMock()
+        mock_story.title = "Test Title"
+
+        # Act
+        collect_labels_for_story(mock_story, "setup_prompt", "answer_format")
+
+        # Assert
+        args = mock_process_content_with_openai.call_args.args
+        self.assertEqual(args[0], "setup_prompt")
+        self.assertIn("Title: Test Title", args[1])
+        self.assertEqual(args[2], "answer_format")
+
     @patch('story_evaluation.story_labels.process_content_with_openai')
     def test_collect_labels_for_story_with_invalid_json(self, mock_process_content_with_openai):
         # Arrange
@@ -91,18 +223,32 @@ class CollectLabelsForStoryTestCase(unittest.TestCase):
         # Assert
         self.assertEqual(labels, [])
 
+    @patch('story_evaluation.story_labels.process_content_with_openai')
+    def test_collect_labels_for_story_raises_errors_when_asked(self, mock_process_content_with_openai):
+        # Arrange
+        mock_process_content_with_openai.return_value = None
+        mock_story = MagicMock()
+
+        # Act / Assert
+        self.assertEqual(collect_labels_for_story(mock_story, "setup_prompt", "answer_format"), [])
+        with self.assertRaises(LabelsError):
+            collect_labels_for_story(mock_story, "setup_prompt", "answer_format", raise_errors=True)
+
+    @patch('django.conf.settings.LOCATION_TAGGER_ENABLED', False)
+    @patch('story_evaluation.story_labels.invalidate_cache')
+    @patch('story_evaluation.story_labels.transaction')
     @patch('story_evaluation.story_labels.StoryLabel')
-    @patch('story_evaluation.story_labels.Label.objects.get_or_create')
+    @patch('story_evaluation.story_labels.get_label_index')
     @patch('story_evaluation.story_labels.collect_labels_for_story')
-    def test_classify_story_valid_case(self, mock_collect_labels_for_story, mock_get_or_create, mock_StoryLabel):
+    def test_classify_story_valid_case(self, mock_collect_labels_for_story, mock_get_label_index, mock_StoryLabel, mock_transaction,
+                                       mock_invalidate_cache):
         # Arrange
         mock_story = MagicMock(Story)
         mock_story._state = MagicMock()
         mock_story._state.db = 'default'
         mock_label = MagicMock(Label)
-        mock_label._state = MagicMock()
-        mock_label._state.db = 'default'
-        mock_get_or_create.return_value = (mock_label, True)
+        mock_label.id = 1
+        mock_get_label_index.return_value.resolve.return_value = {'test label': mock_label}
         mock_StoryLabel.return_value = MagicMock(StoryLabel)
         mock_collect_labels_for_story.return_value = [{"name": "Test Label", "type": LabelType.TOPIC, "confidence": 0.9}]
 
@@ -111,9 +257,9 @@ class CollectLabelsForStoryTestCase(unittest.TestCase):
 
         # Assert
         assert mock_collect_labels_for_story.call_count == 2
-        assert mock_get_or_create.call_count == 2
+        assert mock_get_label_index.return_value.resolve.call_count == 2
         assert mock_StoryLabel.call_count == 2
-        assert mock_StoryLabel.return_value.save.call_count == 2
+        assert mock_StoryLabel.objects.bulk_create.call_count == 2
 
     # Invalid test cases
     def test_classify_story_missing_confidence(self):
@@ -125,18 +271,16 @@ class CollectLabelsForStoryTestCase(unittest.TestCase):
     def test_classify_story_missing_name(self):
         self._test_classify_story_invalid_case({"type": LabelType.TOPIC, "confidence": 0.9})
 
+    @patch('django.conf.settings.LOCATION_TAGGER_ENABLED', False)
+    @patch('story_evaluation.story_labels.transaction')
     @patch('story_evaluation.story_labels.StoryLabel')
-    @patch('story_evaluation.story_labels.Label.objects.get_or_create')
+    @patch('story_evaluation.story_labels.get_label_index')
     @patch('story_evaluation.story_labels.collect_labels_for_story')
-    def _test_classify_story_invalid_case(self, test_case, mock_collect_labels_for_story, mock_get_or_create, mock_StoryLabel):
+    def _test_classify_story_invalid_case(self, test_case, mock_collect_labels_for_story, mock_get_label_index, mock_StoryLabel, mock_transaction):
         # Arrange
         mock_story = MagicMock(Story)
         mock_story._state = MagicMock()
         mock_story._state.db = 'default'
-        mock_label = MagicMock(Label)
-        mock_label._state = MagicMock()
-        mock_label._state.db = 'default'
-        mock_get_or_create.return_value = (mock_label, True)
         mock_StoryLabel.return_value = MagicMock(StoryLabel)
         mock_collect_labels_for_story.return_value = [test_case]
 
@@ -145,9 +289,491 @@ class CollectLabelsForStoryTestCase(unittest.TestCase):
 
         # Assert
         assert mock_collect_labels_for_story.call_count == 2
-        mock_get_or_create.assert_not_called()
+        mock_get_label_index.return_value.resolve.assert_not_called()
         mock_StoryLabel.assert_not_called()
-        mock_StoryLabel.return_value.save.assert_not_called()
+        mock_StoryLabel.objects.bulk_create.assert_not_called()
+
+
+# Tests for story_evaluation/label_index.py and save_labels in story_evaluation/story_labels.py
+class SaveLabelsTestCase(TestCase):
+    def setUp(self):
+        self.story = Story.objects.create(title="Story", summary="Summary", url="https://example.com/story")
+        get_label_index().clear()
+        get_label_similarity_index().clear()
+
+    def test_save_labels_matches_existing_labels_by_normalized_name(self):
+        # Arrange
+        label = Label.objects.create(name="Wet en Regelgeving", type=LabelType.TOPIC)
+
+        # Act
+        save_labels(self.story, [{"name": "wet en  regelgeving", "confidence": 0.9},
+                                 {"name": "Onderwijs", "confidence": 0.7}], LabelType.TOPIC)
+
+        # Assert
+        self.assertEqual(Label.objects.count(), 2)
+        self.assertEqual(set(self.story.labels.all()), {label, Label.objects.get(normalizedName="onderwijs")})
+
+    def test_save_labels_skips_duplicates(self):
+        # Arrange
+        save_labels(self.story, [{"name": "Zwolle", "confidence": 0.9}], LabelType.LOCATION)
+
+        # Act
+        save_labels(self.story, [{"name": "zwolle", "confidence": 0.5}, {"name": "ZWOLLE", "confidence": 0.4}], LabelType.LOCATION)
+
+        # Assert
+        story_label = StoryLabel.objects.get(story=self.story)
+        self.assertEqual(story_label.confidence, Decimal("0.90"))
+
+    def test_save_labels_uses_few_queries(self):
+        # Arrange
+        labels = [{"name": f"Label {i}", "confidence": 0.5} for i in range(10)]
+
+        # Act / Assert
+        with self.assertNumQueries(8):
+            save_labels(self.story, labels, LabelType.TOPIC)
+        self.assertEqual(self.story.labels.count(), 10)
+
+    def test_label_index_caches_committed_labels(self):
+        # Arrange
+        with self.captureOnCommitCallbacks(execute=True):
+            get_label_index().resolve({"Onderwijs": LabelType.TOPIC})
+
+        # Act / Assert
+        with self.assertNumQueries(1):
+            # Only the check that the label still exists
+            labels = get_label_index().resolve({"onderwijs": LabelType.TOPIC})
+        self.assertEqual(labels["onderwijs"].name, "Onderwijs")
+
+    def test_label_index_resolves_labels_deleted_by_another_process(self):
+        # Arrange
+        with self.captureOnCommitCallbacks(execute=True):
+            deleted_label = get_label_index().resolve({"Onderwijs": LabelType.TOPIC})["onderwijs"]
+        # Deleting without signals, as another process would
+        Label.objects.filter(id=deleted_label.id)._raw_delete(Label.objects.db)
+
+        # Act
+        save_labels(self.story, [{"name": "Onderwijs", "confidence": 0.9}], LabelType.TOPIC)
+
+        # Assert
+        label = self.story.labels.get()
+        self.assertEqual(label.normalizedName, "onderwijs")
+        self.assertNotEqual(label.id, deleted_label.id)
+
+
+# Tests for story_evaluation/label_similarity.py
+class LabelSimilarityTestCase(TestCase):
+    def setUp(self):
+        get_label_index().clear()
+        get_label_similarity_index().clear()
+
+    def test_canonical_form_strips_location_qualifiers(self):
+        self.assertEqual(canonical_form("Gemeente Tilburg", LabelType.LOCATION), "tilburg")
+        self.assertEqual(canonical_form("Tilburg centrum", LabelType.LOCATION), "tilburg")
+        self.assertEqual(canonical_form("Wet- en regelgeving", LabelType.TOPIC), "wet en regelgeving")
+
+    def test_find_duplicate_labels(self):
+        # Arrange
+        labels = [Label(id=1, name="Tilburg", type=LabelType.LOCATION), Label(id=2, name="Gemeente Tilburg", type=LabelType.LOCATION),
+                  Label(id=3, name="Zwolle", type=LabelType.LOCATION), Label(id=4, name="Onderwijs", type=LabelType.TOPIC),
+                  Label(id=5, name="A1", type=LabelType.LOCATION), Label(id=6, name="A2", type=LabelType.LOCATION)]
+
+        # Act
+        duplicates = find_duplicate_labels(labels, threshold=0.85)
+
+        # Assert
+        self.assertEqual(duplicates, {2: 1})
+
+    def test_save_labels_maps_near_duplicates_onto_existing_label(self):
+        # Arrange
+        story = Story.objects.create(title="Story", summary="Summary", url="https://example.com/story")
+        label = Label.objects.create(name="Tilburg", type=LabelType.LOCATION)
+
+        # Act
+        save_labels(story, [{"name": "Tilburg centrum", "confidence": 0.8}], LabelType.LOCATION)
+
+        # Assert
+        self.assertEqual(list(story.labels.all()), [label])
+        self.assertEqual(Label.objects.count(), 1)
+
+    def test_merge_duplicate_labels_moves_stories(self):
+        # Arrange
+        stories = [Story.objects.create(title=f"Story {i}", summary="Summary", url=f"https://example.com/{i}") for i in range(3)]
+        tilburg = Label.objects.create(name="Tilburg", type=LabelType.LOCATION)
+        gemeente_tilburg = Label.objects.create(name="Gemeente Tilburg", type=LabelType.LOCATION)
+        tilburg_centrum = Label.objects.create(name="Tilburg centrum", type=LabelType.LOCATION)
+        StoryLabel.objects.create(story=stories[0], label=tilburg)
+        StoryLabel.objects.create(story=stories[1], label=tilburg)
+        StoryLabel.objects.create(story=stories[0], label=gemeente_tilburg)
+        StoryLabel.objects.create(story=stories[2], label=gemeente_tilburg)
+        StoryLabel.objects.create(story=stories[2], label=tilburg_centrum)
+
+        # Act
+        duplicates = merge_duplicate_labels(threshold=0.85)
+
+        # Assert
+        self.assertEqual(duplicates, {gemeente_tilburg.id: tilburg.id, tilburg_centrum.id: tilburg.id})
+        self.assertEqual(list(Label.objects.all()), [tilburg])
+        self.assertEqual(sorted(StoryLabel.objects.values_list('story_id', flat=True)), sorted(story.id for story in stories))
+
+
+# Tests for story_evaluation/gazetteer.py
+class GazetteerTestCase(TestCase):
+    def setUp(self):
+        self.gazetteer = Gazetteer({
+            'Bergen op Zoom': ('Bergen op Zoom', False),
+            'Bergen': ('Bergen', False),
+            'Den Bosch': ("'s-Hertogenbosch", False),
+            "'s-Hertogenbosch": ("'s-Hertogenbosch", False),
+            'Best': ('Best', True),
+            'Tilburg': ('Tilburg', False),
+        })
+
+    def test_aho_corasick_finds_overlapping_patterns(self):
+        # Arrange
+        automaton = AhoCorasick()
+        for pattern in ('he', 'she', 'his', 'hers'):
+            automaton.add(pattern, pattern)
+        automaton.build()
+
+        # Act
+        matches = sorted(automaton.iter_matches('ushers'))
+
+        # Assert
+        self.assertEqual(matches, [(1, 4, 'she'), (2, 4, 'he'), (2, 6, 'hers')])
+
+    def test_tag_prefers_longest_names_and_resolves_aliases(self):
+        # Act
+        labels, ambiguous = self.gazetteer.tag("De markt in Bergen op Zoom trok bezoekers uit Den Bosch en Tilburg. "
+                                               "Ook in Den Bosch was het druk.", title="Markt in Bergen op Zoom")
+
+        # Assert
+        self.assertFalse(ambiguous)
+        self.assertEqual({label['name']: label['confidence'] for label in labels},
+                         {"'s-Hertogenbosch": 0.7, 'Bergen op Zoom': 0.8, 'Tilburg': 0.6})
+
+    def test_tag_skips_words_and_flags_ambiguous_names(self):
+        # Act
+        labels, ambiguous = self.gazetteer.tag("Het beste plan komt uit Best. Best is het om te wachten. "
+                                               "De tilburgse wijk is bekend.")
+
+        # Assert
+        self.assertEqual([label['name'] for label in labels], ['Best'])
+        self.assertTrue(ambiguous)
+
+    @patch('story_evaluation.story_labels.collect_labels_for_story')
+    def test_collect_locations_for_story_uses_gazetteer(self, mock_collect_labels_for_story):
+        # Arrange
+        clear_gazetteer()
+        Source.objects.create(name='Source', municipality='Oisterwijk')
+        story = Story(title="Nieuw park", summary="Oisterwijk krijgt een park.", story="Het park in Oisterwijk opent in mei.")
+
+        # Act
+        labels = collect_locations_for_story(story)
+
+        # Assert
+        self.assertEqual(labels, [{'name': 'Oisterwijk', 'confidence': 0.7}])
+        mock_collect_labels_for_story.assert_not_called()
+        clear_gazetteer()
+
+    @patch('story_evaluation.story_labels.collect_labels_for_story')
+    def test_collect_locations_for_story_asks_openai_when_only_areas_are_found(self, mock_collect_labels_for_story):
+        # Arrange
+        clear_gazetteer()
+        mock_collect_labels_for_story.return_value = [{'name': 'Nederland', 'confidence': 0.5},
+                                                      {'name': 'Giethoorn', 'confidence': 0.9}]
+        story = Story(title="Drukte", summary="Toeristen uit heel Nederland bezoeken Giethoorn.",
+                      story="Het dorp Giethoorn is in Nederland erg populair.")
+
+        # Act
+        labels = collect_locations_for_story(story)
+
+        # Assert
+        self.assertEqual(labels, [{'name': 'Nederland', 'confidence': 0.7}, {'name': 'Giethoorn', 'confidence': 0.9}])
+        mock_collect_labels_for_story.assert_called_once()
+        clear_gazetteer()
+
+    def test_read_gazetteer_file_marks_areas(self):
+        # Act
+        entries, areas = read_gazetteer_file()
+
+        # Assert
+        self.assertEqual(entries['Brabant'], ('Noord-Brabant', False))
+        self.assertEqual(entries['Best'], ('Best', True))
+        self.assertIn('Noord-Brabant', areas)
+        self.assertIn('Nederland', areas)
+        self.assertNotIn('Tilburg', areas)
+
+    @patch('story_evaluation.story_labels.collect_labels_for_story')
+    def test_collect_locations_for_story_falls_back_to_openai(self, mock_collect_labels_for_story):
+        # Arrange
+        mock_collect_labels_for_story.return_value = [{'name': 'Ergens', 'confidence': 0.5}]
+        story = Story(title="Nieuws", summary="Er is iets gebeurd.", story="Niemand weet waar.")
+
+        # Act
+        labels = collect_locations_for_story(story)
+
+        # Assert
+        self.assertEqual(labels, [{'name': 'Ergens', 'confidence': 0.5}])
+        mock_collect_labels_for_story.assert_called_once()
+
+
+# Tests for batched classification in story_evaluation/story_labels.py
+class ClassifyStoriesTestCase(TransactionTestCase):
+    def setUp(self):
+        self.stories = [Story.objects.create(title=f"Story {i}", summary="Summary", story="Story", url=f"https://example.com/{i}")
+                        for i in range(3)]
+
+    @patch('story_evaluation.story_labels.process_content_with_openai')
+    def test_collect_labels_for_stories_splits_response_per_story(self, mock_process_content_with_openai):
+        # Arrange
+        mock_process_content_with_openai.return_value = json.dumps({"stories": [
+            {"id": self.stories[0].id, "topics": [{"name": "Onderwijs", "confidence": 0.9}], "locations": []},
+            {"id": str(self.stories[1].id), "topics": [], "locations": [{"name": "Zwolle", "confidence": 0.8}]},
+            {"id": 999999, "topics": [], "locations": []},
+        ]})
+
+        # Act
+        labels_per_story = collect_labels_for_stories(self.stories)
+
+        # Assert
+        self.assertEqual(set(labels_per_story), {self.stories[0].id, self.stories[1].id})
+        self.assertEqual(labels_per_story[self.stories[1].id]['locations'][0]['name'], "Zwolle")
+        self.assertIn(f"Id: {self.stories[2].id}", mock_process_content_with_openai.call_args.args[1])
+
+    @patch('news_hyperlocalizer.threads.connection')
+    @patch('story_evaluation.story_labels.get_openai_rate_limiter')
+    @patch('story_evaluation.story_labels.classify_story')
+    @patch('story_evaluation.story_labels.process_content_with_openai')
+    def test_classify_stories_saves_labels_and_falls_back_per_story(self, mock_process_content_with_openai, mock_classify_story, mock_get_openai_rate_limiter, mock_connection):
+        # Arrange
+        mock_process_content_with_openai.return_value = json.dumps({"stories": [
+            {"id": self.stories[0].id, "topics": [{"name": "Onderwijs", "confidence": 0.9}],
+             "locations": [{"name": "Zwolle", "confidence": 0.8}]},
+            {"id": self.stories[1].id, "topics": [], "locations": []},
+        ]})
+
+        # Act
+        result = classify_stories(self.stories, batch_size=3, max_workers=1)
+
+        # Assert
+        self.assertEqual(result, 3)
+        mock_process_content_with_openai.assert_called_once()
+        mock_classify_story.assert_called_once_with(self.stories[2])
+        self.assertEqual(set(self.stories[0].labels.values_list('name', flat=True)), {"Onderwijs", "Zwolle"})
+
+    @patch('news_hyperlocalizer.threads.connection')
+    @patch('story_evaluation.story_labels.get_openai_rate_limiter')
+    @patch('story_evaluation.story_labels.classify_story')
+    @patch('story_evaluation.story_labels.process_content_with_openai')
+    def test_classify_stories_falls_back_on_invalid_json(self, mock_process_content_with_openai, mock_classify_story, mock_get_openai_rate_limiter, mock_connection):
+        # Arrange
+        mock_process_content_with_openai.return_value = 'Invalid JSON'
+
+        # Act
+        classify_stories(self.stories, batch_size=2, max_workers=1)
+
+        # Assert
+        self.assertEqual(mock_process_content_with_openai.call_count, 2)
+        self.assertEqual(mock_classify_story.call_count, 3)
+
+
+# Tests for story_evaluation/bulk_evaluation.py
+class BulkEvaluationTestCase(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.stories = [Story.objects.create(title=f"Story {i}", summary="Summary", story=f"Story {i} in Zwolle", url=f"https://example.com/{i}")
+                        for i in range(2)]
+
+    def respond_with_labels(self, body):
+        story_id = int(re.search(r'Id: (\d+)', body['messages'][-1]['content']).group(1))
+        if story_id == self.stories[1].id:
+            return 'Invalid JSON'
+        return json.dumps({"stories": [{"id": story_id, "topics": [{"name": "Onderwijs", "confidence": 0.9}],
+                                        "locations": [{"name": "Zwolle", "confidence": 0.8}]}]})
+
+    def test_run_bulk_evaluation_applies_labels(self):
+        # Arrange
+        backend = LocalBatchBackend(directory=self.directory.name, responder=self.respond_with_labels)
+
+        # Act
+        with self.settings(BATCH_WORK_DIR=self.directory.name):
+            result = run_bulk_evaluation('labels', Story.objects.all(), backend=backend, poll_interval=0)
+
+        # Assert
+        self.assertEqual(result, {'applied': 1, 'failed': 1})
+        self.assertEqual(set(self.stories[0].labels.values_list('name', flat=True)), {"Onderwijs", "Zwolle"})
+        self.assertFalse(self.stories[1].labels.exists())
+
+    def test_run_bulk_evaluation_applies_summaries(self):
+        # Arrange
+        backend = LocalBatchBackend(directory=self.directory.name,
+                                    responder=lambda body: json.dumps({"summary": "Nieuwe samenvatting"}))
+
+        # Act
+        with self.settings(BATCH_WORK_DIR=self.directory.name):
+            result = run_bulk_evaluation('summaries', Story.objects.all(), backend=backend, poll_interval=0)
+
+        # Assert
+        self.assertEqual(result, {'applied': 2, 'failed': 0})
+        self.assertEqual(set(Story.objects.values_list('summary', flat=True)), {"Nieuwe samenvatting"})
+
+    @patch('story_evaluation.bulk_evaluation.invalidate_cache')
+    def test_apply_batch_results_reads_each_chunk_once(self, mock_invalidate_cache):
+        # Arrange
+        results = [(f'summary-{story.id}', json.dumps({"summary": "Nieuwe samenvatting"}), None) for story in self.stories]
+
+        # Act / Assert
+        # The stories, and per story the summary update and the search index delete and insert
+        with self.assertNumQueries(1 + 3 * len(self.stories)):
+            result = apply_batch_results(results, apply_summary_result)
+        self.assertEqual(result, (2, 0, []))
+        mock_invalidate_cache.assert_called_once()
+
+    def test_run_bulk_evaluation_reads_stories_in_chunks(self):
+        # Arrange
+        backend = LocalBatchBackend(directory=self.directory.name,
+                                    responder=lambda body: json.dumps({"summary": "Nieuwe samenvatting"}))
+
+        # Act
+        with self.settings(BATCH_WORK_DIR=self.directory.name):
+            result = run_bulk_evaluation('summaries', Story.objects.all(), backend=backend, limit=1, chunk_size=1,
+                                         poll_interval=0)
+
+        # Assert
+        self.assertEqual(result, {'applied': 1, 'failed': 0})
+        self.assertEqual(Story.objects.get(id=self.stories[0].id).summary, "Nieuwe samenvatting")
+        self.assertEqual(Story.objects.get(id=self.stories[1].id).summary, "Summary")
+
+    def test_run_bulk_evaluation_resubmits_expired_requests(self):
+        # Arrange
+        def write_results(batch_id, path):
+            lines = []
+            for request in submitted[batch_id]:
+                if batch_id == 'batch_1' and request['custom_id'] == f'summary-{self.stories[1].id}':
+                    lines.append({'custom_id': request['custom_id'], 'response': None,
+                                  'error': {'code': 'batch_expired', 'message': 'Expired'}})
+                else:
+                    lines.append({'custom_id': request['custom_id'], 'error': None, 'response': {
+                        'status_code': 200, 'body': {'choices': [{'message': {'content': '{"summary": "Nieuw"}'}}]}}})
+            Path(path).write_text('\n'.join(json.dumps(line) for line in lines))
+
+        submitted = {}
+
+        def submit(path):
+            batch_id = f'batch_{len(submitted) + 1}'
+            submitted[batch_id] = [json.loads(line) for line in Path(path).read_text().splitlines() if line]
+            return batch_id
+
+        backend = MagicMock()
+        backend.submit.side_effect = submit
+        backend.status.side_effect = ['expired', 'completed']
+        backend.download_results.side_effect = write_results
+
+        # Act
+        with self.settings(BATCH_WORK_DIR=self.directory.name):
+            result = run_bulk_evaluation('summaries', Story.objects.all(), backend=backend, poll_interval=0)
+
+        # Assert
+        self.assertEqual(result, {'applied': 2, 'failed': 0})
+        self.assertEqual(backend.submit.call_count, 2)
+        self.assertEqual([request['custom_id'] for request in submitted['batch_2']], [f'summary-{self.stories[1].id}'])
+        self.assertEqual(set(Story.objects.values_list('summary', flat=True)), {"Nieuw"})
+
+    def test_run_bulk_evaluation_reports_a_timed_out_batch_as_failed(self):
+        # Arrange
+        backend = MagicMock()
+        backend.submit.return_value = 'batch_1'
+        backend.status.return_value = 'in_progress'
+
+        # Act
+        with self.settings(BATCH_WORK_DIR=self.directory.name):
+            result = run_bulk_evaluation('summaries', Story.objects.all(), backend=backend, poll_interval=0,
+                                         timeout=0)
+
+        # Assert
+        self.assertEqual(result, {'applied': 0, 'failed': 2})
+        backend.cancel.assert_called_once_with('batch_1')
+        backend.download_results.assert_not_called()
+
+
+# Tests for the evaluation stages in story_evaluation/evaluation.py
+@patch.dict(os.environ, {'SMARTOCTO_API_KEY': ''})
+@patch('django.conf.settings.LOCATION_TAGGER_ENABLED', False)
+@patch('story_evaluation.story_labels.process_content_with_openai')
+class EvaluateStoryTestCase(TestCase):
+    def setUp(self):
+        self.story = Story.objects.create(title="Story", summary="Summary", story="Story in Zwolle", url="https://example.com/story")
+
+    def respond_with_labels(self, setup_prompt, content, answer_format, json_schema):
+        return json.dumps({"items": [{"name": "Zwolle" if 'locations' in setup_prompt else "Onderwijs", "confidence": 0.9}]})
+
+    def test_evaluate_story_runs_all_stages_once(self, mock_process_content_with_openai):
+        # Arrange
+        mock_process_content_with_openai.side_effect = self.respond_with_labels
+
+        # Act
+        first_results = evaluate_story(self.story)
+        second_results = evaluate_story(self.story)
+
+        # Assert
+        self.assertEqual(first_results, {stage: EvaluationStageStatus.DONE for stage in EvaluationStage.values})
+        self.assertEqual(second_results, {stage: None for stage in EvaluationStage.values})
+        self.assertEqual(mock_process_content_with_openai.call_count, 2)
+        self.assertEqual(set(self.story.labels.values_list('name', flat=True)), {"Onderwijs", "Zwolle"})
+        self.story.refresh_from_db()
+        self.assertEqual(self.story.needsStatus, NeedsStatus.EVALUATED)
+
+    def test_evaluate_story_reruns_changed_and_failed_stages(self, mock_process_content_with_openai):
+        # Arrange
+        mock_process_content_with_openai.side_effect = self.respond_with_labels
+        mock_client = MagicMock()
+        mock_client.analyze.side_effect = UserNeedsError("Service unavailable", 503)
+        with patch('story_evaluation.story_userneeds.get_smartocto_client', return_value=mock_client):
+            evaluate_story(self.story)
+        self.story.title = "Changed story"
+
+        # Act
+        results = evaluate_story(self.story)
+
+        # Assert
+        self.assertEqual(results, {EvaluationStage.USERNEEDS: EvaluationStageStatus.DONE,
+                                   EvaluationStage.TOPICS: EvaluationStageStatus.DONE,
+                                   EvaluationStage.LOCATIONS: EvaluationStageStatus.DONE})
+        self.assertEqual(mock_process_content_with_openai.call_count, 4)
+        self.assertFalse(UserNeedsFailure.objects.exists())
+        self.assertEqual(StoryEvaluationStage.objects.filter(story=self.story).count(), 3)
+
+    def test_evaluate_story_records_failed_stage(self, mock_process_content_with_openai):
+        # Arrange
+        mock_process_content_with_openai.side_effect = self.respond_with_labels
+        mock_client = MagicMock()
+        mock_client.analyze.side_effect = UserNeedsError("Service unavailable", 503)
+
+        # Act
+        with patch('story_evaluation.story_userneeds.get_smartocto_client', return_value=mock_client):
+            results = evaluate_story(self.story)
+        failed_stage = StoryEvaluationStage.objects.get(story=self.story, stage=EvaluationStage.USERNEEDS)
+        retry_results = evaluate_story(self.story, stages=[EvaluationStage.USERNEEDS, EvaluationStage.TOPICS])
+
+        # Assert
+        self.assertEqual(results[EvaluationStage.USERNEEDS], EvaluationStageStatus.FAILED)
+        self.assertEqual(failed_stage.error, "Service unavailable")
+        self.assertEqual(retry_results, {EvaluationStage.USERNEEDS: EvaluationStageStatus.DONE, EvaluationStage.TOPICS: None})
+
+    def test_evaluate_story_reruns_stage_after_failed_request(self, mock_process_content_with_openai):
+        # Arrange
+        mock_process_content_with_openai.return_value = None
+
+        # Act
+        results = evaluate_story(self.story, stages=[EvaluationStage.TOPICS])
+        mock_process_content_with_openai.side_effect = self.respond_with_labels
+        retry_results = evaluate_story(self.story, stages=[EvaluationStage.TOPICS])
+
+        # Assert
+        self.assertEqual(results, {EvaluationStage.TOPICS: EvaluationStageStatus.FAILED})
+        self.assertEqual(retry_results, {EvaluationStage.TOPICS: EvaluationStageStatus.DONE})
+        self.assertEqual(set(self.story.labels.values_list('name', flat=True)), {"Onderwijs"})
 
 
 if __name__ == '__main__':